@@ -0,0 +1,97 @@
+"""
+Vectorized evaluation of many positions at once with NumPy.
+
+The positions are packed into an array of shape (N, 12, 64) with one plane per color and piece type, and scored
+with one matrix product against the packed middlegame and endgame weights of `evaluation.py`. The two scores
+are then blended by the game phase, as in `evaluation.material_and_placement`.
+"""
+from __future__ import annotations
+import chess
+import numpy as np
+import numpy.typing as npt
+from collections.abc import Iterable
+from evaluation import MAX_PHASE, PHASE_WEIGHTS, PIECE_SQUARE_SCORES, SCORE_PAIR_HALF, SCORE_PAIR_MASK, SCORE_PAIR_SHIFT
+
+PLANES = 12
+
+# The plane of a piece is `PLANE_OFFSETS[color] + piece_type - 1`: white pawn to king, then black pawn to king.
+PLANE_OFFSETS = {chess.WHITE: 0, chess.BLACK: 6}
+
+# The packed middlegame and endgame scores of a piece on each square of each plane, from white's point of view.
+WEIGHTS = np.array([PIECE_SQUARE_SCORES[color][piece_type]
+                    for color in (chess.WHITE, chess.BLACK) for piece_type in chess.PIECE_TYPES], dtype=np.int64)
+
+# The game phase weight of the piece of each plane.
+PLANE_PHASE_WEIGHTS = np.array(PHASE_WEIGHTS[1:] * 2, dtype=np.int64)
+
+
+def bitboards(board: chess.Board) -> list[int]:
+    """Get the 12 piece bitboards of `board` in plane order."""
+    black, white = board.occupied_co
+    pieces = [board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings]
+    return [mask & white for mask in pieces] + [mask & black for mask in pieces]
+
+
+def pack(boards: Iterable[chess.Board]) -> npt.NDArray[np.uint8]:
+    """
+    Pack positions into piece planes.
+
+    :param boards: The positions.
+    :return: An array of shape (N, 12, 64). `planes[n, plane, square]` is 1 if that square of board `n` has the piece
+        of that plane.
+    """
+    return unpack([bitboards(board) for board in boards])
+
+
+def unpack(masks: list[list[int]]) -> npt.NDArray[np.uint8]:
+    """Turn lists of 12 bitboards from `bitboards` into piece planes of shape (N, 12, 64)."""
+    array = np.array(masks, dtype="<u8").reshape(-1, PLANES)
+    # Little-endian bytes with little-endian bit order put square 0 first.
+    bits = np.unpackbits(array.view(np.uint8), bitorder="little")
+    return bits.reshape(-1, PLANES, 64)
+
+
+def score_planes(planes: npt.NDArray[np.uint8]) -> npt.NDArray[np.int64]:
+    """
+    Score packed positions.
+
+    :param planes: Piece planes from `pack`, of shape (N, 12, 64).
+    :return: The material and placement score of each position from white's point of view.
+    """
+    flat = planes.reshape(len(planes), PLANES * 64).astype(np.int64)
+    pairs = flat @ WEIGHTS.reshape(PLANES * 64)
+    phases = np.minimum(planes.sum(axis=2, dtype=np.int64) @ PLANE_PHASE_WEIGHTS, MAX_PHASE)
+
+    # The same unpacking and blending as `evaluation.taper`, rounded towards zero.
+    middlegame = ((pairs + SCORE_PAIR_HALF) & SCORE_PAIR_MASK) - SCORE_PAIR_HALF
+    endgame = (pairs - middlegame) >> SCORE_PAIR_SHIFT
+    blended = middlegame * phases + endgame * (MAX_PHASE - phases)
+    scores: npt.NDArray[np.int64] = np.sign(blended) * (np.abs(blended) // MAX_PHASE)
+    return scores
+
+
+def evaluate_batch(boards: Iterable[chess.Board]) -> npt.NDArray[np.int64]:
+    """
+    Score many positions at once. Gives the same scores as calling `evaluation.material_and_placement` on each one.
+
+    :param boards: The positions.
+    :return: The score of each position from white's point of view.
+    """
+    return score_planes(pack(boards))
+
+
+def score_moves(board: chess.Board, moves: list[chess.Move]) -> npt.NDArray[np.int64]:
+    """
+    Score the positions after each of `moves`.
+
+    :param board: The current position. It is left unchanged.
+    :param moves: Legal moves in `board`.
+    :return: The material and placement score after each move from the point of view of the side to move in `board`.
+    """
+    children = []
+    for move in moves:
+        board.push(move)
+        children.append(bitboards(board))
+        board.pop()
+    scores = score_planes(unpack(children))
+    return scores if board.turn == chess.WHITE else -scores
@@ -0,0 +1,219 @@
+"""
+Measure the speed of the homemade engine: move generation (perft), fixed-depth search and evaluation.
+
+Perft and the evaluation benchmark use the `SearchBoard` and `Search.evaluate` that the search runs on.
+
+The results are written to a JSON file, so runs on different commits can be compared on the same machine.
+Usage: `python benchmark.py -o before.json`, then after a change `python benchmark.py -o after.json --compare before.json`.
+"""
+from __future__ import annotations
+import argparse
+import chess
+import chess.engine
+import datetime
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+from collections.abc import Callable
+from batch_evaluation import evaluate_batch
+from search import Search
+from search_board import SearchBoard
+from transposition import TranspositionTable
+from typing import Any, NamedTuple, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class PerftPosition(NamedTuple):
+    """A position with known perft results."""
+
+    name: str
+    fen: str
+    nodes: list[int]
+    """The number of leaf nodes at depth 1, 2, 3, ..."""
+
+
+# The standard perft test positions (https://www.chessprogramming.org/Perft_Results).
+PERFT_POSITIONS = [
+    PerftPosition("start", chess.STARTING_FEN, [20, 400, 8902, 197281, 4865609]),
+    PerftPosition("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                  [48, 2039, 97862, 4085603]),
+    PerftPosition("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    PerftPosition("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                  [6, 264, 9467, 422333]),
+    PerftPosition("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+]
+
+# The perft depth of each position, chosen so that each one takes a few seconds.
+PERFT_DEPTHS = {"start": 4, "kiwipete": 3, "position 3": 4, "position 4": 3, "position 5": 3}
+
+# Opening, middlegame and endgame positions for the search and evaluation benchmarks.
+SEARCH_POSITIONS = [
+    chess.STARTING_FEN,
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+    "rnbqkb1r/pp1p1ppp/4pn2/2p5/2PP4/2N5/PP2PPPP/R1BQKBNR w KQkq - 0 4",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP1BBPPP/R2QK2R w KQ - 2 8",
+    "2r2rk1/pp1bqppp/2n1pn2/3p4/3P4/P1NBPN2/1PQ2PPP/R4RK1 b - - 4 14",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "8/5k2/3p4/1p1Pp2p/pP2Pp1P/P4P1K/8/8 b - - 0 50",
+]
+
+BATCH_SIZE = 1000
+
+
+def perft(board: SearchBoard, depth: int) -> int:
+    """Count the leaf nodes of the legal move tree of `board` to `depth` plies."""
+    nodes = 0
+    for move in board.generate_moves():
+        if board.make(move):
+            nodes += perft(board, depth - 1) if depth > 1 else 1
+            board.unmake()
+    return nodes
+
+
+def benchmark_perft(depth_reduction: int) -> list[dict[str, Any]]:
+    """
+    Run perft on the standard positions and check the node counts.
+
+    :param depth_reduction: How many plies less than `PERFT_DEPTHS` to search.
+    :return: The depth, node count, time and nodes per second of each position.
+    """
+    results = []
+    for position in PERFT_POSITIONS:
+        depth = max(1, PERFT_DEPTHS[position.name] - depth_reduction)
+        start = time.perf_counter()
+        nodes = perft(SearchBoard(chess.Board(position.fen)), depth)
+        elapsed = time.perf_counter() - start
+        correct = nodes == position.nodes[depth - 1]
+        if not correct:
+            logger.error(f"Perft of {position.name} at depth {depth} is {nodes} instead of {position.nodes[depth - 1]}.")
+        logger.info(f"perft {position.name:<12} depth {depth}: {nodes:>9} nodes {elapsed:7.2f}s {nodes / elapsed:>9.0f} nps")
+        results.append({"name": position.name, "depth": depth, "nodes": nodes, "correct": correct,
+                        "seconds": elapsed, "nps": nodes / elapsed})
+    return results
+
+
+def benchmark_search(depth: int, hash_mb: float) -> list[dict[str, Any]]:
+    """
+    Search each of `SEARCH_POSITIONS` to a fixed depth with an empty transposition table.
+
+    :return: The move, score, node count, time and nodes per second of each position.
+    """
+    results = []
+    for fen in SEARCH_POSITIONS:
+        searcher = Search(TranspositionTable(hash_mb))
+        start = time.perf_counter()
+        result = searcher.run(chess.Board(fen), chess.engine.Limit(depth=depth))
+        elapsed = time.perf_counter() - start
+        score = result.info["score"].white() if "score" in result.info else None
+        logger.info(f"search depth {depth}: {str(result.move):<5} {str(score):>6} {searcher.nodes:>9} nodes {elapsed:7.2f}s "
+                    f"{searcher.nodes / elapsed:>7.0f} nps  {fen}")
+        results.append({"fen": fen, "depth": depth, "move": str(result.move), "score": str(score),
+                        "nodes": searcher.nodes, "seconds": elapsed, "nps": searcher.nodes / elapsed})
+    return results
+
+
+def calls_per_second(function: Callable[[T], Any], arguments: list[T], seconds: float) -> float:
+    """Call `function` on all the `arguments` again and again for about `seconds` and return the calls per second."""
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < seconds:
+        for argument in arguments:
+            function(argument)
+        calls += len(arguments)
+        elapsed = time.perf_counter() - start
+    return calls / elapsed
+
+
+def benchmark_evaluation(seconds: float) -> dict[str, float]:
+    """
+    Measure the positions per second of the evaluation functions on `SEARCH_POSITIONS`.
+
+    `Search.evaluate` finds the pawn structure of the positions in its pawn table after the first calls, as it
+    mostly does in a search.
+    """
+    boards = [chess.Board(fen) for fen in SEARCH_POSITIONS]
+    results = {}
+    searcher = Search(TranspositionTable(1))
+    results["Search.evaluate"] = calls_per_second(searcher.evaluate, [SearchBoard(board) for board in boards], seconds)
+    logger.info(f"Search.evaluate: {results['Search.evaluate']:.0f} calls/s")
+
+    # evaluate_batch orders the root moves. It is timed on batches of BATCH_SIZE positions and reported per position.
+    batch = boards * (BATCH_SIZE // len(boards))
+    results["evaluate_batch"] = calls_per_second(evaluate_batch, [batch], seconds) * len(batch)
+    logger.info(f"evaluate_batch: {results['evaluate_batch']:.0f} positions/s in batches of {len(batch)}")
+    return results
+
+
+def git_commit() -> Optional[str]:
+    """Get the hash of the checked out commit, if this is a git repository."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summary(results: dict[str, Any]) -> dict[str, float]:
+    """Get the headline numbers of a benchmark run."""
+    search_nodes = sum(result["nodes"] for result in results["search"])
+    search_seconds = sum(result["seconds"] for result in results["search"])
+    perft_nodes = sum(result["nodes"] for result in results["perft"])
+    perft_seconds = sum(result["seconds"] for result in results["perft"])
+    return {"perft nps": perft_nodes / perft_seconds,
+            "search nodes": search_nodes,
+            "search nps": search_nodes / search_seconds,
+            "search seconds": search_seconds,
+            **{f"{name} calls/s": calls for name, calls in results["evaluation"].items()}}
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any]) -> None:
+    """Log the headline numbers of `results` next to those of an earlier run."""
+    logger.info(f"Compared to commit {baseline.get('commit')}:")
+    old = summary(baseline)
+    for name, value in summary(results).items():
+        if name in old and old[name]:
+            logger.info(f"{name:>30}: {old[name]:>12.1f} -> {value:>12.1f} ({(value / old[name] - 1) * 100:+.1f}%)")
+
+
+def main() -> None:
+    """Run the benchmarks and write the results to a JSON file."""
+    parser = argparse.ArgumentParser(description="Benchmark the homemade engine")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="The JSON file to write the results to.")
+    parser.add_argument("--compare", help="A JSON file from an earlier run to compare the results with.")
+    parser.add_argument("--depth", type=int, default=5, help="The depth of the search benchmark.")
+    parser.add_argument("--hash", type=float, default=64, help="The transposition table size in megabytes.")
+    parser.add_argument("--eval-seconds", type=float, default=1.0, help="How long to run each evaluation benchmark.")
+    parser.add_argument("--quick", action="store_true", help="Run perft one ply shallower.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    results: dict[str, Any] = {"commit": git_commit(),
+                               "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                               "python": platform.python_version(),
+                               "platform": platform.platform(),
+                               "processor": platform.processor(),
+                               "chess": chess.__version__,
+                               "perft": benchmark_perft(1 if args.quick else 0),
+                               "search": benchmark_search(args.depth, args.hash),
+                               "evaluation": benchmark_evaluation(args.eval_seconds)}
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    logger.info(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+
+    if not all(result["correct"] for result in results["perft"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Build the opening cache of the homemade engine from the bot's own games.
+
+The positions of the first plies of the games in `pgn_directory` are counted, and the most frequent ones are searched
+deeply by the homemade search. Usage: `python build_opening_cache.py --pgn-directory game_records -o opening_cache.bin`,
+then set `OpeningCache: "opening_cache.bin"` in `homemade_options`.
+"""
+from __future__ import annotations
+import argparse
+import chess
+import chess.engine
+import chess.pgn
+import chess.polyglot
+import logging
+import os
+import time
+from collections import Counter
+from collections.abc import Iterator
+from opening_cache import CachedMove, write_cache
+from search import Search
+from transposition import TranspositionTable
+
+logger = logging.getLogger(__name__)
+
+
+def pgn_files(pgn_directory: str) -> list[str]:
+    """Get the paths of the PGN files in a directory."""
+    return [os.path.join(pgn_directory, file_name) for file_name in sorted(os.listdir(pgn_directory))
+            if file_name.endswith(".pgn")]
+
+
+def read_file_games(path: str) -> Iterator[chess.pgn.Game]:
+    """Read the standard chess games from the start position in a PGN file."""
+    with open(path, encoding="utf-8", errors="replace") as file:
+        while (game := chess.pgn.read_game(file)) is not None:
+            if game.headers.get("Variant", "Standard") == "Standard" and "FEN" not in game.headers:
+                yield game
+
+
+def read_games(pgn_directory: str) -> Iterator[chess.pgn.Game]:
+    """Read all the standard chess games from the start position in the PGN files of a directory."""
+    for path in pgn_files(pgn_directory):
+        yield from read_file_games(path)
+
+
+def count_positions(games: Iterator[chess.pgn.Game], plies: int) -> tuple[Counter[int], dict[int, chess.Board]]:
+    """
+    Count how often each position occurs in the first plies of the games.
+
+    :param games: The games.
+    :param plies: Only the positions before the first `plies` moves of each game are counted.
+    :return: The number of games each position (by Zobrist hash) occurs in, and one board for each position.
+    """
+    counts: Counter[int] = Counter()
+    boards: dict[int, chess.Board] = {}
+    for game in games:
+        board = game.board()
+        seen = set()
+        for move in list(game.mainline_moves())[:plies]:
+            key = chess.polyglot.zobrist_hash(board)
+            if key not in seen:
+                seen.add(key)
+                counts[key] += 1
+                boards.setdefault(key, board.copy())
+            board.push(move)
+    return counts, boards
+
+
+def search_positions(positions: list[tuple[int, chess.Board]], limit: chess.engine.Limit,
+                     hash_mb: float) -> Iterator[tuple[int, CachedMove]]:
+    """
+    Search positions with the homemade search.
+
+    :param positions: The Zobrist hash and the board of each position.
+    :param limit: The limit of each search.
+    :param hash_mb: The transposition table size in megabytes. The table is kept from one position to the next.
+    :return: The hash and the best move, score and depth of each position that has a move and no forced mate.
+    """
+    searcher = Search(TranspositionTable(hash_mb))
+    for number, (key, board) in enumerate(positions, 1):
+        start = time.perf_counter()
+        result = searcher.run(board, limit)
+        score = result.info["score"].relative.score() if "score" in result.info else None
+        logger.info(f"{number}/{len(positions)}: {board.fen()} {result.move} {score} depth {result.info.get('depth')} "
+                    f"({time.perf_counter() - start:.1f}s)")
+        # Mate scores are None here. A forced mate in the opening is better found by a new search.
+        if result.move is None or score is None:
+            continue
+        yield key, CachedMove(result.move, score, result.info["depth"])
+
+
+def main() -> None:
+    """Count the positions of the PGN files, search the most frequent ones and write the cache file."""
+    parser = argparse.ArgumentParser(description="Build the opening cache of the homemade engine")
+    parser.add_argument("--pgn-directory", default="game_records", help="The directory of the bot's PGN game records.")
+    parser.add_argument("-o", "--output", default="opening_cache.bin", help="The cache file to write.")
+    parser.add_argument("--plies", type=int, default=10, help="Only the positions of the first plies of each game are used.")
+    parser.add_argument("--min-games", type=int, default=3, help="Only positions that occur in this many games are used.")
+    parser.add_argument("--positions", type=int, default=1000, help="The most positions to search.")
+    parser.add_argument("--depth", type=int, default=7, help="The search depth of each position.")
+    parser.add_argument("--time", type=float, help="The search time (in seconds) of each position, instead of a depth.")
+    parser.add_argument("--hash", type=float, default=256, help="The transposition table size in megabytes.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    counts, boards = count_positions(read_games(args.pgn_directory), args.plies)
+    keys = [key for key, count in counts.most_common(args.positions) if count >= args.min_games]
+    logger.info(f"{len(counts)} positions found, {len(keys)} occur in at least {args.min_games} games.")
+
+    limit = chess.engine.Limit(time=args.time) if args.time else chess.engine.Limit(depth=args.depth)
+    written = write_cache(args.output, search_positions([(key, boards[key]) for key in keys], limit, args.hash))
+    logger.info(f"{written} positions written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Build the opening tree of `polyglot: opening_tree` from the bot's own games.
+
+The PGN files in `pgn_directory` are read one game at a time. The result of each finished game, and the engine
+evaluations that `print_pgn_game_record` stored in the comments, are added to every move of its first plies. Usage:
+`python build_opening_tree.py --pgn-directory game_records -o opening_tree.bin`.
+"""
+from __future__ import annotations
+import argparse
+import chess
+import chess.engine
+import chess.pgn
+import chess.polyglot
+import logging
+import time
+from build_opening_cache import read_games
+from collections.abc import Iterable
+from opening_tree import MoveStatistics, write_tree
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# The half points of the game for white.
+POINTS = {"1-0": 2, "0-1": 0, "1/2-1/2": 1}
+# Evaluations are capped, so that a few mate scores don't swamp the average.
+MAX_EVAL = 2000
+
+
+def move_eval(node: chess.pgn.ChildNode) -> Optional[chess.engine.PovScore]:
+    """
+    Get the evaluation that the bot's engine gave for a move of the main line.
+
+    :param node: The node of the move.
+    :return: The evaluation stored with the move or, if the engine also gave its principal variation, at the end of
+        the variation that starts with the move. None if the move has no evaluation (e.g. it is the opponent's move).
+    """
+    score = node.eval()
+    if score is not None:
+        return score
+    for variation in node.parent.variations[1:]:
+        if variation.move == node.move:
+            return variation.end().eval()
+    return None
+
+
+def add_games(statistics: dict[tuple[int, chess.Move], MoveStatistics], games: Iterable[chess.pgn.Game],
+              plies: int) -> int:
+    """
+    Add the moves of games to the tree.
+
+    :param statistics: The results of each move by the Zobrist hash of its position and the move.
+    :param games: The games. Unfinished games are skipped.
+    :param plies: Only the first `plies` moves of each game are added.
+    :return: The number of games added.
+    """
+    added = 0
+    for game in games:
+        white_points = POINTS.get(game.headers.get("Result", "*"))
+        if white_points is None:
+            continue
+        added += 1
+        board = game.board()
+        for node in game.mainline():
+            if board.ply() >= plies:
+                break
+            move_statistics = statistics.setdefault((chess.polyglot.zobrist_hash(board), node.move), MoveStatistics())
+            move_statistics.games += 1
+            move_statistics.points += white_points if board.turn == chess.WHITE else 2 - white_points
+            score = move_eval(node)
+            if score is not None:
+                value = score.pov(board.turn).score(mate_score=MAX_EVAL)
+                move_statistics.eval_sum += max(-MAX_EVAL, min(value, MAX_EVAL))
+                move_statistics.evals += 1
+            board.push(node.move)
+    return added
+
+
+def main() -> None:
+    """Read the PGN files and write the opening tree."""
+    parser = argparse.ArgumentParser(description="Build an opening tree from the bot's games")
+    parser.add_argument("--pgn-directory", default="game_records", help="The directory of the bot's PGN game records.")
+    parser.add_argument("-o", "--output", default="opening_tree.bin", help="The tree file to write.")
+    parser.add_argument("--plies", type=int, default=20, help="Only the first plies of each game are used.")
+    parser.add_argument("--min-games", type=int, default=2,
+                        help="Only moves played in this many games are written, to keep the file small.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    start = time.perf_counter()
+    statistics: dict[tuple[int, chess.Move], MoveStatistics] = {}
+    games = add_games(statistics, read_games(args.pgn_directory), args.plies)
+    kept = {key: move_statistics for key, move_statistics in statistics.items() if move_statistics.games >= args.min_games}
+    logger.info(f"{games} games read in {time.perf_counter() - start:.1f}s, {len(kept)} of {len(statistics)} moves "
+                f"played in at least {args.min_games} games.")
+    written = write_tree(args.output, kept)
+    logger.info(f"{written} moves written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -184,6 +184,12 @@ def insert_default_values(CONFIG: CONFIG_DICT_TYPE) -> None:
     set_config_default(CONFIG, "engine", "polyglot", key="max_depth", default=8)
     set_config_default(CONFIG, "engine", "polyglot", key="selection", default="weighted_random")
     set_config_default(CONFIG, "engine", "polyglot", key="min_weight", default=1)
+    set_config_default(CONFIG, "engine", "polyglot", key="merge_books", default=False)
+    set_config_default(CONFIG, "engine", "polyglot", "opening_tree", key="enabled", default=False)
+    set_config_default(CONFIG, "engine", "polyglot", "opening_tree", key="file", default="opening_tree.bin")
+    set_config_default(CONFIG, "engine", "polyglot", "opening_tree", key="min_games", default=5)
+    set_config_default(CONFIG, "engine", "polyglot", "opening_tree", key="min_score", default=0.5)
+    set_config_default(CONFIG, "engine", "polyglot", "opening_tree", key="selection", default="best_score")
     set_config_default(CONFIG, "challenge", key="concurrency", default=1)
     set_config_default(CONFIG, "challenge", key="sort_by", default="best")
     set_config_default(CONFIG, "challenge", key="accept_bot", default=False)
@@ -2,9 +2,7 @@
 from __future__ import annotations
 import os
 import chess.engine
-import chess.polyglot
 import chess.syzygy
-import chess.gaviota
 import subprocess
 import logging
 import time
@@ -16,6 +14,10 @@ import config
 import model
 import lichess
 from config import Configuration
+from opening_books import BookManager, choose_move
+from opening_cache import OpeningCache
+import opening_tree
+from tablebase_pool import CachedGaviota, TablebasePool
 from typing import Any, Optional, Union
 OPTIONS_TYPE = dict[str, Any]
 MOVE_INFO_TYPE = dict[str, Any]
@@ -27,6 +29,10 @@ MOVE = Union[chess.engine.PlayResult, list[chess.Move]]
 logger = logging.getLogger(__name__)
 
 out_of_online_opening_book_moves: Counter[str] = Counter()
+# The polyglot books are loaded once in each game process and kept from one move and one game to the next.
+book_manager = BookManager()
+# The local endgame tablebases stay open from one move to the next, until the engine quits at the end of the game.
+tablebase_pool = TablebasePool()
 
 
 @contextmanager
@@ -172,6 +178,9 @@ class EngineWrapper:
                                         online_moves_cfg,
                                         draw_or_resign_cfg)
 
+        if isinstance(best_move, list) or best_move.move is None:
+            best_move = self.precomputed_move(board, best_move) or best_move
+
         if isinstance(best_move, list) or best_move.move is None:
             draw_offered = check_for_draw_offer(game)
 
@@ -183,7 +192,8 @@ class EngineWrapper:
             else:
                 time_limit = game_clock_time(board, game, start_time, move_overhead)
 
-            best_move = self.search(board, time_limit, can_ponder, draw_offered, best_move)
+            best_move = (self.ponder_result(board, time_limit, best_move)
+                         or self.search(board, time_limit, can_ponder, draw_offered, best_move))
         else:
             self.stop()
 
@@ -193,6 +203,18 @@ class EngineWrapper:
             li.resign(game.id)
         else:
             li.make_move(game.id, best_move)
+            if can_ponder:
+                self.start_pondering(board, best_move)
+
+    def precomputed_move(self, board: chess.Board, root_moves: MOVE) -> Optional[chess.engine.PlayResult]:
+        """
+        Get a move that the engine found before the game, so that the position doesn't have to be searched.
+
+        :param board: The current position.
+        :param root_moves: If it is a list, the move must be one of these moves.
+        :return: The move or None if the position must be searched.
+        """
+        return None
 
     def add_go_commands(self, time_limit: chess.engine.Limit) -> chess.engine.Limit:
         """Add extra commands to send to the engine. For example, to search for 1000 nodes or up to depth 10."""
@@ -401,6 +423,34 @@ class EngineWrapper:
         """Stop the engine. Depends on the protocol."""
         pass
 
+    def start_pondering(self, board: chess.Board, best_move: chess.engine.PlayResult) -> None:
+        """
+        Start thinking on the opponent's time after `best_move` was played.
+
+        UCI and XBoard engines already ponder when `search` is called with `ponder=True`, so this only matters
+        for homemade engines.
+
+        :param board: The position before `best_move`.
+        :param best_move: The move that was played. Its `ponder` move is the expected reply.
+        """
+        pass
+
+    def ponder_result(self, board: chess.Board, time_limit: chess.engine.Limit,
+                      root_moves: MOVE) -> Optional[chess.engine.PlayResult]:
+        """
+        Get the move from pondering if the opponent played the expected reply, and stop pondering otherwise.
+
+        :param board: The current position.
+        :param time_limit: Conditions for how long the engine can still search.
+        :param root_moves: If it is a list, the engine may only play a move in `root_moves`.
+        :return: The move to play or None if the position must be searched.
+        """
+        return None
+
+    def stop_pondering(self) -> None:
+        """Stop thinking on the opponent's time."""
+        pass
+
     def get_pid(self) -> str:
         """Get the pid of the engine."""
         pid = "?"
@@ -413,9 +463,10 @@ class EngineWrapper:
         self.engine.ping()
 
     def quit(self) -> None:
-        """Close the engine."""
+        """Close the engine and the local endgame tablebases."""
         self.engine.quit()
         self.engine.close()
+        tablebase_pool.close()
 
 
 class UCIEngine(EngineWrapper):
@@ -540,11 +591,98 @@ class MinimalEngine(EngineWrapper):
         self.engine_name = self.__class__.__name__ if name is None else name
 
         self.engine = FillerEngine(self, name=self.engine_name)
+        self.ponder_board: Optional[chess.Board] = None
+        # Built by build_opening_cache.py and set with "OpeningCache" in homemade_options.
+        opening_cache_path = options.pop("OpeningCache", None)
+        self.opening_cache = OpeningCache(opening_cache_path) if opening_cache_path else None
 
     def get_pid(self) -> str:
         """Homemade engines don't have a pid, so we return a question mark."""
         return "?"
 
+    def precomputed_move(self, board: chess.Board, root_moves: MOVE) -> Optional[chess.engine.PlayResult]:
+        """Look up the position in the opening cache, if there is one."""
+        if self.opening_cache is None:
+            return None
+        result = self.opening_cache.play_result(board, root_moves if isinstance(root_moves, list) else None)
+        if result is not None:
+            logger.info(f"Got move {result.move} from the opening cache")
+        return result
+
+    def stop(self) -> None:
+        """Stop pondering."""
+        self.stop_pondering()
+
+    def start_pondering(self, board: chess.Board, best_move: chess.engine.PlayResult) -> None:
+        """
+        Call `ponder` on the position after `best_move` and its ponder move.
+
+        :param board: The position before `best_move`.
+        :param best_move: The move that was played. Its `ponder` move is the expected reply.
+        """
+        self.stop_pondering()
+        if best_move.move is None or best_move.ponder is None:
+            return
+
+        ponder_board = board.copy()
+        ponder_board.push(best_move.move)
+        if not ponder_board.is_legal(best_move.ponder):
+            return
+        ponder_board.push(best_move.ponder)
+        self.ponder_board = ponder_board
+        self.ponder(ponder_board)
+
+    def ponder_result(self, board: chess.Board, time_limit: chess.engine.Limit,
+                      root_moves: MOVE) -> Optional[chess.engine.PlayResult]:
+        """
+        Call `ponderhit` if `board` is the pondered position, and `cancel_ponder` otherwise.
+
+        :param board: The current position.
+        :param time_limit: Conditions for how long the engine can still search.
+        :param root_moves: If it is a list, the pondered move may not be allowed, so pondering is stopped.
+        :return: The move to play or None if the position must be searched.
+        """
+        ponder_board = self.ponder_board
+        if (ponder_board is None or isinstance(root_moves, list)
+                or board != ponder_board or board.move_stack != ponder_board.move_stack):
+            self.stop_pondering()
+            return None
+
+        self.ponder_board = None
+        result = self.ponderhit(time_limit)
+        return result if result is not None and result.move is not None else None
+
+    def stop_pondering(self) -> None:
+        """Call `cancel_ponder` if the engine is pondering."""
+        if self.ponder_board is not None:
+            self.ponder_board = None
+            self.cancel_ponder()
+
+    def ponder(self, board: chess.Board) -> None:
+        """
+        Start searching `board` in the background while the opponent thinks.
+
+        Implement this, `ponderhit` and `cancel_ponder` to let your homemade engine ponder.
+        This method must return right away, for example by starting a thread.
+
+        :param board: The position after the expected reply of the opponent.
+        """
+        pass
+
+    def ponderhit(self, time_limit: chess.engine.Limit) -> Optional[chess.engine.PlayResult]:
+        """
+        Finish the background search because the opponent played the expected reply.
+
+        :param time_limit: Conditions for how long the engine can still search.
+        :return: The move to play or None to search the position with `search`.
+        """
+        self.cancel_ponder()
+        return None
+
+    def cancel_ponder(self) -> None:
+        """Stop the background search because the opponent didn't play the expected reply or the game ended."""
+        pass
+
     def search(self, board: chess.Board, time_limit: chess.engine.Limit, ponder: bool, draw_offered: bool,
                root_moves: MOVE) -> chess.engine.PlayResult:
         """
@@ -683,27 +821,27 @@ def get_book_move(board: chess.Board, game: model.Game,
         return no_book_move
 
     variant = "standard" if board.uci_variant == "chess" else str(board.uci_variant)
-    config.change_value_to_list(polyglot_cfg.config, "book", key=variant)
-    books = polyglot_cfg.book.lookup(variant)
-
-    for book in books:
-        with chess.polyglot.open_reader(book) as reader:
-            try:
-                selection = polyglot_cfg.selection
-                min_weight = polyglot_cfg.min_weight
-                if selection == "weighted_random":
-                    move = reader.weighted_choice(board).move
-                elif selection == "uniform_random":
-                    move = reader.choice(board, minimum_weight=min_weight).move
-                elif selection == "best_move":
-                    move = reader.find(board, minimum_weight=min_weight).move
-            except IndexError:
-                # python-chess raises "IndexError" if no entries found.
-                move = None
-
-        if move is not None:
-            logger.info(f"Got move {move} from book {book} for game {game.id}")
-            return chess.engine.PlayResult(move, None)
+    book_manager.update(polyglot_cfg.config.get("book"))
+    selection = polyglot_cfg.selection
+    # Like python-chess's weighted choice, the weighted random selection only leaves out moves of weight 0.
+    min_weight = 1 if selection == "weighted_random" else polyglot_cfg.min_weight
+    moves = book_manager.index(variant).find_all(board, min_weight, polyglot_cfg.merge_books)
+
+    if moves:
+        book_move = choose_move(moves, selection)
+        logger.info(f"Got move {book_move.move} from book {book_move.book} for game {game.id}")
+        return chess.engine.PlayResult(book_move.move, None)
+
+    tree_cfg = polyglot_cfg.opening_tree
+    if tree_cfg.enabled:
+        tree_moves = [found for found in book_manager.opening_tree(tree_cfg.file).find_all(board, tree_cfg.min_games)
+                      if found.score >= tree_cfg.min_score]
+        if tree_moves:
+            tree_move = opening_tree.choose_move(tree_moves, tree_cfg.selection)
+            average_eval = "none" if tree_move.eval is None else tree_move.eval
+            logger.info(f"Got move {tree_move.move} from the opening tree for game {game.id} (score {tree_move.score:.0%} "
+                        f"in {tree_move.games} games, average eval {average_eval})")
+            return chess.engine.PlayResult(tree_move.move, None)
 
     return no_book_move
 
@@ -1062,46 +1200,44 @@ def get_syzygy(board: chess.Board, game: model.Game,
         return None, -3
     move: Union[chess.Move, list[chess.Move]]
     move_quality = syzygy_cfg.move_quality
-    with chess.syzygy.open_tablebase(syzygy_cfg.paths[0]) as tablebase:
-        for path in syzygy_cfg.paths[1:]:
-            tablebase.add_directory(path)
+    tablebase = tablebase_pool.syzygy(syzygy_cfg.paths)
 
+    try:
+        moves = score_syzygy_moves(board, dtz_scorer, tablebase)
+
+        best_wdl = max(map(dtz_to_wdl, moves.values()))
+        good_moves = [(move, dtz) for move, dtz in moves.items() if dtz_to_wdl(dtz) == best_wdl]
+        if move_quality == "good":
+            move, dtz = random.choice(good_moves)
+            logger.info(f"Got move {move.uci()} from syzygy (wdl: {best_wdl}, dtz: {dtz}) for game {game.id}")
+            return move, best_wdl
+        elif move_quality == "suggest" and len(good_moves) > 1:
+            move = [chess_move for chess_move, dtz in good_moves]
+            logger.info(f"Suggesting moves from syzygy (wdl: {best_wdl}) for game {game.id}")
+            return move, best_wdl
+        else:
+            best_dtz = min([dtz for chess_move, dtz in good_moves])
+            best_moves = [chess_move for chess_move, dtz in good_moves if dtz == best_dtz]
+            move = random.choice(best_moves)
+            logger.info(f"Got move {move.uci()} from syzygy (wdl: {best_wdl}, dtz: {best_dtz}) for game {game.id}")
+            return move, best_wdl
+    except KeyError:
+        # Attempt to only get the WDL score. It returns a move of quality="good", even if quality is set to "best".
         try:
-            moves = score_syzygy_moves(board, dtz_scorer, tablebase)
-
-            best_wdl = max(map(dtz_to_wdl, moves.values()))
-            good_moves = [(move, dtz) for move, dtz in moves.items() if dtz_to_wdl(dtz) == best_wdl]
-            if move_quality == "good":
-                move, dtz = random.choice(good_moves)
-                logger.info(f"Got move {move.uci()} from syzygy (wdl: {best_wdl}, dtz: {dtz}) for game {game.id}")
-                return move, best_wdl
-            elif move_quality == "suggest" and len(good_moves) > 1:
-                move = [chess_move for chess_move, dtz in good_moves]
+            moves = score_syzygy_moves(board, lambda tablebase, b: -tablebase.probe_wdl(b), tablebase)
+            best_wdl = max(moves.values())
+            good_chess_moves = [chess_move for chess_move, wdl in moves.items() if wdl == best_wdl]
+            logger.debug("Found a move using 'move_quality'='good'. We didn't find an '.rtbz' file for this endgame."
+                         if move_quality == "best" else "")
+            if move_quality == "suggest" and len(good_chess_moves) > 1:
+                move = good_chess_moves
                 logger.info(f"Suggesting moves from syzygy (wdl: {best_wdl}) for game {game.id}")
-                return move, best_wdl
             else:
-                best_dtz = min([dtz for chess_move, dtz in good_moves])
-                best_moves = [chess_move for chess_move, dtz in good_moves if dtz == best_dtz]
-                move = random.choice(best_moves)
-                logger.info(f"Got move {move.uci()} from syzygy (wdl: {best_wdl}, dtz: {best_dtz}) for game {game.id}")
-                return move, best_wdl
+                move = random.choice(good_chess_moves)
+                logger.info(f"Got move {move.uci()} from syzygy (wdl: {best_wdl}) for game {game.id}")
+            return move, best_wdl
         except KeyError:
-            # Attempt to only get the WDL score. It returns a move of quality="good", even if quality is set to "best".
-            try:
-                moves = score_syzygy_moves(board, lambda tablebase, b: -tablebase.probe_wdl(b), tablebase)
-                best_wdl = max(moves.values())
-                good_chess_moves = [chess_move for chess_move, wdl in moves.items() if wdl == best_wdl]
-                logger.debug("Found a move using 'move_quality'='good'. We didn't find an '.rtbz' file for this endgame."
-                             if move_quality == "best" else "")
-                if move_quality == "suggest" and len(good_chess_moves) > 1:
-                    move = good_chess_moves
-                    logger.info(f"Suggesting moves from syzygy (wdl: {best_wdl}) for game {game.id}")
-                else:
-                    move = random.choice(good_chess_moves)
-                    logger.info(f"Got move {move.uci()} from syzygy (wdl: {best_wdl}) for game {game.id}")
-                return move, best_wdl
-            except KeyError:
-                return None, -3
+            return None, -3
 
 
 def dtz_scorer(tablebase: chess.syzygy.Tablebase, board: chess.Board) -> int:
@@ -1135,42 +1271,42 @@ def get_gaviota(board: chess.Board, game: model.Game,
     # guarantees that all moves have a syzygy wdl=2/-2. Setting min_dtm_to_consider_as_wdl_1 to 100 will disable it
     # because dtm >= dtz, so if abs(dtm) < 100 => abs(dtz) < 100, so wdl=2/-2.
     min_dtm_to_consider_as_wdl_1 = gaviota_cfg.min_dtm_to_consider_as_wdl_1
-    with chess.gaviota.open_tablebase(gaviota_cfg.paths[0]) as tablebase:
-        for path in gaviota_cfg.paths[1:]:
-            tablebase.add_directory(path)
+    tablebase = tablebase_pool.gaviota(gaviota_cfg.paths)
 
-        try:
-            moves = score_gaviota_moves(board, dtm_scorer, tablebase)
-
-            best_wdl = max(map(dtm_to_gaviota_wdl, moves.values()))
-            good_moves = [(move, dtm) for move, dtm in moves.items() if dtm_to_gaviota_wdl(dtm) == best_wdl]
-            best_dtm = min([dtm for move, dtm in good_moves])
-
-            pseudo_wdl = dtm_to_wdl(best_dtm, min_dtm_to_consider_as_wdl_1)
-            if move_quality == "good":
-                best_moves = good_enough_gaviota_moves(good_moves, best_dtm, min_dtm_to_consider_as_wdl_1)
-                move, dtm = random.choice(best_moves)
-                logger.info(f"Got move {move.uci()} from gaviota (pseudo wdl: {pseudo_wdl}, dtm: {dtm}) for game {game.id}")
-            elif move_quality == "suggest":
-                best_moves = good_enough_gaviota_moves(good_moves, best_dtm, min_dtm_to_consider_as_wdl_1)
-                if len(best_moves) > 1:
-                    move = [chess_move for chess_move, dtm in best_moves]
-                    logger.info(f"Suggesting moves from gaviota (pseudo wdl: {pseudo_wdl}) for game {game.id}")
-                else:
-                    move, dtm = random.choice(best_moves)
-                    logger.info(f"Got move {move.uci()} from gaviota (pseudo wdl: {pseudo_wdl}, dtm: {dtm})"
-                                f" for game {game.id}")
+    try:
+        moves = score_gaviota_moves(board, dtm_scorer, tablebase)
+        logger.debug(f"Gaviota cache: {tablebase.hits} hits and {tablebase.misses} misses in game {game.id} "
+                     f"({len(tablebase.results)} positions)")
+
+        best_wdl = max(map(dtm_to_gaviota_wdl, moves.values()))
+        good_moves = [(move, dtm) for move, dtm in moves.items() if dtm_to_gaviota_wdl(dtm) == best_wdl]
+        best_dtm = min([dtm for move, dtm in good_moves])
+
+        pseudo_wdl = dtm_to_wdl(best_dtm, min_dtm_to_consider_as_wdl_1)
+        if move_quality == "good":
+            best_moves = good_enough_gaviota_moves(good_moves, best_dtm, min_dtm_to_consider_as_wdl_1)
+            move, dtm = random.choice(best_moves)
+            logger.info(f"Got move {move.uci()} from gaviota (pseudo wdl: {pseudo_wdl}, dtm: {dtm}) for game {game.id}")
+        elif move_quality == "suggest":
+            best_moves = good_enough_gaviota_moves(good_moves, best_dtm, min_dtm_to_consider_as_wdl_1)
+            if len(best_moves) > 1:
+                move = [chess_move for chess_move, dtm in best_moves]
+                logger.info(f"Suggesting moves from gaviota (pseudo wdl: {pseudo_wdl}) for game {game.id}")
             else:
-                # There can be multiple moves with the same dtm.
-                best_moves = [(move, dtm) for move, dtm in good_moves if dtm == best_dtm]
                 move, dtm = random.choice(best_moves)
-                logger.info(f"Got move {move.uci()} from gaviota (pseudo wdl: {pseudo_wdl}, dtm: {dtm}) for game {game.id}")
-            return move, pseudo_wdl
-        except KeyError:
-            return None, -3
+                logger.info(f"Got move {move.uci()} from gaviota (pseudo wdl: {pseudo_wdl}, dtm: {dtm})"
+                            f" for game {game.id}")
+        else:
+            # There can be multiple moves with the same dtm.
+            best_moves = [(move, dtm) for move, dtm in good_moves if dtm == best_dtm]
+            move, dtm = random.choice(best_moves)
+            logger.info(f"Got move {move.uci()} from gaviota (pseudo wdl: {pseudo_wdl}, dtm: {dtm}) for game {game.id}")
+        return move, pseudo_wdl
+    except KeyError:
+        return None, -3
 
 
-def dtm_scorer(tablebase: Union[chess.gaviota.NativeTablebase, chess.gaviota.PythonTablebase], board: chess.Board) -> int:
+def dtm_scorer(tablebase: CachedGaviota, board: chess.Board) -> int:
     """Score a position based on a gaviota DTM egtb."""
     dtm = -tablebase.probe_dtm(board)
     return dtm + (1 if dtm > 0 else -1) * board.halfmove_clock * (0 if dtm == 0 else 1)
@@ -1271,11 +1407,8 @@ def score_syzygy_moves(board: chess.Board, scorer: Callable[[chess.syzygy.Tableb
     return moves
 
 
-def score_gaviota_moves(board: chess.Board,
-                        scorer: Callable[[Union[chess.gaviota.NativeTablebase, chess.gaviota.PythonTablebase],
-                                          chess.Board], int],
-                        tablebase: Union[chess.gaviota.NativeTablebase, chess.gaviota.PythonTablebase]
-                        ) -> dict[chess.Move, int]:
+def score_gaviota_moves(board: chess.Board, scorer: Callable[[CachedGaviota, chess.Board], int],
+                        tablebase: CachedGaviota) -> dict[chess.Move, int]:
     """Score all the moves using gaviota egtbs."""
     moves = {}
     for move in board.legal_moves:
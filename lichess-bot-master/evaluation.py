@@ -0,0 +1,345 @@
+"""Static evaluation used by the homemade engines in `strategies.py`."""
+from __future__ import annotations
+import chess
+import json
+import logging
+import os
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+MATE_SCORE = 9999
+
+# material count
+# pawn(1), knight(3), bishop(3.2), rook(5), queen(9)
+PIECE_VALUES = [0, 100, 300, 320, 500, 900, 0]
+
+# Piece-square tables from white's point of view.
+# A1   B1 ...
+#
+#
+#
+#           ...
+#
+#
+#                   ... G8   H8
+# Black uses the same tables read backwards (square 63 - i).
+PAWN_TABLE = [
+     0,  0,   0,   0,   0,   0,  0,  0,
+     5, 10,  10, -20, -20,  10, 10,  5,
+     5, -5, -10,   0,   0, -10, -5,  5,
+     0,  0,   0,  20,  20,   0,  0,  0,
+     5,  5,  10,  25,  25,  10,  5,  5,
+    10, 10,  20,  30,  30,  20, 10, 10,
+    50, 50,  50,  50,  50,  50, 50, 50,
+     0,  0,   0,   0,   0,   0,  0,  0
+]
+
+KNIGHT_TABLE = [
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50
+]
+
+BISHOP_TABLE = [
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10,   5,   0,   0,   0,   0,   5, -10,
+    -10,  10,  10,  10,  10,  10,  10, -10,
+    -10,   0,  10,  10,  10,  10,   0, -10,
+    -10,   5,   5,  10,  10,   5,   5, -10,
+    -10,   0,   5,  10,  10,   5,   0, -10,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20
+]
+
+ROOK_TABLE = [
+     0,  0,  0,  5,  5,  0,  0,  0,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+     5, 10, 10, 10, 10, 10, 10,  5,
+     0,  0,  0,  0,  0,  0,  0,  0
+]
+
+QUEEN_TABLE = [
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10,   0,   5,  0,  0,   0,   0, -10,
+    -10,   5,   5,  5,  5,   5,   0, -10,
+      0,   0,   5,  5,  5,   5,   0,  -5,
+     -5,   0,   5,  5,  5,   5,   0,  -5,
+    -10,   0,   5,  5,  5,   5,   0, -10,
+    -10,   0,   0,  0,  0,   0,   0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20
+]
+
+KING_TABLE = [
+     20,  30,  10,   0,   0,  10,  30,  20,
+     20,  20,   0,   0,   0,   0,  20,  20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30
+]
+
+# In the endgame, passed pawns are worth more the closer they get to promotion...
+PAWN_ENDGAME_TABLE = [
+     0,  0,  0,  0,  0,  0,  0,  0,
+    10, 10, 10, 10, 10, 10, 10, 10,
+    10, 10, 10, 10, 10, 10, 10, 10,
+    20, 20, 20, 20, 20, 20, 20, 20,
+    30, 30, 30, 30, 30, 30, 30, 30,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    80, 80, 80, 80, 80, 80, 80, 80,
+     0,  0,  0,  0,  0,  0,  0,  0
+]
+
+# ...and the king should come to the center instead of hiding in the corner.
+KING_ENDGAME_TABLE = [
+    -50, -30, -30, -30, -30, -30, -30, -50,
+    -30, -30,   0,   0,   0,   0, -30, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -20, -10,   0,   0, -10, -20, -30,
+    -50, -40, -30, -20, -20, -30, -40, -50
+]
+
+# The middlegame and endgame tables of each piece type. The pieces other than pawns and kings use the same
+# table in both phases.
+PIECE_SQUARE_TABLES = {chess.PAWN: (PAWN_TABLE, PAWN_ENDGAME_TABLE),
+                       chess.KNIGHT: (KNIGHT_TABLE, KNIGHT_TABLE),
+                       chess.BISHOP: (BISHOP_TABLE, BISHOP_TABLE),
+                       chess.ROOK: (ROOK_TABLE, ROOK_TABLE),
+                       chess.QUEEN: (QUEEN_TABLE, QUEEN_TABLE),
+                       chess.KING: (KING_TABLE, KING_ENDGAME_TABLE)}
+
+# The game phase is the sum of these weights over the pieces on the board: 24 with all the pieces (the
+# middlegame) down to 0 with only kings and pawns (the endgame). Promotions may push it over 24.
+PHASE_WEIGHTS = [0, 0, 1, 1, 2, 4, 0]
+MAX_PHASE = 24
+
+# A middlegame and an endgame score are packed into one int as `endgame * 2**16 + middlegame`, so adding
+# packed scores adds both scores at once. Each score must stay between -2**15 and 2**15.
+SCORE_PAIR_SHIFT = 16
+SCORE_PAIR_HALF = 1 << (SCORE_PAIR_SHIFT - 1)
+SCORE_PAIR_MASK = (1 << SCORE_PAIR_SHIFT) - 1
+
+
+def score_pair(middlegame: int, endgame: int) -> int:
+    """Pack a middlegame and an endgame score into one int."""
+    return (endgame << SCORE_PAIR_SHIFT) + middlegame
+
+
+def taper(pair: int, phase: int) -> int:
+    """
+    Blend the middlegame and the endgame score of a packed score pair by the game phase.
+
+    :param pair: The packed scores from white's point of view.
+    :param phase: The game phase (see `PHASE_WEIGHTS`).
+    :return: The blended score, rounded towards zero so that swapping the colors negates it exactly.
+    """
+    phase = min(phase, MAX_PHASE)
+    middlegame = ((pair + SCORE_PAIR_HALF) & SCORE_PAIR_MASK) - SCORE_PAIR_HALF
+    endgame = (pair - middlegame) >> SCORE_PAIR_SHIFT
+    blended = middlegame * phase + endgame * (MAX_PHASE - phase)
+    return blended // MAX_PHASE if blended >= 0 else -(-blended // MAX_PHASE)
+
+
+# Tables tuned by `tune_evaluation.py` replace the material values and piece-square tables above if this file
+# exists. The material values are still used for move ordering and pruning.
+PARAMETERS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "evaluation_parameters.json")
+
+
+def default_tables() -> dict[int, tuple[list[int], list[int]]]:
+    """Get the middlegame and endgame score of each piece on each square: the material values plus the tables above."""
+    return {piece_type: ([PIECE_VALUES[piece_type] + score for score in middlegame_table],
+                         [PIECE_VALUES[piece_type] + score for score in endgame_table])
+            for piece_type, (middlegame_table, endgame_table) in PIECE_SQUARE_TABLES.items()}
+
+
+def load_tables(path: str) -> dict[int, tuple[list[int], list[int]]]:
+    """
+    Read tuned tables from a parameter file written by `tune_evaluation.py`.
+
+    :param path: The JSON file. Its "piece_square_tables" has a "middlegame" and an "endgame" list of 64 scores
+        for each piece name, which include the material value.
+    :return: The tables in the form of `default_tables`.
+    """
+    with open(path) as file:
+        tables = json.load(file)["piece_square_tables"]
+    result = {}
+    for piece_type in chess.PIECE_TYPES:
+        piece_tables = tables[chess.piece_name(piece_type)]
+        middlegame = [int(score) for score in piece_tables["middlegame"]]
+        endgame = [int(score) for score in piece_tables["endgame"]]
+        if len(middlegame) != 64 or len(endgame) != 64:
+            raise ValueError(f"The {chess.piece_name(piece_type)} tables of {path} don't have 64 squares.")
+        result[piece_type] = (middlegame, endgame)
+    return result
+
+
+def _build_piece_square_scores(tables: dict[int, tuple[list[int], list[int]]]) -> list[list[list[int]]]:
+    """
+    Combine the material values and the piece-square tables into one lookup table.
+
+    :param tables: The middlegame and endgame tables of each piece type, including the material value.
+    :return: A table indexed by `[color][piece_type][square]` with the packed middlegame and endgame scores
+        (see `score_pair`) of that piece from white's point of view.
+    """
+    scores = [[[0] * 64 for _ in range(7)] for _ in chess.COLORS]
+    for piece_type, (middlegame_table, endgame_table) in tables.items():
+        for square in chess.SQUARES:
+            scores[chess.WHITE][piece_type][square] = score_pair(middlegame_table[square], endgame_table[square])
+            scores[chess.BLACK][piece_type][square] = -score_pair(middlegame_table[63 - square], endgame_table[63 - square])
+    return scores
+
+
+def current_tables() -> dict[int, tuple[list[int], list[int]]]:
+    """Get the tuned tables if there are any, and the default tables otherwise."""
+    if os.path.exists(PARAMETERS_FILE):
+        try:
+            tables = load_tables(PARAMETERS_FILE)
+            logger.info(f"Using the tuned evaluation parameters of {PARAMETERS_FILE}.")
+            return tables
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            logger.warning(f"Ignoring the evaluation parameters of {PARAMETERS_FILE}: {error!r}")
+    return default_tables()
+
+
+PIECE_SQUARE_SCORES = _build_piece_square_scores(current_tables())
+
+
+# Pawn structure terms as packed middlegame and endgame scores for white. They are negated for black.
+# For each pawn on the same file as another pawn of the same color (two pawns on a file count once).
+DOUBLED_PAWN = score_pair(-10, -20)
+# For each pawn with no pawns of the same color on the neighboring files.
+ISOLATED_PAWN = score_pair(-10, -15)
+# For each passed pawn by its rank counted from the own side, on top of the piece-square tables.
+PASSED_PAWN = [score_pair(middlegame, endgame)
+               for middlegame, endgame in [(0, 0), (5, 10), (5, 15), (10, 25), (20, 40), (30, 60), (50, 90), (0, 0)]]
+# For each passed pawn with a piece standing right in front of it.
+BLOCKED_PASSED_PAWN = score_pair(-5, -20)
+
+ADJACENT_FILES = [(chess.BB_FILES[file - 1] if file > 0 else 0) | (chess.BB_FILES[file + 1] if file < 7 else 0)
+                  for file in range(8)]
+
+
+def _front_span(color: chess.Color, square: int, files: int) -> int:
+    """Get the squares of `files` on the ranks in front of a pawn of `color` on `square`."""
+    rank = chess.square_rank(square)
+    ranks = chess.BB_ALL << 8 * (rank + 1) & chess.BB_ALL if color == chess.WHITE else (1 << 8 * rank) - 1
+    return ranks & files
+
+
+# The squares in front of a pawn on its own file, and on its own and the neighboring files, indexed by
+# `[color][square]`.
+FRONT_SPANS = [[_front_span(color, square, chess.BB_FILES[chess.square_file(square)]) for square in chess.SQUARES]
+               for color in (chess.BLACK, chess.WHITE)]
+PASSED_PAWN_SPANS = [[_front_span(color, square, chess.BB_FILES[chess.square_file(square)]
+                                  | ADJACENT_FILES[chess.square_file(square)]) for square in chess.SQUARES]
+                     for color in (chess.BLACK, chess.WHITE)]
+
+
+class PawnStructure(NamedTuple):
+    """The evaluation terms that only depend on the pawns, so they can be cached by the pawn structure."""
+
+    score: int
+    """The packed middlegame and endgame scores of the pawn structure from white's point of view."""
+    passed: tuple[int, int]
+    """The bitboards of the passed pawns of black and white, indexed by `chess.Color`."""
+
+
+def pawn_structure(white_pawns: int, black_pawns: int) -> PawnStructure:
+    """
+    Score doubled, isolated and passed pawns.
+
+    :param white_pawns: The bitboard of the white pawns.
+    :param black_pawns: The bitboard of the black pawns.
+    """
+    score = 0
+    passed = [0, 0]
+    for color, own, enemy in [(chess.WHITE, white_pawns, black_pawns), (chess.BLACK, black_pawns, white_pawns)]:
+        color_score = 0
+        for file, file_mask in enumerate(chess.BB_FILES):
+            count = chess.popcount(own & file_mask)
+            if count:
+                color_score += DOUBLED_PAWN * (count - 1)
+                if not own & ADJACENT_FILES[file]:
+                    color_score += ISOLATED_PAWN * count
+
+        front_spans = FRONT_SPANS[color]
+        passed_pawn_spans = PASSED_PAWN_SPANS[color]
+        for square in chess.scan_forward(own):
+            if not passed_pawn_spans[square] & enemy and not front_spans[square] & own:
+                passed[color] |= 1 << square
+                rank = chess.square_rank(square)
+                color_score += PASSED_PAWN[rank if color == chess.WHITE else 7 - rank]
+        score += color_score if color == chess.WHITE else -color_score
+    return PawnStructure(score, (passed[chess.BLACK], passed[chess.WHITE]))
+
+
+def blocked_passed_pawns(passed: tuple[int, int], occupied: int) -> int:
+    """
+    Score the passed pawns that have a piece on the square in front of them.
+
+    This depends on the other pieces, so it is not part of `PawnStructure`, but it only needs its passed pawns.
+
+    :param passed: The passed pawns of black and white from `PawnStructure.passed`.
+    :param occupied: The bitboard of all the pieces.
+    :return: The packed middlegame and endgame scores from white's point of view.
+    """
+    blocked_white = chess.popcount(passed[chess.WHITE] << 8 & occupied)
+    blocked_black = chess.popcount(passed[chess.BLACK] >> 8 & occupied)
+    return BLOCKED_PASSED_PAWN * (blocked_white - blocked_black)
+
+
+def pawn_terms(board: chess.Board) -> int:
+    """Get the packed scores of the pawn structure of `board` from white's point of view, without a cache."""
+    structure = pawn_structure(board.pawns & board.occupied_co[chess.WHITE], board.pawns & board.occupied_co[chess.BLACK])
+    return structure.score + blocked_passed_pawns(structure.passed, board.occupied)
+
+
+def game_phase(board: chess.Board) -> int:
+    """Get the game phase of a position (see `PHASE_WEIGHTS`)."""
+    return (chess.popcount(board.knights | board.bishops) + 2 * chess.popcount(board.rooks)
+            + 4 * chess.popcount(board.queens))
+
+
+def material_and_placement_pair(board: chess.Board) -> int:
+    """
+    Get the packed middlegame and endgame scores (see `score_pair`) of the material and the piece placement.
+
+    The pieces are read from the board's bitboards, so only occupied squares are visited.
+    """
+    total = 0
+    for color in chess.COLORS:
+        color_scores = PIECE_SQUARE_SCORES[color]
+        for piece_type in chess.PIECE_TYPES:
+            table = color_scores[piece_type]
+            for square in chess.scan_forward(board.pieces_mask(piece_type, color)):
+                total += table[square]
+    return total
+
+
+def material_and_placement(board: chess.Board) -> int:
+    """Score the material and the piece placement of a position from white's point of view, blended by the game phase."""
+    return taper(material_and_placement_pair(board), game_phase(board))
+
+
+def evaluate(board: chess.Board) -> int:
+    """Evaluate a position from white's point of view."""
+    # check for mate
+    if board.is_checkmate():
+        return -MATE_SCORE if board.turn == chess.WHITE else MATE_SCORE
+
+    return taper(material_and_placement_pair(board) + pawn_terms(board), game_phase(board))
@@ -0,0 +1,109 @@
+"""Move ordering for the alpha-beta search in `search.py`."""
+from __future__ import annotations
+import chess
+from collections.abc import Iterator
+from evaluation import PIECE_VALUES
+from search_board import promotion, SearchBoard
+
+# Captures are ordered by the value of the captured piece first and by the value of the capturing piece second.
+# The king can capture, but can't be captured, so it gets its own value here.
+MVV_LVA_VALUES = PIECE_VALUES[:chess.KING] + [1000]
+
+CAPTURE_SCORE = 1 << 30
+KILLER_SCORE = 1 << 29
+# Captures that lose material in the static exchange evaluation are searched after the quiet moves.
+LOSING_CAPTURE_SCORE = -(1 << 20)
+# The history scores are halved when they reach this value, so quiet moves always stay behind the killers.
+MAX_HISTORY = 1 << 28
+KILLERS_PER_PLY = 2
+
+
+class MoveOrderer:
+    """
+    Sort the moves of a position so that the moves most likely to cause a beta cutoff are searched first.
+
+    The order is: the best move stored in the transposition table, captures by MVV-LVA (most valuable victim,
+    least valuable attacker), the killer moves of the ply, the other quiet moves by their history score, and
+    last the captures that lose material according to the static exchange evaluation (`SearchBoard.see`).
+    """
+
+    def __init__(self) -> None:
+        """Start with no killer moves and an empty history table."""
+        self.killers: list[list[int]] = []
+        # Indexed by [side][from_square][to_square] as `(side * 64 + from_square) * 64 + to_square`.
+        self.history = [0] * (2 * 64 * 64)
+
+    def new_search(self) -> None:
+        """Forget the killers of the previous search and age the history scores."""
+        self.killers = []
+        self.history = [score // 2 for score in self.history]
+
+    def ordered_moves(self, board: SearchBoard, moves: list[int], tt_move: int, ply: int) -> Iterator[int]:
+        """
+        Yield the pseudo-legal moves of `board` from the most to the least promising.
+
+        The move from the transposition table is yielded before the other moves are sorted, so a cutoff by
+        that move saves the sorting. It is only used if it is a move of this position.
+
+        :param board: The current position.
+        :param moves: The moves from `board.generate_moves()`. The list is changed.
+        :param tt_move: The best move found for this position by an earlier search, or 0.
+        :param ply: The distance from the root of the search. The killer moves are kept per ply.
+        """
+        if tt_move and tt_move in moves:
+            yield tt_move
+            moves.remove(tt_move)
+        yield from self.sort(board, moves, ply)
+
+    def sort(self, board: SearchBoard, moves: list[int], ply: int) -> list[int]:
+        """Sort `moves` by their capture, killer and history scores."""
+        killers = self.killers[ply] if ply < len(self.killers) else []
+        history = self.history
+        side_index = (0 if board.turn == chess.WHITE else 1) * 64
+        squares = board.squares
+        scores = {}
+        for move in moves:
+            from_square = move & 63
+            to_square = move >> 6 & 63
+            if board.is_capture(move):
+                victim = squares[to_square] & 7 or chess.PAWN
+                attacker = squares[from_square] & 7
+                # Taking a piece worth at least as much as the attacker can't lose material, so only the other
+                # captures need the exchange evaluation.
+                if MVV_LVA_VALUES[attacker] > MVV_LVA_VALUES[victim] and not promotion(move):
+                    exchange = board.see(move)
+                    if exchange < 0:
+                        scores[move] = LOSING_CAPTURE_SCORE + exchange
+                        continue
+                scores[move] = CAPTURE_SCORE + MVV_LVA_VALUES[victim] * 8 - MVV_LVA_VALUES[attacker] // 100
+            elif promotion(move):
+                scores[move] = CAPTURE_SCORE + MVV_LVA_VALUES[promotion(move)] * 8
+            elif move in killers:
+                scores[move] = KILLER_SCORE - killers.index(move)
+            else:
+                scores[move] = history[(side_index + from_square) * 64 + to_square]
+        return sorted(moves, key=scores.__getitem__, reverse=True)
+
+    def cutoff(self, board: SearchBoard, move: int, depth: int, ply: int) -> None:
+        """
+        Remember a move that caused a beta cutoff.
+
+        :param board: The position where the cutoff happened (before `move` is played).
+        :param move: The move that caused the cutoff.
+        :param depth: The remaining depth of the search. Deeper cutoffs get a larger history bonus.
+        :param ply: The distance from the root of the search.
+        """
+        if board.is_capture(move) or promotion(move):
+            return
+
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[KILLERS_PER_PLY:]
+
+        index = ((0 if board.turn == chess.WHITE else 1) * 64 + (move & 63)) * 64 + (move >> 6 & 63)
+        self.history[index] += depth * depth
+        if self.history[index] >= MAX_HISTORY:
+            self.history = [score // 2 for score in self.history]
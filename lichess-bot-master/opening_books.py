@@ -0,0 +1,219 @@
+"""
+The polyglot opening books of `engine: polyglot: book`, loaded once for the life of a game process.
+
+All the books of a variant are read into one NumPy array of entries sorted by the Zobrist hash of their position. A
+lookup is a single binary search of that array for the entries of every book. The entries come in the order of the
+books in the config, so the first book that has the position can still be preferred, or the weights of a move can be
+added up over all the books (`merge_books`). The index is rebuilt when the books of the config change. The opening
+tree built from the bot's own games (see `opening_tree.py`) is kept here too.
+"""
+from __future__ import annotations
+import chess
+import chess.polyglot
+import copy
+import logging
+import numpy as np
+import numpy.typing as npt
+import os
+import random
+import time
+from opening_tree import OpeningTree
+from typing import Any, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+BOOK_ENTRY = np.dtype([("key", ">u8"), ("move", ">u2"), ("weight", ">u2"), ("learn", ">u4")])
+"""An entry of a polyglot file: big-endian Zobrist hash, move, weight and learn value."""
+INDEX_ENTRY = np.dtype([("key", "u8"), ("move", "u2"), ("weight", "u2"), ("learn", "u4"), ("book", "u2")])
+"""An entry of the index in the byte order of the machine, with the number of its book in the config."""
+# Polyglot stores castling as the king taking its rook. In standard chess, this is where the king really goes.
+CASTLING_TARGETS = {(chess.E1, chess.H1): chess.G1, (chess.E1, chess.A1): chess.C1,
+                    (chess.E8, chess.H8): chess.G8, (chess.E8, chess.A8): chess.C8}
+
+
+class BookMove(NamedTuple):
+    """A legal book move of a position."""
+
+    move: chess.Move
+    weight: int
+    """The weight in the book, or the sum of the weights in all the books if they are merged."""
+    book: str
+    """The file of the book, or the files of all the books with the move if they are merged."""
+
+
+def read_book(path: str) -> npt.NDArray[np.void]:
+    """
+    Read all the entries of a polyglot file.
+
+    :param path: The file name.
+    :return: The entries as an array of `BOOK_ENTRY`.
+    :raises OSError: If the size of the file is not a multiple of the entry size.
+    """
+    if os.path.getsize(path) % BOOK_ENTRY.itemsize:
+        raise OSError(f"invalid file size: ensure {path!r} is a valid polyglot opening book")
+    return np.fromfile(path, dtype=BOOK_ENTRY)
+
+
+def book_move(board: chess.Board, raw_move: int) -> chess.Move:
+    """
+    Decode a polyglot move in a position, the way python-chess's `MemoryMappedReader` does.
+
+    :param board: The position of the book entry.
+    :param raw_move: The move of the book entry.
+    :return: The move. Castling is the king moving two squares in standard chess, and the king taking its rook in
+        Chess960, as in python-chess.
+    """
+    to_square = raw_move & 0x3f
+    from_square = raw_move >> 6 & 0x3f
+    promotion_part = raw_move >> 12 & 0x7
+    promotion = promotion_part + 1 if promotion_part else None
+    if from_square == to_square:
+        # A piece drop (in crazyhouse).
+        return chess.Move(to_square, to_square, drop=promotion)
+    if not board.chess960 and promotion is None and board.kings & chess.BB_SQUARES[from_square]:
+        king_to = CASTLING_TARGETS.get((from_square, to_square))
+        if king_to is not None:
+            return chess.Move(from_square, king_to)
+    return chess.Move(from_square, to_square, promotion)
+
+
+class BookIndex:
+    """The entries of several polyglot books merged into one sorted array."""
+
+    def __init__(self, paths: list[str]) -> None:
+        """
+        Read the books.
+
+        :param paths: The book files in the order of the config.
+        """
+        self.paths = paths
+        parts = []
+        for number, path in enumerate(paths):
+            book = read_book(path)
+            part = np.empty(len(book), dtype=INDEX_ENTRY)
+            for field in ["key", "move", "weight", "learn"]:
+                part[field] = book[field]
+            part["book"] = number
+            parts.append(part)
+        entries = np.concatenate(parts) if parts else np.empty(0, dtype=INDEX_ENTRY)
+        # A stable sort keeps the entries of a position in the order of the books, and of the entries in each book.
+        self.entries = entries[np.argsort(entries["key"], kind="stable")]
+        # Searching a field of a structured array copies the field first, so the keys are also kept on their own.
+        self.keys = np.ascontiguousarray(self.entries["key"])
+
+    def __len__(self) -> int:
+        """Get the number of entries of all the books."""
+        return len(self.entries)
+
+    def find_all(self, board: chess.Board, minimum_weight: int = 1, merge: bool = False) -> list[BookMove]:
+        """
+        Find the legal book moves of a position.
+
+        :param board: The position.
+        :param minimum_weight: Moves with a lower weight are left out.
+        :param merge: Whether to add up the weights of each move over all the books. Otherwise, only the moves of the
+            first book with a move of at least `minimum_weight` are returned.
+        :return: The moves in the order of the books and of the entries in each book.
+        """
+        key = np.uint64(chess.polyglot.zobrist_hash(board))
+        start = int(np.searchsorted(self.keys, key, side="left"))
+        end = int(np.searchsorted(self.keys, key, side="right"))
+        weights: dict[chess.Move, int] = {}
+        books: dict[chess.Move, list[str]] = {}
+        illegal_moves = set()
+        first_book = None
+        for raw_move, weight, number in self.entries[start:end][["move", "weight", "book"]].tolist():
+            if first_book is not None and number != first_book:
+                break
+            if not merge and weight < minimum_weight:
+                continue
+            move = book_move(board, raw_move)
+            if move in illegal_moves:
+                continue
+            if move not in weights and not board.is_legal(move):
+                illegal_moves.add(move)
+                continue
+            weights[move] = weights.get(move, 0) + weight
+            move_books = books.setdefault(move, [])
+            if self.paths[number] not in move_books:
+                move_books.append(self.paths[number])
+            if not merge:
+                first_book = number
+        return [BookMove(move, weight, ", ".join(books[move])) for move, weight in weights.items() if weight >= minimum_weight]
+
+
+def choose_move(moves: list[BookMove], selection: str) -> BookMove:
+    """
+    Choose one of the book moves of a position.
+
+    :param moves: The moves from `BookIndex.find_all`. There must be at least one.
+    :param selection: "weighted_random" to choose with a probability that grows with the weight, "uniform_random" to
+        choose any move with the same probability, or "best_move" for the (first) move with the highest weight.
+    :return: The chosen move.
+    """
+    if selection == "weighted_random":
+        return random.choices(moves, weights=[found.weight for found in moves])[0]
+    if selection == "uniform_random":
+        return random.choice(moves)
+    return max(moves, key=lambda found: found.weight)
+
+
+class BookManager:
+    """The book indexes of a process."""
+
+    def __init__(self) -> None:
+        """Start without any books."""
+        self.book_config: Any = None
+        """A copy of the `book` section that `books` was made from."""
+        self.books: dict[str, list[str]] = {}
+        """The book files of each variant."""
+        self.indexes: dict[str, BookIndex] = {}
+        """The loaded books of each variant."""
+        self.tree: Optional[OpeningTree] = None
+        """The opening tree built from the bot's games."""
+
+    def update(self, book_config: Any) -> None:
+        """
+        Read the `book` section of the config, and drop the indexes if their books changed.
+
+        This is cheap if the section didn't change, so it can be called before every lookup.
+
+        :param book_config: The `book` section: for each variant, a book file or a list of book files.
+        """
+        if book_config == self.book_config:
+            return
+        self.book_config = copy.deepcopy(book_config)
+        books = {}
+        for variant, paths in (self.book_config or {}).items():
+            books[variant] = [] if paths is None else paths if isinstance(paths, list) else [paths]
+        self.indexes = {variant: index for variant, index in self.indexes.items()
+                        if books.get(variant) == self.books.get(variant)}
+        self.books = books
+
+    def index(self, variant: str) -> BookIndex:
+        """
+        Get the books of a variant, reading them the first time that they are needed.
+
+        :param variant: The name of the variant in the config, e.g. "standard" or "atomic".
+        :return: The index of all the books of the variant.
+        """
+        index = self.indexes.get(variant)
+        if index is None:
+            start = time.perf_counter()
+            index = self.indexes[variant] = BookIndex(self.books.get(variant, []))
+            if index.paths:
+                logger.info(f"Loaded {len(index)} entries of {len(index.paths)} {variant} opening books in "
+                            f"{time.perf_counter() - start:.2f}s.")
+        return index
+
+    def opening_tree(self, path: str) -> OpeningTree:
+        """
+        Get the opening tree of `polyglot: opening_tree`, reading it the first time that it is needed.
+
+        :param path: The tree file. A different file replaces the loaded tree.
+        :return: The tree.
+        """
+        if self.tree is None or self.tree.path != path:
+            self.tree = OpeningTree(path)
+            logger.info(f"Loaded {len(self.tree)} moves of the opening tree {path}.")
+        return self.tree
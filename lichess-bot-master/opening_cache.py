@@ -0,0 +1,119 @@
+"""
+Precomputed moves of a homemade engine for the positions that it meets most often in the opening.
+
+The cache file is written by `build_opening_cache.py` from the games in `pgn_directory`. It is a short header
+followed by fixed-size records sorted by the polyglot Zobrist hash of the position. `MinimalEngine` loads it once
+and looks up every position before searching.
+"""
+from __future__ import annotations
+import chess
+import chess.engine
+import chess.polyglot
+import logging
+import struct
+from collections.abc import Iterable
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"LBOC"
+VERSION = 1
+HEADER = struct.Struct("<4sII")
+"""The magic bytes, the format version and the number of records."""
+RECORD = struct.Struct("<QHhB")
+"""The Zobrist hash, the move, the score in centipawns for the side to move and the search depth."""
+
+
+class CachedMove(NamedTuple):
+    """The result of searching a position when the cache was built."""
+
+    move: chess.Move
+    score: int
+    """The score in centipawns from the point of view of the side to move."""
+    depth: int
+
+
+def encode_move(move: chess.Move) -> int:
+    """Pack a move into 16 bits: the from square, the to square and the promotion piece type."""
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def decode_move(packed: int) -> chess.Move:
+    """Unpack a move packed by `encode_move`."""
+    return chess.Move(packed & 63, packed >> 6 & 63, packed >> 12 or None)
+
+
+def write_cache(path: str, entries: Iterable[tuple[int, CachedMove]]) -> int:
+    """
+    Write a cache file.
+
+    :param path: The file name.
+    :param entries: The Zobrist hash of each position and its move.
+    :return: The number of records written.
+    """
+    records = sorted(entries, key=lambda entry: entry[0])
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(records)))
+        for key, cached in records:
+            file.write(RECORD.pack(key, encode_move(cached.move), cached.score, cached.depth))
+    return len(records)
+
+
+class OpeningCache:
+    """The moves of a cache file, looked up by the Zobrist hash of the position."""
+
+    def __init__(self, path: str) -> None:
+        """
+        Read a cache file.
+
+        :param path: The file name.
+        :raises ValueError: If the file is not a cache file of this version.
+        """
+        with open(path, "rb") as file:
+            data = file.read()
+        magic, version, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION or len(data) != HEADER.size + count * RECORD.size:
+            raise ValueError(f"{path} is not an opening cache of version {VERSION}.")
+        self.moves = {key: (move, score, depth)
+                      for key, move, score, depth in RECORD.iter_unpack(memoryview(data)[HEADER.size:])}
+        logger.info(f"Loaded {count} positions from the opening cache {path}.")
+
+    def __len__(self) -> int:
+        """Get the number of positions in the cache."""
+        return len(self.moves)
+
+    def lookup(self, board: chess.Board) -> Optional[CachedMove]:
+        """
+        Find the move of a position.
+
+        :param board: The position. Only standard chess is cached.
+        :return: The cached move, or None if the position is not in the cache or the move is not legal (which
+            happens if another position has the same hash).
+        """
+        if board.chess960 or board.uci_variant != "chess":
+            return None
+        record = self.moves.get(chess.polyglot.zobrist_hash(board))
+        if record is None:
+            return None
+        packed, score, depth = record
+        move = decode_move(packed)
+        if not board.is_legal(move):
+            return None
+        return CachedMove(move, score, depth)
+
+    def play_result(self, board: chess.Board, root_moves: Optional[list[chess.Move]] = None
+                    ) -> Optional[chess.engine.PlayResult]:
+        """
+        Get the cached move of a position as the result of a search.
+
+        :param board: The position.
+        :param root_moves: If given, the cached move is only used if it is one of these moves.
+        :return: The move with its score and depth, or None if there is no usable cached move.
+        """
+        cached = self.lookup(board)
+        if cached is None or root_moves is not None and cached.move not in root_moves:
+            return None
+        info: chess.engine.InfoDict = {"score": chess.engine.PovScore(chess.engine.Cp(cached.score), board.turn),
+                                       "depth": cached.depth,
+                                       "string": "opening cache"}
+        return chess.engine.PlayResult(cached.move, None, info)
@@ -0,0 +1,133 @@
+"""
+An opening book compiled from the bot's own games, with the results and engine evaluations of each move.
+
+`build_opening_tree.py` reads the game records in `pgn_directory` and writes, for every move played in the first plies
+of the games, how many games it was played in, how many points the side that played it scored, and the average
+evaluation of the bot's engine when the bot played it. The file is a short header followed by fixed-size records
+sorted by the polyglot Zobrist hash of the position. `get_book_move` uses it as another book when
+`polyglot: opening_tree: enabled` is set, and picks moves by their score.
+"""
+from __future__ import annotations
+import chess
+import chess.polyglot
+import numpy as np
+import numpy.typing as npt
+import random
+import struct
+from opening_cache import decode_move, encode_move
+from typing import NamedTuple, Optional
+
+MAGIC = b"LBOT"
+VERSION = 1
+HEADER = struct.Struct("<4sII")
+"""The magic bytes, the format version and the number of records."""
+RECORD = np.dtype([("key", "<u8"), ("move", "<u2"), ("games", "<u4"), ("points", "<u4"), ("eval", "<i2"),
+                   ("evals", "<u4")])
+"""
+The Zobrist hash of the position, the move packed by `opening_cache.encode_move`, the number of games, the half points
+scored by the side that played the move, the average evaluation (in centipawns for that side) and the number of
+evaluations in the average.
+"""
+
+
+class MoveStatistics:
+    """The results and evaluations of a move, added up game by game when building the tree."""
+
+    def __init__(self) -> None:
+        """Start without any games."""
+        self.games = 0
+        self.points = 0
+        """Half points: 2 for a win and 1 for a draw."""
+        self.eval_sum = 0
+        self.evals = 0
+
+
+class TreeMove(NamedTuple):
+    """A legal move of the opening tree."""
+
+    move: chess.Move
+    games: int
+    score: float
+    """The share of the points scored by the side that played the move, from 0 to 1."""
+    eval: Optional[int]
+    """The average evaluation (in centipawns) for the side that played the move, or None if there are none."""
+
+
+def write_tree(path: str, statistics: dict[tuple[int, chess.Move], MoveStatistics]) -> int:
+    """
+    Write an opening tree file.
+
+    :param path: The file name.
+    :param statistics: The results of each move by the Zobrist hash of its position and the move.
+    :return: The number of records written.
+    """
+    records = np.zeros(len(statistics), dtype=RECORD)
+    for index, ((key, move), move_statistics) in enumerate(sorted(statistics.items(), key=lambda item: item[0][0])):
+        average = round(move_statistics.eval_sum / move_statistics.evals) if move_statistics.evals else 0
+        records[index] = (key, encode_move(move), move_statistics.games, move_statistics.points, average,
+                          move_statistics.evals)
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(records)))
+        records.tofile(file)
+    return len(records)
+
+
+class OpeningTree:
+    """The moves of an opening tree file, looked up by the Zobrist hash of the position."""
+
+    def __init__(self, path: str) -> None:
+        """
+        Read an opening tree file.
+
+        :param path: The file name.
+        :raises ValueError: If the file is not an opening tree of this version.
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            magic, version, count = HEADER.unpack(file.read(HEADER.size))
+            records: npt.NDArray[np.void] = np.fromfile(file, dtype=RECORD)
+        if magic != MAGIC or version != VERSION or len(records) != count:
+            raise ValueError(f"{path} is not an opening tree of version {VERSION}.")
+        self.records = records
+        # Searching a field of a structured array copies the field first, so the keys are also kept on their own.
+        self.keys = np.ascontiguousarray(records["key"])
+
+    def __len__(self) -> int:
+        """Get the number of moves in the tree."""
+        return len(self.records)
+
+    def find_all(self, board: chess.Board, min_games: int = 1) -> list[TreeMove]:
+        """
+        Find the legal moves of a position in the tree.
+
+        :param board: The position. Only standard chess is in the tree.
+        :param min_games: Moves played in fewer games are left out.
+        :return: The moves in the order of the file.
+        """
+        if board.chess960 or board.uci_variant != "chess":
+            return []
+        key = np.uint64(chess.polyglot.zobrist_hash(board))
+        start = int(np.searchsorted(self.keys, key, side="left"))
+        end = int(np.searchsorted(self.keys, key, side="right"))
+        moves = []
+        fields = ["move", "games", "points", "eval", "evals"]
+        for packed, games, points, average, evals in self.records[start:end][fields].tolist():
+            move = decode_move(packed)
+            if games >= min_games and board.is_legal(move):
+                moves.append(TreeMove(move, games, points / (2 * games), average if evals else None))
+        return moves
+
+
+def choose_move(moves: list[TreeMove], selection: str) -> TreeMove:
+    """
+    Choose one of the tree moves of a position.
+
+    :param moves: The moves from `OpeningTree.find_all`. There must be at least one.
+    :param selection: "best_score" for the move with the best score (the most played one if several have the same
+        score), or "weighted_random" to choose with a probability that grows with the points that the move scored.
+    :return: The chosen move.
+    """
+    weights = [found.score * found.games for found in moves]
+    if selection == "weighted_random" and sum(weights) > 0:
+        return random.choices(moves, weights=weights)[0]
+    return max(moves, key=lambda found: (found.score, found.games))
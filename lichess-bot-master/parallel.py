@@ -0,0 +1,299 @@
+"""
+Root-parallel search for the homemade engines in `strategies.py`.
+
+The root moves are split between the engine's own process and helper processes. Every process searches its share
+with its own transposition table, and the best move is chosen by comparing the results at the same depth.
+
+lichess-bot plays each game in a daemonic `multiprocessing.pool` worker, and daemonic processes can't start
+`multiprocessing` children. The helpers are therefore started with `subprocess` and run this file as a script.
+They read pickled search requests from stdin and write the pickled results to stdout. A helper writes `READY` once it
+has imported its modules and allocated its transposition table, and `ParallelSearch` waits for every helper to be
+ready, so that the start-up time is not taken from the first search. When the engine's own share of a time-limited
+search is done and its soft deadline has passed, `STOP` is sent to the helpers. They end their searches at once and
+send their completed iterations.
+"""
+from __future__ import annotations
+import chess
+import chess.engine
+import logging
+import os
+import pickle
+import queue
+import subprocess
+import sys
+import threading
+import time
+from evaluation import MATE_SCORE
+from persistent_table import PersistentTable
+from search import order_root_moves, Search, Selectivity
+from search_statistics import combine, SearchStatistics
+from transposition import TranspositionTable
+from typing import Any, IO, Optional
+
+logger = logging.getLogger(__name__)
+
+SearchRequest = tuple[chess.Board, chess.engine.Limit, list[chess.Move]]
+SearchResponse = tuple[list[chess.engine.InfoDict], SearchStatistics]
+# Written by a helper when it can start searching.
+READY = "ready"
+# Sent to a helper to end its current search early.
+STOP = "stop"
+
+
+class SearchHelper:
+    """A helper process that searches part of the root moves."""
+
+    def __init__(self, hash_mb: float, selectivity: Selectivity) -> None:
+        """
+        Start the helper process.
+
+        :param hash_mb: The size (in megabytes) of the helper's transposition table.
+        :param selectivity: The selective search features the helper uses.
+        """
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), str(hash_mb),
+                                         *(str(int(feature)) for feature in selectivity)],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.searching = False
+        # The messages of the helper are read in another thread, so that they can be waited for with a timeout.
+        self.messages: queue.Queue[Any] = queue.Queue()
+        self.answered = threading.Event()
+        threading.Thread(target=self.read_messages, name="search helper", daemon=True).start()
+
+    def read_messages(self) -> None:
+        """Put the messages of the helper in `messages` until it stops. None is put when it stops."""
+        assert self.process.stdout is not None
+        while True:
+            try:
+                message = pickle.load(self.process.stdout)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                message = None
+            # Set before the message is put, so that `start` can't clear it before it is set.
+            self.answered.set()
+            self.messages.put(message)
+            if message is None:
+                return
+
+    def receive(self) -> Any:
+        """
+        Wait for the next message of the helper.
+
+        :raises EOFError: If the helper stopped.
+        """
+        message = self.messages.get()
+        if message is None:
+            raise EOFError("A search helper stopped.")
+        return message
+
+    def wait_until_ready(self) -> None:
+        """
+        Wait until the helper can start searching.
+
+        :raises EOFError: If the helper stopped before it was ready.
+        """
+        message = self.receive()
+        if message != READY:
+            raise EOFError(f"A search helper sent {message!r} instead of {READY!r}.")
+
+    def start(self, board: chess.Board, limit: chess.engine.Limit, root_moves: list[chess.Move]) -> None:
+        """Send a search request to the helper without waiting for the result."""
+        request: SearchRequest = (board, limit, root_moves)
+        assert self.process.stdin is not None
+        self.answered.clear()
+        pickle.dump(request, self.process.stdin)
+        self.process.stdin.flush()
+        self.searching = True
+
+    def wait(self, timeout: float) -> None:
+        """Wait until the result of the last search request arrives, but not longer than `timeout` seconds."""
+        if self.searching and timeout > 0:
+            self.answered.wait(timeout)
+
+    def stop(self) -> None:
+        """Ask the helper to end its search now. `result` still has to be called for the completed iterations."""
+        if self.searching:
+            assert self.process.stdin is not None
+            pickle.dump(STOP, self.process.stdin)
+            self.process.stdin.flush()
+
+    def result(self) -> SearchResponse:
+        """Wait for the result of the last search request."""
+        self.searching = False
+        response: SearchResponse = self.receive()
+        return response
+
+    def close(self) -> None:
+        """Stop the helper process."""
+        try:
+            if self.searching:
+                self.stop()
+                self.result()
+            assert self.process.stdin is not None
+            pickle.dump(None, self.process.stdin)
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, EOFError, pickle.UnpicklingError, subprocess.TimeoutExpired):
+            logger.warning("A search helper didn't stop cleanly. Killing it.")
+            self.process.kill()
+
+
+class ParallelSearch:
+    """
+    Split the root moves over several processes.
+
+    It has the same `run` method as `Search`, so the engine can use either one.
+    """
+
+    def __init__(self, threads: int, hash_mb: float, selectivity: Selectivity = Selectivity(),
+                 persistent: Optional[PersistentTable] = None) -> None:
+        """
+        Start the helper processes.
+
+        :param threads: The number of processes that search, including the engine's own process.
+        :param hash_mb: The memory (in megabytes) of all the transposition tables together.
+        :param selectivity: The selective search features every process uses.
+        :param persistent: A table of results from earlier games for the engine's own process. The helpers don't
+            use it.
+        """
+        table_mb = hash_mb / threads
+        self.table = TranspositionTable(table_mb)
+        self.searcher = Search(self.table, selectivity, persistent)
+        self.helpers = [SearchHelper(table_mb, selectivity) for _ in range(threads - 1)]
+        # The helpers start up at the same time, so this takes about as long as starting one of them.
+        for helper in self.helpers:
+            helper.wait_until_ready()
+
+    def run(self, board: chess.Board, limit: chess.engine.Limit,
+            root_moves: Optional[list[chess.Move]] = None) -> chess.engine.PlayResult:
+        """
+        Search for the best move until the limit is reached. See `Search.run`.
+
+        The root moves are dealt out in move order, so that every process gets some of the promising moves.
+        """
+        start = time.perf_counter()
+        legal_moves = list(board.legal_moves)
+        moves = [move for move in legal_moves if move in root_moves] if root_moves else legal_moves
+        if len(moves) <= 1:
+            return self.searcher.run(board, limit, root_moves)
+
+        moves = order_root_moves(board, moves)
+        processes = min(len(moves), len(self.helpers) + 1)
+        shares = [moves[index::processes] for index in range(processes)]
+        helpers = self.helpers[:processes - 1]
+        for helper, share in zip(helpers, shares[1:]):
+            helper.start(board, limit, share)
+
+        self.searcher.run(board, limit, shares[0])
+        responses: list[SearchResponse] = [(self.searcher.iterations, self.searcher.statistics)]
+        soft_deadline = self.searcher.soft_deadline
+        for helper in helpers:
+            # Without a time limit, the helpers have to finish their depth or nodes to be compared fairly. With one,
+            # the engine's own share may still end early with a mate score. The helpers are then left to deepen
+            # their shares until the soft deadline, because the results are compared at the depth that all the
+            # unresolved shares reached.
+            if soft_deadline is not None:
+                helper.wait(soft_deadline - time.perf_counter())
+                helper.stop()
+            responses.append(helper.result())
+        return combine_results(responses, time.perf_counter() - start)
+
+    def close(self) -> None:
+        """Stop the helper processes."""
+        for helper in self.helpers:
+            helper.close()
+        self.helpers = []
+
+
+def combine_results(responses: list[SearchResponse], elapsed: float) -> chess.engine.PlayResult:
+    """
+    Choose the best move from the searches of the different shares of the root moves.
+
+    Scores from different depths can't be compared fairly, so the results are compared at the deepest depth
+    that every share completed. A share that stopped early because it found a mate keeps its last result.
+
+    :param responses: The completed iterations and the statistics of each share.
+    :param elapsed: The time (in seconds) the whole search took.
+    :return: The best move and the info of its iteration, with the nodes and statistics of all the shares.
+    """
+    statistics = combine(share_statistics for _, share_statistics in responses)
+    nodes = statistics.nodes
+    results = [iterations for iterations, _ in responses if iterations]
+    if not results:
+        return chess.engine.PlayResult(None, None)
+
+    def relative_score(info: chess.engine.InfoDict) -> int:
+        score = info["score"].relative.score(mate_score=MATE_SCORE)
+        assert score is not None
+        return score
+
+    def is_mate(info: chess.engine.InfoDict) -> bool:
+        return info["score"].is_mate()
+
+    unresolved = [iterations[-1]["depth"] for iterations in results if not is_mate(iterations[-1])]
+    depth = min(unresolved) if unresolved else max(iterations[-1]["depth"] for iterations in results)
+    candidates = [iterations[min(depth, len(iterations)) - 1] for iterations in results]
+    best = max(candidates, key=relative_score)
+
+    pv = best["pv"]
+    info = best.copy()
+    info["nodes"] = nodes
+    info["time"] = elapsed
+    info["nps"] = int(nodes / elapsed) if elapsed > 0 else nodes
+    info["string"] = statistics.summary()
+    logger.debug(f"Parallel search: depth {info['depth']} score {info['score']} "
+                 f"pv {' '.join(move.uci() for move in pv)} ({nodes} nodes from {len(responses)} processes)")
+    return chess.engine.PlayResult(pv[0], pv[1] if len(pv) > 1 else None, info)
+
+
+def serve(hash_mb: float, selectivity: Selectivity, requests: IO[bytes], responses: IO[bytes]) -> None:
+    """
+    Answer search requests until a None request arrives. This is the main loop of a helper process.
+
+    `READY` is written before the first request is read. The requests are read in another thread, so that a `STOP`
+    can end the current search.
+
+    :param hash_mb: The size (in megabytes) of the transposition table. It is kept between requests.
+    :param selectivity: The selective search features to use.
+    :param requests: Where the pickled `SearchRequest`s are read from.
+    :param responses: Where the pickled `SearchResponse`s are written to.
+    """
+    searcher = Search(TranspositionTable(hash_mb), selectivity)
+    pending: queue.Queue[Optional[SearchRequest]] = queue.Queue()
+
+    def read_requests() -> None:
+        while True:
+            try:
+                message = pickle.load(requests)
+            except EOFError:
+                message = None
+            if message == STOP:
+                searcher.stop_requested = True
+                continue
+            # The stop of the last search is cleared here rather than in `Search.run`, so that a stop that comes
+            # before the next search starts is not lost.
+            searcher.stop_requested = False
+            pending.put(message)
+            if message is None:
+                return
+
+    threading.Thread(target=read_requests, name="requests", daemon=True).start()
+    pickle.dump(READY, responses)
+    responses.flush()
+    while True:
+        request = pending.get()
+        if request is None:
+            return
+        board, limit, root_moves = request
+        searcher.set_limits(board, limit, time.perf_counter())
+        searcher.run(board, limit, root_moves, limits_set=True)
+        response: SearchResponse = (searcher.iterations, searcher.statistics)
+        pickle.dump(response, responses)
+        responses.flush()
+
+
+if __name__ == "__main__":
+    # Keep stray prints from corrupting the responses.
+    response_stream = sys.stdout.buffer
+    sys.stdout = sys.stderr
+    serve(float(sys.argv[1]), Selectivity(*(bool(int(feature)) for feature in sys.argv[2:])), sys.stdin.buffer,
+          response_stream)
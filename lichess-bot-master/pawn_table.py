@@ -0,0 +1,63 @@
+"""A cache of the pawn structure evaluation for the homemade engines in `strategies.py`."""
+from __future__ import annotations
+from evaluation import pawn_structure, PawnStructure
+from typing import Optional
+
+# The memory used by the pawn table of each search, in megabytes.
+DEFAULT_PAWN_HASH_MB = 2
+# A rough estimate of the memory used by one entry, including the Python objects it refers to.
+ENTRY_BYTES = 250
+
+
+class PawnTable:
+    """
+    A fixed-size table of `PawnStructure`s keyed by the Zobrist hash of the pawns alone.
+
+    The pawns change much less often than the rest of the position, so most positions of a search find their pawn
+    structure here. Each key has one slot, and a new structure always replaces the old one.
+    """
+
+    def __init__(self, size_mb: float = DEFAULT_PAWN_HASH_MB) -> None:
+        """:param size_mb: The memory (in megabytes) the table may use."""
+        entries = max(1, int(size_mb * 1024 * 1024) // ENTRY_BYTES)
+        self.mask = (1 << (entries.bit_length() - 1)) - 1
+        self.keys: list[Optional[int]] = [None] * (self.mask + 1)
+        self.structures: list[Optional[PawnStructure]] = [None] * (self.mask + 1)
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, key: int, white_pawns: int, black_pawns: int) -> PawnStructure:
+        """
+        Get the pawn structure of a position, and evaluate and store it if it is not in the table.
+
+        :param key: The Zobrist hash of the pawns (see `SearchBoard.pawn_key`).
+        :param white_pawns: The bitboard of the white pawns.
+        :param black_pawns: The bitboard of the black pawns.
+        """
+        index = key & self.mask
+        if self.keys[index] == key:
+            structure = self.structures[index]
+            if structure is not None:
+                self.hits += 1
+                return structure
+
+        self.misses += 1
+        structure = pawn_structure(white_pawns, black_pawns)
+        self.keys[index] = key
+        self.structures[index] = structure
+        return structure
+
+    def hit_rate(self) -> float:
+        """Get the share of the probes since the last `reset_statistics` that found the pawn structure."""
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+    def reset_statistics(self) -> None:
+        """Start counting hits and misses from zero."""
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self) -> None:
+        """Remove all the pawn structures."""
+        self.keys = [None] * len(self.keys)
+        self.structures = [None] * len(self.structures)
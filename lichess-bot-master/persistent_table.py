@@ -0,0 +1,110 @@
+"""
+A transposition table file that keeps deep search results between games and restarts of lichess-bot.
+
+Every game is played by a new engine in a new process, so the in-memory `TranspositionTable` starts empty. This
+table is a memory-mapped file of fixed-size records: opening it reads nothing, and a probe only touches the page of
+its record. The search probes it after a miss in the in-memory table, and the engine writes its deep results into
+it when it quits.
+
+Several games can use the file at the same time. Each record is stored as two 64-bit words, the key XOR the data
+and the data, so a record torn by two processes writing at once doesn't match its key and is ignored (the
+"lockless hashing" of Hyatt and Mann). The words are in the byte order of the machine, so the file can't be moved
+to a machine with another byte order.
+"""
+from __future__ import annotations
+import logging
+import mmap
+import os
+from transposition import Bound, TableEntry, TranspositionTable
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PERSISTENT_HASH_FILE = "homemade_hash.bin"
+# Two 64-bit words per record.
+RECORD_BYTES = 16
+# Only results of at least this depth are saved and probed. Shallower ones are quick to search again.
+MIN_DEPTH = 3
+
+# The fields packed into the data word.
+MOVE_BITS = 17
+BOUND_SHIFT = MOVE_BITS
+DEPTH_SHIFT = BOUND_SHIFT + 2
+SCORE_SHIFT = DEPTH_SHIFT + 8
+SCORE_OFFSET = 1 << 31
+
+
+def pack(depth: int, bound: Bound, score: int, move: int) -> int:
+    """Pack the result of a search into a data word. It is never 0, so 0 marks an empty record."""
+    return move | bound << BOUND_SHIFT | depth << DEPTH_SHIFT | (score + SCORE_OFFSET) << SCORE_SHIFT
+
+
+def unpack(key: int, data: int) -> TableEntry:
+    """Unpack a data word into a `TableEntry` of the `TranspositionTable`."""
+    return TableEntry(key, data >> DEPTH_SHIFT & 0xFF, Bound(data >> BOUND_SHIFT & 3),
+                      (data >> SCORE_SHIFT) - SCORE_OFFSET, data & ((1 << MOVE_BITS) - 1), 0)
+
+
+class PersistentTable:
+    """A memory-mapped file of search results keyed by the polyglot Zobrist hash, with one record per key."""
+
+    def __init__(self, path: str, size_mb: float) -> None:
+        """
+        Open the file, or create it if it doesn't exist or has a different size.
+
+        :param path: The file name.
+        :param size_mb: The size (in megabytes) of the file.
+        """
+        records = max(1, int(size_mb * 1024 * 1024) // RECORD_BYTES)
+        self.mask = (1 << (records.bit_length() - 1)) - 1
+        size = (self.mask + 1) * RECORD_BYTES
+        self.path = path
+        with open(path, "a+b") as file:
+            if os.fstat(file.fileno()).st_size != size:
+                logger.info(f"Creating the search cache {path} ({size // (1024 * 1024)} MB).")
+                file.truncate(0)
+                file.truncate(size)
+            self.map = mmap.mmap(file.fileno(), size)
+        self.words = memoryview(self.map).cast("Q")
+
+    def probe(self, key: int) -> Optional[TableEntry]:
+        """
+        Find the stored result of a position.
+
+        :param key: The Zobrist hash of the position.
+        :return: The stored result or None if the position was not found.
+        """
+        index = (key & self.mask) << 1
+        data = self.words[index + 1]
+        if data and self.words[index] ^ data == key:
+            return unpack(key, data)
+        return None
+
+    def store(self, key: int, depth: int, bound: Bound, score: int, move: int) -> None:
+        """Store the result of searching a position, unless the record has a deeper result of the same position."""
+        index = (key & self.mask) << 1
+        old_data = self.words[index + 1]
+        if old_data and self.words[index] ^ old_data == key and old_data >> DEPTH_SHIFT & 0xFF > depth:
+            return
+        data = pack(depth, bound, score, move)
+        self.words[index] = key ^ data
+        self.words[index + 1] = data
+
+    def save(self, table: TranspositionTable) -> int:
+        """
+        Store the results of the in-memory table that are at least `MIN_DEPTH` deep.
+
+        :return: The number of results stored.
+        """
+        saved = 0
+        for entry in table.entries:
+            if entry is not None and entry.depth >= MIN_DEPTH:
+                self.store(entry.key, entry.depth, entry.bound, entry.score, entry.move)
+                saved += 1
+        return saved
+
+    def close(self) -> None:
+        """Write the changes to the disk and close the file."""
+        self.words.release()
+        self.map.flush()
+        self.map.close()
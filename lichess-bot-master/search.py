@@ -0,0 +1,692 @@
+"""Iterative deepening principal variation search used by the homemade engines in `strategies.py`."""
+from __future__ import annotations
+import chess
+import chess.engine
+import chess.polyglot
+import logging
+import numpy as np
+import threading
+import time
+from batch_evaluation import score_moves
+from evaluation import blocked_passed_pawns, MATE_SCORE, PIECE_VALUES, taper
+from move_ordering import MoveOrderer
+from pawn_table import PawnTable
+from persistent_table import MIN_DEPTH as PERSISTENT_MIN_DEPTH, PersistentTable
+from search_board import BLACK_PIECE, from_square, promotion, SEE_VALUES, SearchBoard, to_square
+from search_statistics import SearchStatistics
+from transposition import Bound, TableEntry, TranspositionTable
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# The search depth when the limit has neither a time nor a depth.
+DEFAULT_DEPTH = 3
+MAX_DEPTH = 64
+# Larger than any score, used as the initial search window.
+INFINITY = MATE_SCORE + 1
+# Scores beyond this value are mates. They are stored as `MATE_SCORE - ply` so that faster mates score higher.
+MATE_THRESHOLD = MATE_SCORE - 2 * MAX_DEPTH
+
+# The first aspiration window at the root is the previous score plus or minus this value.
+ASPIRATION_WINDOW = 50
+
+# After passing, null-move pruning searches this many plies less than a normal move would get...
+NULL_MOVE_REDUCTION = 2
+# ...and one more ply less from this remaining depth on.
+NULL_MOVE_DEEP_DEPTH = 7
+
+# Late move reductions start at this move of a node and this remaining depth.
+LMR_MIN_MOVE = 3
+LMR_MIN_DEPTH = 3
+# Moves from this one on are reduced by two plies instead of one.
+LMR_DEEP_MOVE = 6
+
+# A capture is skipped in the quiescence search if winning the captured piece plus this margin
+# can't bring the score back to alpha (delta pruning).
+DELTA_MARGIN = 200
+
+# Plan the time as if this many moves remain to be played with the remaining clock.
+MOVES_TO_GO = 30
+# The hard deadline may be this many times longer than the soft deadline...
+HARD_LIMIT_FACTOR = 4
+# ...but it may not use more than this part of the remaining clock.
+MAX_CLOCK_FRACTION = 0.25
+
+
+class Selectivity(NamedTuple):
+    """Which selective search features are used. They can be switched off in `homemade_options` for comparisons."""
+
+    null_move: bool = True
+    """Prune positions where passing still fails high (not used in pawn endings because of zugzwang)."""
+    late_move_reductions: bool = True
+    """Search quiet moves late in the move order to a lower depth first."""
+    check_extensions: bool = True
+    """Search positions where the side to move is in check one ply deeper."""
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the hard deadline or the node limit is reached."""
+
+
+def time_budget(board: chess.Board, limit: chess.engine.Limit) -> tuple[Optional[float], Optional[float]]:
+    """
+    Decide how long to search.
+
+    :param board: The current position.
+    :param limit: The limit sent by lichess-bot (e.g. from `engine_wrapper.game_clock_time` or `first_move_time`).
+    :return: The soft and hard time limits in seconds, or None if the search is not limited by time. No new iteration
+        starts after the soft limit, and the search is aborted at the hard limit.
+    """
+    soft: Optional[float] = None
+    hard: Optional[float] = None
+
+    clock = limit.white_clock if board.turn == chess.WHITE else limit.black_clock
+    if clock is not None:
+        increment = (limit.white_inc if board.turn == chess.WHITE else limit.black_inc) or 0
+        soft = min(clock / MOVES_TO_GO + increment * 3 / 4, clock * MAX_CLOCK_FRACTION)
+        hard = min(soft * HARD_LIMIT_FACTOR, clock * MAX_CLOCK_FRACTION)
+
+    if limit.time is not None:
+        # An iteration that starts after half the move time would usually not finish in time.
+        soft = min(soft, limit.time / 2) if soft is not None else limit.time / 2
+        hard = min(hard, limit.time) if hard is not None else limit.time
+
+    return soft, hard
+
+
+def score_to_table(score: int, ply: int) -> int:
+    """Store mate scores as the distance to mate from the current position instead of from the root."""
+    if score > MATE_THRESHOLD:
+        return score + ply
+    if score < -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def score_from_table(score: int, ply: int) -> int:
+    """Convert a stored mate score back to the distance to mate from the root."""
+    if score > MATE_THRESHOLD:
+        return score - ply
+    if score < -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+def pov_score(score: int, turn: chess.Color) -> chess.engine.PovScore:
+    """Convert a search score for the side to move into a `chess.engine.PovScore`."""
+    if abs(score) > MATE_THRESHOLD:
+        moves_to_mate = (MATE_SCORE - abs(score) + 1) // 2
+        return chess.engine.PovScore(chess.engine.Mate(moves_to_mate if score > 0 else -moves_to_mate), turn)
+    return chess.engine.PovScore(chess.engine.Cp(score), turn)
+
+
+class Search:
+    """
+    An iterative deepening principal variation search (PVS) in negamax form.
+
+    All scores are from the point of view of the side to move. The transposition table, the killer moves and
+    the history scores are kept between searches.
+    """
+
+    def __init__(self, table: TranspositionTable, selectivity: Selectivity = Selectivity(),
+                 persistent: Optional[PersistentTable] = None) -> None:
+        """
+        Create a search.
+
+        :param table: The transposition table. Its contents are reused in later searches.
+        :param selectivity: The selective search features to use.
+        :param persistent: A table of deep results from earlier games, probed when `table` misses.
+        """
+        self.table = table
+        self.persistent = persistent
+        self.selectivity = selectivity
+        self.orderer = MoveOrderer()
+        # The pawn structures are kept between searches like the transposition table.
+        self.pawn_table = PawnTable()
+        self.nodes = 0
+        # The counters and timers of the last search. `nodes` is counted apart for the node limit.
+        self.statistics = SearchStatistics()
+        self.node_limit: Optional[int] = None
+        self.max_depth = DEFAULT_DEPTH
+        # No new iteration starts after the soft deadline, and the search is aborted at the hard deadline.
+        self.soft_deadline: Optional[float] = None
+        self.hard_deadline: Optional[float] = None
+        # Set from another thread to abort the search.
+        self.stop_requested = False
+        # While pondering, the search only ends when it is stopped or when `ponderhit` sets the time limits.
+        self.pondering = False
+        self.ponder_thread: Optional[threading.Thread] = None
+        self.ponder_board: Optional[chess.Board] = None
+        self.ponder_result = chess.engine.PlayResult(None, None)
+        # The search works on a `SearchBoard` with moves packed into ints. Only `run` converts them to `chess.Move`.
+        self.root_moves: list[int] = []
+        # The Zobrist keys of the positions in the game and in the current line of the search.
+        self.key_history: list[int] = []
+        # pv[ply] is the best line found from the node at `ply`.
+        self.pv: list[list[int]] = [[] for _ in range(MAX_DEPTH + 1)]
+        # The info of every completed iteration of the last search.
+        self.iterations: list[chess.engine.InfoDict] = []
+
+    def run(self, board: chess.Board, limit: chess.engine.Limit,
+            root_moves: Optional[list[chess.Move]] = None, limits_set: bool = False) -> chess.engine.PlayResult:
+        """
+        Search for the best move until the limit is reached.
+
+        :param board: The position to search. It is not modified.
+        :param limit: Conditions for how long the engine can search.
+        :param root_moves: If given, only these moves are searched.
+        :param limits_set: Whether the limits are already set and `stop_requested` is already cleared, e.g. by
+            `start_ponder`, so that a `ponderhit` or a stop that comes before the search starts is not lost.
+        :return: The best move of the last completed iteration. Its `info` has the depth, score, principal
+            variation, nodes, nodes per second, time and hashfull of that iteration, and the `SearchStatistics`
+            summary of the whole search as its `string`.
+        """
+        start = time.perf_counter()
+        if not limits_set:
+            self.stop_requested = False
+            self.set_limits(board, limit, start)
+        self.nodes = 0
+        self.statistics = statistics = SearchStatistics()
+        self.iterations = []
+
+        # The search changes its own board, so `board` is not modified.
+        search_board = SearchBoard(board)
+        self.table.new_search()
+        self.orderer.new_search()
+        self.pawn_table.reset_statistics()
+        self.key_history = game_keys(board)
+
+        legal_moves = list(board.legal_moves)
+        ordered_moves = order_root_moves(board, [move for move in legal_moves if move in root_moves]
+                                         if root_moves else legal_moves)
+        if not ordered_moves:
+            return chess.engine.PlayResult(None, None)
+        if len(legal_moves) == 1:
+            # The only legal move is played without a search.
+            statistics.time = time.perf_counter() - start
+            info: chess.engine.InfoDict = {"depth": 0, "pv": ordered_moves, "nodes": 0, "nps": 0, "time": statistics.time,
+                                           "string": statistics.summary()}
+            return chess.engine.PlayResult(ordered_moves[0], None, info)
+        packed_moves = {search_board.to_move(move): move for move in search_board.legal_moves()}
+        self.root_moves = [packed_moves[move] for move in ordered_moves]
+
+        pv = [ordered_moves[0]]
+        score = 0
+        depth = 0
+        while depth < self.max_depth:
+            depth += 1
+            try:
+                score = self.aspiration_search(search_board, depth, score)
+            except SearchTimeout:
+                # Take back the moves of the aborted iteration.
+                while search_board.ply:
+                    search_board.unmake()
+                break
+
+            pv = [search_board.to_move(move) for move in self.pv[0]] or pv
+            self.record_iteration(board.turn, depth, score, pv, start)
+            if self.is_last_iteration(score):
+                break
+            # Search the best move first in the next iteration.
+            best_move = packed_moves[pv[0]]
+            self.root_moves.remove(best_move)
+            self.root_moves.insert(0, best_move)
+
+        statistics.nodes = self.nodes
+        statistics.time = time.perf_counter() - start
+        info = self.iterations[-1] if self.iterations else {}
+        if info:
+            info["string"] = statistics.summary()
+        logger.debug(f"Search statistics: {statistics.summary()}")
+        return chess.engine.PlayResult(pv[0], pv[1] if len(pv) > 1 else None, info)
+
+    def record_iteration(self, turn: chess.Color, depth: int, score: int, pv: list[chess.Move], start: float) -> None:
+        """
+        Add the info of a completed iteration to `iterations`, and its nodes to the statistics.
+
+        :param turn: The side to move at the root.
+        :param depth: The depth of the iteration.
+        :param score: The score of the iteration for the side to move.
+        :param pv: The principal variation.
+        :param start: When the search started.
+        """
+        elapsed = time.perf_counter() - start
+        self.statistics.iteration_nodes.append(self.nodes - sum(self.statistics.iteration_nodes))
+        info: chess.engine.InfoDict = {"depth": depth,
+                                       "score": pov_score(score, turn),
+                                       "pv": pv,
+                                       "nodes": self.nodes,
+                                       "nps": int(self.nodes / elapsed) if elapsed > 0 else self.nodes,
+                                       "time": elapsed,
+                                       "hashfull": self.table.hashfull()}
+        self.iterations.append(info)
+        logger.debug(f"Depth {depth}: score {score} pv {' '.join(move.uci() for move in pv)} "
+                     f"({self.nodes} nodes, {elapsed:.2f}s, pawn table hit rate {self.pawn_table.hit_rate():.1%})")
+
+    def is_last_iteration(self, score: int) -> bool:
+        """Whether no new iteration starts after one with `score`: a mate is found or the soft deadline has passed."""
+        if abs(score) > MATE_THRESHOLD:
+            return True
+        return not self.pondering and self.soft_deadline is not None and time.perf_counter() >= self.soft_deadline
+
+    def set_limits(self, board: chess.Board, limit: chess.engine.Limit, start: float) -> None:
+        """Set the deadlines, the node limit and the maximum depth of a search of `board` that starts at `start`."""
+        soft_limit, hard_limit = time_budget(board, limit)
+        self.soft_deadline = start + soft_limit if soft_limit is not None else None
+        self.hard_deadline = start + hard_limit if hard_limit is not None else None
+        self.node_limit = limit.nodes
+        self.max_depth = min(limit.depth or (MAX_DEPTH if hard_limit is not None or limit.nodes else DEFAULT_DEPTH),
+                             MAX_DEPTH)
+
+    def start_ponder(self, board: chess.Board) -> None:
+        """
+        Search `board` in a background thread until `stop_ponder` or `ponderhit` is called.
+
+        The limits are set here, before the thread starts, so that a `ponderhit` right after this call is not lost.
+
+        :param board: The position after the expected reply of the opponent.
+        """
+        self.stop_requested = False
+        self.pondering = True
+        self.soft_deadline = self.hard_deadline = None
+        self.node_limit = None
+        self.max_depth = MAX_DEPTH
+        self.ponder_board = board.copy()
+        self.ponder_result = chess.engine.PlayResult(None, None)
+
+        def ponder() -> None:
+            self.ponder_result = self.run(board, chess.engine.Limit(), limits_set=True)
+
+        self.ponder_thread = threading.Thread(target=ponder, name="ponder", daemon=True)
+        self.ponder_thread.start()
+
+    def ponderhit(self, limit: chess.engine.Limit) -> chess.engine.PlayResult:
+        """
+        Turn the ponder search into a normal search because the opponent played the expected move.
+
+        :param limit: The time limit of the move, counted from now.
+        :return: The result of the search.
+        """
+        if self.ponder_board is not None:
+            self.set_limits(self.ponder_board, limit, time.perf_counter())
+        self.pondering = False
+        self.wait_for_ponder()
+        return self.ponder_result
+
+    def stop_ponder(self) -> None:
+        """Abort the ponder search because the opponent didn't play the expected move."""
+        self.stop_requested = True
+        self.pondering = False
+        self.wait_for_ponder()
+
+    def wait_for_ponder(self) -> None:
+        """Wait until the ponder thread ends."""
+        if self.ponder_thread is not None:
+            self.ponder_thread.join()
+        self.ponder_thread = None
+        self.ponder_board = None
+
+    def aspiration_search(self, board: SearchBoard, depth: int, previous_score: int) -> int:
+        """
+        Search the root with a narrow window around the previous score and widen the window when the score falls outside.
+
+        :return: The exact score of the root.
+        """
+        if depth < 3 or abs(previous_score) > MATE_THRESHOLD:
+            return self.search_root(board, depth, -INFINITY, INFINITY)
+
+        window = ASPIRATION_WINDOW
+        alpha, beta = previous_score - window, previous_score + window
+        while True:
+            score = self.search_root(board, depth, alpha, beta)
+            if score <= alpha:
+                alpha = max(score - window, -INFINITY)
+            elif score >= beta:
+                beta = min(score + window, INFINITY)
+            else:
+                return score
+            window *= 2
+
+    def search_root(self, board: SearchBoard, depth: int, alpha: int, beta: int) -> int:
+        """
+        Search all the root moves to a fixed depth. The best line is stored in `self.pv[0]`.
+
+        :return: The score of the root. Like in `negamax`, it is only exact if it is between alpha and beta.
+        """
+        self.pv[0] = []
+        best_score = -INFINITY
+        for index, move in enumerate(self.root_moves):
+            board.make(move)
+            if index == 0:
+                score = -self.negamax(board, depth - 1, -beta, -alpha, 1)
+            else:
+                score = -self.negamax(board, depth - 1, -alpha - 1, -alpha, 1)
+                if alpha < score < beta:
+                    score = -self.negamax(board, depth - 1, -beta, -alpha, 1)
+            board.unmake()
+
+            best_score = max(best_score, score)
+            if score > alpha:
+                alpha = score
+                self.pv[0] = [move] + self.pv[1] if depth > 1 else [move]
+                if score >= beta:
+                    break
+        return best_score
+
+    def check_limits(self) -> None:
+        """Abort the search if it is stopped, or if the hard deadline or the node limit is reached."""
+        if self.stop_requested:
+            raise SearchTimeout()
+        if self.hard_deadline is not None and time.perf_counter() >= self.hard_deadline:
+            raise SearchTimeout()
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchTimeout()
+
+    def evaluate(self, board: SearchBoard) -> int:
+        """
+        Evaluate a position for the side to move: material, piece placement and pawn structure.
+
+        The pawn structure comes from the pawn table, so it is only computed when the pawns change.
+        """
+        start = time.perf_counter()
+        pawns = board.pieces
+        structure = self.pawn_table.probe(board.pawn_key, pawns[chess.PAWN], pawns[chess.PAWN + BLACK_PIECE])
+        pair = board.score + structure.score
+        if structure.passed[chess.WHITE] | structure.passed[chess.BLACK]:
+            pair += blocked_passed_pawns(structure.passed, board.occupied[0] | board.occupied[1])
+        score = taper(pair, board.phase)
+        statistics = self.statistics
+        statistics.evaluations += 1
+        statistics.evaluation_time += time.perf_counter() - start
+        return score if board.turn == chess.WHITE else -score
+
+    def generate_moves(self, board: SearchBoard, captures_only: bool = False) -> list[int]:
+        """Generate the pseudo-legal moves of `board` (see `SearchBoard.generate_moves`) and time it."""
+        start = time.perf_counter()
+        moves = board.generate_moves(captures_only)
+        statistics = self.statistics
+        statistics.move_generations += 1
+        statistics.move_generation_time += time.perf_counter() - start
+        return moves
+
+    def is_draw(self, board: SearchBoard) -> bool:
+        """Check for draws by repetition, the fifty-move rule or insufficient material."""
+        reversible_plies = board.halfmove_clock
+        if reversible_plies >= 100:
+            return True
+        if reversible_plies >= 4 and board.key in self.key_history[-reversible_plies:]:
+            return True
+        return board.piece_count() <= 4 and board.is_insufficient_material()
+
+    def negamax(self, board: SearchBoard, depth: int, alpha: int, beta: int, ply: int, allow_null: bool = True) -> int:
+        """
+        Search a position with a principal variation search.
+
+        The first move is searched with the full window and the other moves with a null window, which is
+        opened again if a move turns out to be better than the first one. Quiet moves late in the move order
+        are searched to a reduced depth first, and only searched again if they beat alpha.
+
+        :param ply: The distance from the root.
+        :param allow_null: Whether null-move pruning may be tried. It isn't tried twice in a row.
+        :return: The score for the side to move. It is an upper bound if it is at most alpha and a lower bound
+            if it is at least beta.
+        """
+        selectivity = self.selectivity
+        in_check = board.in_check()
+        if in_check and selectivity.check_extensions:
+            depth += 1
+        if depth <= 0:
+            return self.quiescence(board, alpha, beta, ply)
+        if ply >= MAX_DEPTH:
+            return self.evaluate(board)
+        self.nodes += 1
+        self.check_limits()
+        self.pv[ply] = []
+
+        key = board.key
+        if self.is_draw(board):
+            return 0
+
+        entry = self.probe_table(key, depth)
+        table_score = self.table_cutoff(entry, depth, alpha, beta, ply)
+        if table_score is not None:
+            return table_score
+
+        self.key_history.append(key)
+        if selectivity.null_move and allow_null and not in_check and beta - alpha == 1:
+            null_score = self.null_move_search(board, depth, beta, ply)
+            if null_score is not None:
+                self.key_history.pop()
+                return null_score
+
+        best_score, best_move = self.search_moves(board, depth, alpha, beta, ply, in_check, entry)
+        self.key_history.pop()
+
+        if not best_move:
+            # No legal moves: checkmate or stalemate.
+            return -(MATE_SCORE - ply) if in_check else 0
+        self.store_result(key, depth, alpha, beta, ply, best_score, best_move)
+        return best_score
+
+    def search_moves(self, board: SearchBoard, depth: int, alpha: int, beta: int, ply: int, in_check: bool,
+                     entry: Optional[TableEntry]) -> tuple[int, int]:
+        """
+        Search the moves of a position in the order of the move orderer, for `negamax`.
+
+        :param in_check: Whether the side to move is in check. Moves out of check are never reduced.
+        :param entry: The transposition table entry of the position, whose move is searched first.
+        :return: The best score and the best move, which is 0 if there are no legal moves.
+        """
+        best_score = -INFINITY
+        best_move = 0
+        index = -1
+        moves = self.generate_moves(board)
+        for move in self.orderer.ordered_moves(board, moves, entry.move if entry is not None else 0, ply):
+            quiet = not in_check and not promotion(move) and not board.is_capture(move)
+            if not board.make(move):
+                continue
+            index += 1
+            if index == 0:
+                score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                score = self.search_late_move(board, depth, alpha, beta, ply, index, quiet)
+            board.unmake()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+                self.pv[ply] = [move] + self.pv[ply + 1] if depth > 1 else [move]
+                if score >= beta:
+                    self.orderer.cutoff(board, move, depth, ply)
+                    self.statistics.beta_cutoffs += 1
+                    self.statistics.first_move_cutoffs += index == 0
+                    break
+        return best_score, best_move
+
+    def probe_table(self, key: int, depth: int) -> Optional[TableEntry]:
+        """
+        Find a position in the transposition table or, for deep enough searches, in the persistent table.
+
+        :param key: The Zobrist key of the position.
+        :param depth: The remaining depth of the search.
+        :return: The stored result, or None if the position is in neither table.
+        """
+        statistics = self.statistics
+        statistics.table_probes += 1
+        entry = self.table.probe(key)
+        if entry is None and self.persistent is not None and depth >= PERSISTENT_MIN_DEPTH:
+            entry = self.persistent.probe(key)
+            statistics.persistent_hits += entry is not None
+        if entry is not None:
+            statistics.table_hits += 1
+        return entry
+
+    def table_cutoff(self, entry: Optional[TableEntry], depth: int, alpha: int, beta: int, ply: int) -> Optional[int]:
+        """
+        Check if the stored result of a position is enough to return without searching it.
+
+        Positions searched with an open window don't return early, so that the principal variation stays complete.
+
+        :return: The stored score, or None if the position must be searched.
+        """
+        if entry is None or entry.depth < depth or beta - alpha != 1:
+            return None
+        score = score_from_table(entry.score, ply)
+        if (entry.bound == Bound.EXACT
+                or entry.bound == Bound.LOWER and score >= beta
+                or entry.bound == Bound.UPPER and score <= alpha):
+            self.statistics.table_cutoffs += 1
+            return score
+        return None
+
+    def store_result(self, key: int, depth: int, alpha: int, beta: int, ply: int, best_score: int, best_move: int) -> None:
+        """Store the result of `negamax` in the transposition table, with its bound from the original window."""
+        if best_score <= alpha:
+            bound = Bound.UPPER
+        elif best_score >= beta:
+            bound = Bound.LOWER
+        else:
+            bound = Bound.EXACT
+        self.table.store(key, depth, bound, score_to_table(best_score, ply), best_move)
+
+    def null_move_search(self, board: SearchBoard, depth: int, beta: int, ply: int) -> Optional[int]:
+        """
+        Try null-move pruning: pass, and search the position to a reduced depth.
+
+        If the opponent still can't get below beta, the position is very likely good enough without searching it.
+
+        :return: The score to return from `negamax`, or None if the position must be searched.
+        """
+        if (depth < NULL_MOVE_REDUCTION + 1 or abs(beta) >= MATE_THRESHOLD or not board.has_non_pawn_material()
+                or self.evaluate(board) < beta):
+            return None
+        reduction = NULL_MOVE_REDUCTION + (depth >= NULL_MOVE_DEEP_DEPTH)
+        board.make_null()
+        score = -self.negamax(board, depth - 1 - reduction, -beta, -beta + 1, ply + 1, False)
+        board.unmake()
+        if score < beta:
+            return None
+        # A mate found after passing is not a real mate.
+        return beta if score > MATE_THRESHOLD else score
+
+    def search_late_move(self, board: SearchBoard, depth: int, alpha: int, beta: int, ply: int, index: int,
+                         quiet: bool) -> int:
+        """
+        Search a move after the first one, which has just been made on `board`, with a null window.
+
+        A quiet move late in the move order is searched to a reduced depth first, and searched again to the full
+        depth if it beats alpha. A move that lands between alpha and beta is searched again with the full window.
+
+        :param index: The number of legal moves searched before this one.
+        :param quiet: Whether the move is not a capture or promotion, and wasn't played out of check.
+        :return: The score of the move for the side that played it.
+        """
+        reduction = 0
+        if (self.selectivity.late_move_reductions and quiet and index >= LMR_MIN_MOVE and depth >= LMR_MIN_DEPTH
+                and not board.in_check()):
+            reduction = min(1 + (index >= LMR_DEEP_MOVE), depth - 2)
+        score = -self.negamax(board, depth - 1 - reduction, -alpha - 1, -alpha, ply + 1)
+        if reduction and score > alpha:
+            score = -self.negamax(board, depth - 1, -alpha - 1, -alpha, ply + 1)
+        if alpha < score < beta:
+            score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+        return score
+
+    def quiescence(self, board: SearchBoard, alpha: int, beta: int, ply: int) -> int:
+        """
+        Search only the captures of a position, or all the moves when in check, until the position is quiet.
+
+        The side to move may also stand pat (keep the static evaluation) when not in check. Two of its pieces
+        attacked at once can't both be saved, so the smaller loss is taken off a stand pat score that would cause
+        a cutoff. Captures that lose material in the static exchange evaluation are not searched.
+
+        :param ply: The distance from the root.
+        :return: The score for the side to move.
+        """
+        self.nodes += 1
+        self.statistics.quiescence_nodes += 1
+        self.check_limits()
+        in_check = board.in_check()
+        if in_check:
+            moves = self.orderer.sort(board, self.generate_moves(board), ply)
+            stand_pat = best_score = -INFINITY
+        else:
+            stand_pat = best_score = self.stand_pat(board, beta)
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+            moves = self.orderer.sort(board, self.generate_moves(board, captures_only=True), ply)
+
+        for move in moves:
+            if not in_check and self.is_futile_capture(board, move, stand_pat, alpha):
+                continue
+            if not board.make(move):
+                continue
+            score = -self.quiescence(board, -beta, -alpha, ply + 1)
+            board.unmake()
+
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        break
+        if best_score == -INFINITY:
+            # In check without legal moves.
+            return -(MATE_SCORE - ply)
+        return best_score
+
+    def stand_pat(self, board: SearchBoard, beta: int) -> int:
+        """
+        Get the score of a position for the side to move if it makes no capture.
+
+        The loss of a forked piece is only looked for when the static evaluation would cause a cutoff, because it
+        could stop the cutoff.
+        """
+        stand_pat = self.evaluate(board)
+        if stand_pat >= beta:
+            start = time.perf_counter()
+            stand_pat -= board.hanging_material()
+            self.statistics.evaluation_time += time.perf_counter() - start
+        return stand_pat
+
+    def is_futile_capture(self, board: SearchBoard, move: int, stand_pat: int, alpha: int) -> bool:
+        """
+        Whether a capture in the quiescence search is skipped.
+
+        It is skipped if winning the captured piece plus `DELTA_MARGIN` can't bring the stand pat score back to
+        alpha, or if it loses material in the static exchange evaluation. Promotions are always searched.
+        """
+        if promotion(move):
+            return False
+        squares = board.squares
+        if stand_pat + PIECE_VALUES[squares[to_square(move)] & 7 or chess.PAWN] + DELTA_MARGIN <= alpha:
+            return True
+        return (SEE_VALUES[squares[from_square(move)] & 7] > SEE_VALUES[squares[to_square(move)] & 7]
+                and board.see(move) < 0)
+
+
+def order_root_moves(board: chess.Board, moves: list[chess.Move]) -> list[chess.Move]:
+    """
+    Sort the root moves by the static score of the position after each move, best first.
+
+    Iterative deepening only moves the best move of each iteration to the front, so this order is kept for
+    the other moves. All the positions are scored in one batch.
+    """
+    if len(moves) <= 1:
+        return moves
+    scores = score_moves(board, moves)
+    return [moves[index] for index in np.argsort(-scores, kind="stable")]
+
+
+def game_keys(board: chess.Board) -> list[int]:
+    """Get the Zobrist keys of the positions since the last capture or pawn move, ending with the current position."""
+    board = board.copy()
+    keys = [chess.polyglot.zobrist_hash(board)]
+    for _ in range(min(board.halfmove_clock, len(board.move_stack))):
+        board.pop()
+        keys.append(chess.polyglot.zobrist_hash(board))
+    keys.reverse()
+    return keys
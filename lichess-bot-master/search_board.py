@@ -0,0 +1,792 @@
+"""
+A compact board for the hot loop of the homemade search in `search.py`.
+
+`chess.Board.push` saves a copy of the board state and `legal_moves` creates a `chess.Move` for every move.
+This board keeps a 64-square mailbox of small ints next to piece and color bitboards, packs moves into ints,
+and saves the undo information in preallocated lists indexed by ply, so making and taking back a move allocates
+almost nothing. The Zobrist keys, the material and placement scores and the game phase are updated with each move.
+
+It only converts from and to `chess.Board` and `chess.Move` at the root of a search. Standard chess and
+Chess960 are supported.
+"""
+from __future__ import annotations
+import chess
+import chess.polyglot
+from evaluation import PHASE_WEIGHTS, PIECE_SQUARE_SCORES, PIECE_VALUES, taper
+from typing import Optional
+
+# A piece is `piece_type + BLACK_PIECE` for black and `piece_type` for white. Empty squares are 0.
+EMPTY = 0
+BLACK_PIECE = 8
+
+# A move is `from_square | to_square << 6 | promotion << 12 | flag << 15`.
+NULL_MOVE = 0
+DOUBLE_PUSH = 1
+EN_PASSANT = 2
+# Castling moves are encoded as the king moving to the square of the rook, like Chess960 moves in python-chess.
+CASTLING = 3
+
+MAX_PLY = 256
+
+PROMOTIONS = [chess.QUEEN, chess.KNIGHT, chess.ROOK, chess.BISHOP]
+
+
+def encode(from_square: int, to_square: int, promotion: int = 0, flag: int = 0) -> int:
+    """Pack a move into an int."""
+    return from_square | to_square << 6 | promotion << 12 | flag << 15
+
+
+def from_square(move: int) -> int:
+    """Get the square a move starts from."""
+    return move & 63
+
+
+def to_square(move: int) -> int:
+    """Get the square a move goes to. For castling, this is the square of the rook."""
+    return move >> 6 & 63
+
+
+def promotion(move: int) -> int:
+    """Get the piece type a move promotes to, or 0."""
+    return move >> 12 & 7
+
+
+def _targets(square: int, steps: list[tuple[int, int]]) -> list[int]:
+    """Get the squares one step away from `square` in each direction of `steps` ((file, rank) pairs)."""
+    file, rank = chess.square_file(square), chess.square_rank(square)
+    return [chess.square(file + df, rank + dr) for df, dr in steps if 0 <= file + df < 8 and 0 <= rank + dr < 8]
+
+
+def _rays(square: int, directions: list[tuple[int, int]]) -> list[list[int]]:
+    """Get the squares from `square` to the edge of the board in each direction, nearest first."""
+    rays = []
+    for df, dr in directions:
+        ray = []
+        file, rank = chess.square_file(square) + df, chess.square_rank(square) + dr
+        while 0 <= file < 8 and 0 <= rank < 8:
+            ray.append(chess.square(file, rank))
+            file, rank = file + df, rank + dr
+        if ray:
+            rays.append(ray)
+    return rays
+
+
+def _mask(squares: list[int]) -> int:
+    """Get the bitboard of `squares`."""
+    mask = 0
+    for square in squares:
+        mask |= 1 << square
+    return mask
+
+
+KNIGHT_STEPS = [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
+KING_STEPS = [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1)]
+ORTHOGONAL = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+DIAGONAL = [(1, 1), (1, -1), (-1, -1), (-1, 1)]
+
+KNIGHT_TARGETS = [_targets(square, KNIGHT_STEPS) for square in chess.SQUARES]
+KING_TARGETS = [_targets(square, KING_STEPS) for square in chess.SQUARES]
+ORTHOGONAL_RAYS = [_rays(square, ORTHOGONAL) for square in chess.SQUARES]
+DIAGONAL_RAYS = [_rays(square, DIAGONAL) for square in chess.SQUARES]
+# PAWN_CAPTURES[side][square] are the squares a pawn of `side` (0 for white, 1 for black) on `square` attacks.
+PAWN_CAPTURES = [[_targets(square, [(-1, 1), (1, 1)]) for square in chess.SQUARES],
+                 [_targets(square, [(-1, -1), (1, -1)]) for square in chess.SQUARES]]
+
+KNIGHT_MASKS = [_mask(targets) for targets in KNIGHT_TARGETS]
+KING_MASKS = [_mask(targets) for targets in KING_TARGETS]
+ORTHOGONAL_MASKS = [_mask([square for ray in rays for square in ray]) for rays in ORTHOGONAL_RAYS]
+DIAGONAL_MASKS = [_mask([square for ray in rays for square in ray]) for rays in DIAGONAL_RAYS]
+PAWN_CAPTURE_MASKS = [[_mask(targets) for targets in PAWN_CAPTURES[side]] for side in range(2)]
+
+# PIECE_SCORES[piece][square] are the packed middlegame and endgame scores (see `evaluation.score_pair`)
+# of `piece` on `square` from white's point of view.
+PIECE_SCORES = [[0] * 64 for _ in range(16)]
+# PIECE_PHASES[piece] is the game phase weight of `piece`.
+PIECE_PHASES = [0] * 16
+for _piece_type in chess.PIECE_TYPES:
+    PIECE_SCORES[_piece_type] = PIECE_SQUARE_SCORES[chess.WHITE][_piece_type]
+    PIECE_SCORES[_piece_type + BLACK_PIECE] = PIECE_SQUARE_SCORES[chess.BLACK][_piece_type]
+    PIECE_PHASES[_piece_type] = PIECE_PHASES[_piece_type + BLACK_PIECE] = PHASE_WEIGHTS[_piece_type]
+
+# PIECE_KEYS[piece][square] is the polyglot Zobrist key of `piece` on `square`, so keys match `chess.polyglot`.
+PIECE_KEYS = [[0] * 64 for _ in range(16)]
+for _piece_type in chess.PIECE_TYPES:
+    for _square in chess.SQUARES:
+        PIECE_KEYS[_piece_type][_square] = chess.polyglot.POLYGLOT_RANDOM_ARRAY[
+            64 * ((_piece_type - 1) * 2 + 1) + _square]
+        PIECE_KEYS[_piece_type + BLACK_PIECE][_square] = chess.polyglot.POLYGLOT_RANDOM_ARRAY[
+            64 * ((_piece_type - 1) * 2) + _square]
+# PAWN_KEYS[piece][square] is the same for pawns and 0 for the other pieces, so the pawn key can be updated
+# without checking the piece type.
+PAWN_KEYS = [PIECE_KEYS[piece] if piece & 7 == chess.PAWN else [0] * 64 for piece in range(16)]
+CASTLING_KEYS = chess.polyglot.POLYGLOT_RANDOM_ARRAY[768:772]
+EN_PASSANT_KEYS = chess.polyglot.POLYGLOT_RANDOM_ARRAY[772:780]
+TURN_KEY = chess.polyglot.POLYGLOT_RANDOM_ARRAY[780]
+
+LIGHT_SQUARES = chess.BB_LIGHT_SQUARES
+DARK_SQUARES = chess.BB_DARK_SQUARES
+
+# The piece values of the static exchange evaluation. The king is worth more than everything else together, so
+# the exchange ends before the king would be captured.
+SEE_VALUES = PIECE_VALUES[:chess.KING] + [20000]
+# The most pieces that can take part in an exchange on one square, plus the first capture.
+MAX_EXCHANGE = 34
+
+
+def generate_step_moves(start: int, targets: list[int], targets_allowed: int, moves: list[int]) -> None:
+    """Add the moves of the knight or king on `start` to the squares of `targets` in the `targets_allowed` bitboard."""
+    for target in targets:
+        if targets_allowed >> target & 1:
+            moves.append(start | target << 6)
+
+
+class SearchBoard:
+    """
+    A position that the search changes with `make` and `unmake`.
+
+    `squares` is the mailbox, `pieces[piece]` the bitboard of each piece and `occupied[color]` the bitboard of
+    each color, indexed by 0 for white and 1 for black. `turn` is the `chess.Color` to move. `score` holds the
+    packed middlegame and endgame scores, which `evaluate` blends by `phase`. `key` is the polyglot Zobrist hash
+    of the position and `pawn_key` the part of it that comes from the pawns.
+    """
+
+    __slots__ = ("squares", "pieces", "occupied", "turn", "castling", "ep_square", "halfmove_clock", "key", "pawn_key",
+                 "score", "phase", "king_squares", "chess960", "ply", "castling_key_cache",
+                 "undo_move", "undo_captured", "undo_castling", "undo_ep_square", "undo_halfmove_clock", "undo_key",
+                 "undo_pawn_key", "undo_score", "undo_phase")
+
+    def __init__(self, board: chess.Board) -> None:
+        """:param board: The position at the root of the search."""
+        self.squares = [EMPTY] * 64
+        self.pieces = [0] * 16
+        self.occupied = [0, 0]
+        for square, piece in board.piece_map().items():
+            code = piece.piece_type + (0 if piece.color == chess.WHITE else BLACK_PIECE)
+            self.squares[square] = code
+            self.pieces[code] |= 1 << square
+            self.occupied[0 if piece.color == chess.WHITE else 1] |= 1 << square
+        self.turn = board.turn
+        self.castling = board.clean_castling_rights()
+        self.ep_square = board.ep_square
+        self.halfmove_clock = board.halfmove_clock
+        self.chess960 = board.chess960
+        self.king_squares = [(self.pieces[chess.KING] & -self.pieces[chess.KING]).bit_length() - 1,
+                             (self.pieces[chess.KING + BLACK_PIECE]
+                              & -self.pieces[chess.KING + BLACK_PIECE]).bit_length() - 1]
+        self.castling_key_cache: dict[int, int] = {}
+        self.score = sum(PIECE_SCORES[piece][square] for square, piece in enumerate(self.squares))
+        self.phase = sum(PIECE_PHASES[piece] for piece in self.squares)
+        self.key = chess.polyglot.zobrist_hash(board)
+        self.pawn_key = 0
+        for square, code in enumerate(self.squares):
+            self.pawn_key ^= PAWN_KEYS[code][square]
+
+        self.ply = 0
+        self.undo_move = [0] * MAX_PLY
+        self.undo_captured = [0] * MAX_PLY
+        self.undo_castling = [0] * MAX_PLY
+        self.undo_ep_square: list[Optional[int]] = [None] * MAX_PLY
+        self.undo_halfmove_clock = [0] * MAX_PLY
+        self.undo_key = [0] * MAX_PLY
+        self.undo_pawn_key = [0] * MAX_PLY
+        self.undo_score = [0] * MAX_PLY
+        self.undo_phase = [0] * MAX_PLY
+
+    def to_board(self) -> chess.Board:
+        """Convert the current position to a `chess.Board` without move history."""
+        board = chess.Board(None, chess960=self.chess960)
+        for square, code in enumerate(self.squares):
+            if code:
+                board.set_piece_at(square, chess.Piece(code & 7, code < BLACK_PIECE))
+        board.turn = self.turn
+        board.castling_rights = self.castling
+        board.ep_square = self.ep_square
+        board.halfmove_clock = self.halfmove_clock
+        return board
+
+    def to_move(self, move: int) -> chess.Move:
+        """Convert a move to a `chess.Move` in the notation of the root board (standard or Chess960)."""
+        start = move & 63
+        target = move >> 6 & 63
+        if move >> 15 == CASTLING and not self.chess960:
+            target = (start & ~7) + (6 if target > start else 2)
+        return chess.Move(start, target, (move >> 12 & 7) or None)
+
+    def from_move(self, move: chess.Move) -> Optional[int]:
+        """Convert a `chess.Move` to a move of this board, or None if it is not legal."""
+        for candidate in self.legal_moves():
+            if self.to_move(candidate) == move:
+                return candidate
+        return None
+
+    def legal_moves(self) -> list[int]:
+        """Get all the legal moves. This makes every move, so it is meant for the root, not for the search."""
+        legal = []
+        for move in self.generate_moves():
+            if self.make(move):
+                self.unmake()
+                legal.append(move)
+        return legal
+
+    def in_check(self) -> bool:
+        """Check if the side to move is in check."""
+        side = 0 if self.turn else 1
+        return self.attacked(self.king_squares[side], 1 - side)
+
+    def attacked(self, square: int, by: int) -> bool:
+        """
+        Check if `square` is attacked by a side.
+
+        :param square: The square.
+        :param by: The attacking side: 0 for white and 1 for black.
+        """
+        offset = by * BLACK_PIECE
+        pieces = self.pieces
+        if KNIGHT_MASKS[square] & pieces[chess.KNIGHT + offset]:
+            return True
+        if KING_MASKS[square] & pieces[chess.KING + offset]:
+            return True
+        # A white pawn attacks `square` from the squares a black pawn on `square` would attack, and vice versa.
+        if PAWN_CAPTURE_MASKS[1 - by][square] & pieces[chess.PAWN + offset]:
+            return True
+        queen = chess.QUEEN + offset
+        if self.attacked_along(ORTHOGONAL_RAYS[square], ORTHOGONAL_MASKS[square], chess.ROOK + offset, queen):
+            return True
+        return self.attacked_along(DIAGONAL_RAYS[square], DIAGONAL_MASKS[square], chess.BISHOP + offset, queen)
+
+    def attacked_along(self, rays: list[list[int]], mask: int, slider: int, queen: int) -> bool:
+        """
+        Check if the first piece on one of the rays from a square is an attacking slider.
+
+        :param rays: The rays from the square, nearest square first.
+        :param mask: The bitboard of all the squares of the rays. The rays are only followed if a slider is on one.
+        :param slider: The attacking rook (for orthogonal rays) or bishop (for diagonal rays).
+        :param queen: The attacking queen.
+        """
+        if not mask & (self.pieces[slider] | self.pieces[queen]):
+            return False
+        squares = self.squares
+        for ray in rays:
+            for target in ray:
+                piece = squares[target]
+                if piece:
+                    if piece == slider or piece == queen:
+                        return True
+                    break
+        return False
+
+    def generate_moves(self, captures_only: bool = False) -> list[int]:
+        """
+        Generate the pseudo-legal moves. `make` rejects the ones that leave the king in check.
+
+        :param captures_only: Only generate captures (for the quiescence search).
+        """
+        moves: list[int] = []
+        squares = self.squares
+        side = 0 if self.turn else 1
+        own = self.occupied[side]
+        enemy = self.occupied[1 - side]
+        targets_allowed = enemy if captures_only else ~own
+
+        bitboard = own
+        while bitboard:
+            bit = bitboard & -bitboard
+            bitboard ^= bit
+            start = bit.bit_length() - 1
+            piece_type = squares[start] & 7
+
+            if piece_type == chess.PAWN:
+                self.generate_pawn_moves(start, side, enemy, captures_only, moves)
+            elif piece_type == chess.KNIGHT:
+                generate_step_moves(start, KNIGHT_TARGETS[start], targets_allowed, moves)
+            elif piece_type == chess.KING:
+                generate_step_moves(start, KING_TARGETS[start], targets_allowed, moves)
+            else:
+                if piece_type != chess.BISHOP:
+                    self.generate_slider_moves(start, ORTHOGONAL_RAYS[start], enemy, captures_only, moves)
+                if piece_type != chess.ROOK:
+                    self.generate_slider_moves(start, DIAGONAL_RAYS[start], enemy, captures_only, moves)
+
+        if not captures_only and self.castling & own:
+            self.generate_castling_moves(side, moves)
+        return moves
+
+    def generate_slider_moves(self, start: int, rays: list[list[int]], enemy: int, captures_only: bool,
+                              moves: list[int]) -> None:
+        """Add the moves of the rook, bishop or queen on `start` along `rays` (nearest square first) to `moves`."""
+        squares = self.squares
+        append = moves.append
+        for ray in rays:
+            for target in ray:
+                if squares[target]:
+                    if enemy >> target & 1:
+                        append(start | target << 6)
+                    break
+                if not captures_only:
+                    append(start | target << 6)
+
+    def generate_pawn_moves(self, start: int, side: int, enemy: int, captures_only: bool, moves: list[int]) -> None:
+        """Add the moves of the pawn on `start` to `moves`."""
+        squares = self.squares
+        forward = 8 if side == 0 else -8
+        target = start + forward
+        last_rank = target >> 3 == (7 if side == 0 else 0)
+        if not captures_only and not squares[target]:
+            if last_rank:
+                moves.extend(start | target << 6 | promotion << 12 for promotion in PROMOTIONS)
+            else:
+                moves.append(start | target << 6)
+                if start >> 3 == (1 if side == 0 else 6) and not squares[target + forward]:
+                    moves.append(start | (target + forward) << 6 | DOUBLE_PUSH << 15)
+
+        for target in PAWN_CAPTURES[side][start]:
+            if enemy >> target & 1:
+                if last_rank:
+                    moves.extend(start | target << 6 | promotion << 12 for promotion in PROMOTIONS)
+                else:
+                    moves.append(start | target << 6)
+            elif target == self.ep_square:
+                moves.append(start | target << 6 | EN_PASSANT << 15)
+
+    def generate_castling_moves(self, side: int, moves: list[int]) -> None:
+        """Add the castling moves to `moves`. Checks and attacked squares are tested here, the rest in `make`."""
+        king = self.king_squares[side]
+        back_rank = chess.BB_RANK_1 if side == 0 else chess.BB_RANK_8
+        if not (1 << king) & back_rank or self.attacked(king, 1 - side):
+            return
+
+        occupied = self.occupied[0] | self.occupied[1]
+        rights = self.castling & back_rank & self.occupied[side]
+        while rights:
+            bit = rights & -rights
+            rights ^= bit
+            rook = bit.bit_length() - 1
+            king_to, rook_to = castling_squares(king, rook)
+            path = _between_inclusive(king, king_to) | _between_inclusive(rook, rook_to)
+            if (occupied & ~(1 << king) & ~(1 << rook)) & path:
+                continue
+            if any(self.attacked(square, 1 - side) for square in chess.scan_forward(_between_inclusive(king, king_to))
+                   if square != king):
+                continue
+            moves.append(king | rook << 6 | CASTLING << 15)
+
+    def make(self, move: int) -> bool:
+        """
+        Play a pseudo-legal move.
+
+        :return: False if the move left the own king in check. The move is then already taken back.
+        """
+        ply = self.ply
+        self.undo_move[ply] = move
+        self.undo_castling[ply] = self.castling
+        self.undo_ep_square[ply] = self.ep_square
+        self.undo_halfmove_clock[ply] = self.halfmove_clock
+        self.undo_key[ply] = self.key
+        self.undo_pawn_key[ply] = self.pawn_key
+        self.undo_score[ply] = self.score
+        self.undo_phase[ply] = self.phase
+        self.ply = ply + 1
+
+        squares = self.squares
+        pieces = self.pieces
+        occupied = self.occupied
+        side = 0 if self.turn else 1
+        start = move & 63
+        target = move >> 6 & 63
+        flag = move >> 15
+        piece = squares[start]
+        key = self.key ^ TURN_KEY ^ self.ep_key()
+        score = self.score
+        castling = self.castling
+        if castling:
+            # The rights are told apart by the side of the king the rook is on, so this goes before the king moves.
+            key ^= self.castling_key(castling)
+
+        if flag == CASTLING:
+            king_to, rook_to = castling_squares(start, target)
+            rook = squares[target]
+            self.undo_captured[ply] = EMPTY
+            squares[start] = squares[target] = EMPTY
+            squares[king_to] = piece
+            squares[rook_to] = rook
+            # In Chess960 the king or the rook may stay where it is, so the bits are toggled one by one.
+            pieces[piece] ^= 1 << start ^ 1 << king_to
+            pieces[rook] ^= 1 << target ^ 1 << rook_to
+            occupied[side] ^= 1 << start ^ 1 << king_to ^ 1 << target ^ 1 << rook_to
+            key ^= (PIECE_KEYS[piece][start] ^ PIECE_KEYS[piece][king_to]
+                    ^ PIECE_KEYS[rook][target] ^ PIECE_KEYS[rook][rook_to])
+            score += (PIECE_SCORES[piece][king_to] - PIECE_SCORES[piece][start]
+                      + PIECE_SCORES[rook][rook_to] - PIECE_SCORES[rook][target])
+            self.king_squares[side] = king_to
+            self.halfmove_clock += 1
+            self.ep_square = None
+        else:
+            captured = squares[target]
+            if flag == EN_PASSANT:
+                capture_square = target - 8 if side == 0 else target + 8
+                captured = squares[capture_square]
+                squares[capture_square] = EMPTY
+            else:
+                capture_square = target
+            self.undo_captured[ply] = captured
+            if captured:
+                pieces[captured] ^= 1 << capture_square
+                occupied[1 - side] ^= 1 << capture_square
+                key ^= PIECE_KEYS[captured][capture_square]
+                self.pawn_key ^= PAWN_KEYS[captured][capture_square]
+                score -= PIECE_SCORES[captured][capture_square]
+                self.phase -= PIECE_PHASES[captured]
+
+            if move >> 12 & 7:
+                new_piece = (move >> 12 & 7) + side * BLACK_PIECE
+                self.phase += PIECE_PHASES[new_piece]
+            else:
+                new_piece = piece
+            squares[start] = EMPTY
+            squares[target] = new_piece
+            pieces[piece] ^= 1 << start
+            pieces[new_piece] ^= 1 << target
+            occupied[side] ^= 1 << start | 1 << target
+            key ^= PIECE_KEYS[piece][start] ^ PIECE_KEYS[new_piece][target]
+            self.pawn_key ^= PAWN_KEYS[piece][start] ^ PAWN_KEYS[new_piece][target]
+            score += PIECE_SCORES[new_piece][target] - PIECE_SCORES[piece][start]
+
+            piece_type = piece & 7
+            if piece_type == chess.KING:
+                self.king_squares[side] = target
+            self.halfmove_clock = 0 if captured or piece_type == chess.PAWN else self.halfmove_clock + 1
+            self.ep_square = (start + target) >> 1 if flag == DOUBLE_PUSH else None
+
+        if castling:
+            if piece & 7 == chess.KING:
+                castling &= ~(chess.BB_RANK_1 if side == 0 else chess.BB_RANK_8)
+            castling &= ~(1 << start | 1 << target)
+            key ^= self.castling_key(castling)
+            self.castling = castling
+
+        self.turn = not self.turn
+        self.key = key ^ self.ep_key()
+        self.score = score
+
+        if self.attacked(self.king_squares[side], 1 - side):
+            self.unmake()
+            return False
+        return True
+
+    def unmake(self) -> None:
+        """Take back the last move made with `make`."""
+        self.ply -= 1
+        ply = self.ply
+        move = self.undo_move[ply]
+        self.turn = not self.turn
+        self.castling = self.undo_castling[ply]
+        self.ep_square = self.undo_ep_square[ply]
+        self.halfmove_clock = self.undo_halfmove_clock[ply]
+        self.key = self.undo_key[ply]
+        self.pawn_key = self.undo_pawn_key[ply]
+        self.score = self.undo_score[ply]
+        self.phase = self.undo_phase[ply]
+        if not move:
+            return
+
+        squares = self.squares
+        pieces = self.pieces
+        occupied = self.occupied
+        side = 0 if self.turn else 1
+        start = move & 63
+        target = move >> 6 & 63
+        flag = move >> 15
+
+        if flag == CASTLING:
+            king_to, rook_to = castling_squares(start, target)
+            piece = squares[king_to]
+            rook = squares[rook_to]
+            squares[king_to] = squares[rook_to] = EMPTY
+            squares[start] = piece
+            squares[target] = rook
+            pieces[piece] ^= 1 << start ^ 1 << king_to
+            pieces[rook] ^= 1 << target ^ 1 << rook_to
+            occupied[side] ^= 1 << start ^ 1 << king_to ^ 1 << target ^ 1 << rook_to
+            self.king_squares[side] = start
+            return
+
+        new_piece = squares[target]
+        piece = chess.PAWN + side * BLACK_PIECE if move >> 12 & 7 else new_piece
+        squares[start] = piece
+        squares[target] = EMPTY
+        pieces[piece] ^= 1 << start
+        pieces[new_piece] ^= 1 << target
+        occupied[side] ^= 1 << start | 1 << target
+        if piece & 7 == chess.KING:
+            self.king_squares[side] = start
+
+        captured = self.undo_captured[ply]
+        if captured:
+            capture_square = (target - 8 if side == 0 else target + 8) if flag == EN_PASSANT else target
+            squares[capture_square] = captured
+            pieces[captured] ^= 1 << capture_square
+            occupied[1 - side] ^= 1 << capture_square
+
+    def make_null(self) -> None:
+        """Pass the turn (for null-move pruning). Take it back with `unmake`."""
+        ply = self.ply
+        self.undo_move[ply] = NULL_MOVE
+        self.undo_castling[ply] = self.castling
+        self.undo_ep_square[ply] = self.ep_square
+        self.undo_halfmove_clock[ply] = self.halfmove_clock
+        self.undo_key[ply] = self.key
+        self.undo_pawn_key[ply] = self.pawn_key
+        self.undo_score[ply] = self.score
+        self.undo_phase[ply] = self.phase
+        self.ply = ply + 1
+        self.key ^= TURN_KEY ^ self.ep_key()
+        self.ep_square = None
+        self.halfmove_clock += 1
+        self.turn = not self.turn
+
+    def ep_key(self) -> int:
+        """Get the part of the key for the en passant square. Like polyglot, it only counts if a pawn can capture."""
+        ep_square = self.ep_square
+        if ep_square is None:
+            return 0
+        side = 0 if self.turn else 1
+        # The capturing pawns stand where a pawn of the other color on the en passant square would attack.
+        if PAWN_CAPTURE_MASKS[1 - side][ep_square] & self.pieces[chess.PAWN + side * BLACK_PIECE]:
+            return EN_PASSANT_KEYS[ep_square & 7]
+        return 0
+
+    def castling_key(self, castling: int) -> int:
+        """Get the part of the key for the castling rights, as kingside and queenside rights of each color."""
+        key = self.castling_key_cache.get(castling)
+        if key is None:
+            key = 0
+            for side, back_rank in enumerate([chess.BB_RANK_1, chess.BB_RANK_8]):
+                king = self.king_squares[side]
+                for rook in chess.scan_forward(castling & back_rank):
+                    key |= 1 << (side * 2 + (0 if rook > king else 1))
+            key = _xor_castling_keys(key)
+            self.castling_key_cache[castling] = key
+        return key
+
+    def evaluate(self) -> int:
+        """Get the material and placement score from white's point of view, like `evaluation.material_and_placement`."""
+        return taper(self.score, self.phase)
+
+    def attackers(self, square: int, occupied: int) -> int:
+        """
+        Get the pieces of both colors that attack `square` if only the squares of `occupied` were occupied.
+
+        Taking pieces out of `occupied` uncovers the sliders behind them (x-rays). Pieces that are not in
+        `occupied` are still returned, so the result should be masked with `occupied`.
+        """
+        pieces = self.pieces
+        return (KNIGHT_MASKS[square] & (pieces[chess.KNIGHT] | pieces[chess.KNIGHT + BLACK_PIECE])
+                | KING_MASKS[square] & (pieces[chess.KING] | pieces[chess.KING + BLACK_PIECE])
+                | PAWN_CAPTURE_MASKS[1][square] & pieces[chess.PAWN]
+                | PAWN_CAPTURE_MASKS[0][square] & pieces[chess.PAWN + BLACK_PIECE]
+                | self.slider_attackers(square, occupied))
+
+    def slider_attackers(self, square: int, occupied: int) -> int:
+        """Get the bishops, rooks and queens of both colors that attack `square`, like `attackers`."""
+        pieces = self.pieces
+        queens = pieces[chess.QUEEN] | pieces[chess.QUEEN + BLACK_PIECE]
+        return ((chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied]
+                 | chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied])
+                & (pieces[chess.ROOK] | pieces[chess.ROOK + BLACK_PIECE] | queens)
+                | chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied]
+                & (pieces[chess.BISHOP] | pieces[chess.BISHOP + BLACK_PIECE] | queens))
+
+    def attacks(self, side: int, occupied: int) -> int:
+        """Get the squares attacked by the pieces of a side (0 for white and 1 for black) with `occupied` occupied."""
+        offset = side * BLACK_PIECE
+        pieces = self.pieces
+        pawns = pieces[chess.PAWN + offset]
+        if side:
+            attacked = pawns >> 9 & ~chess.BB_FILE_H | pawns >> 7 & ~chess.BB_FILE_A
+        else:
+            attacked = (pawns << 7 & ~chess.BB_FILE_H | pawns << 9 & ~chess.BB_FILE_A) & chess.BB_ALL
+        attacked |= KING_MASKS[self.king_squares[side]]
+        for piece_type in (chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN):
+            remaining = pieces[piece_type + offset]
+            while remaining:
+                bit = remaining & -remaining
+                remaining ^= bit
+                square = bit.bit_length() - 1
+                if piece_type == chess.KNIGHT:
+                    attacked |= KNIGHT_MASKS[square]
+                    continue
+                if piece_type != chess.ROOK:
+                    attacked |= chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied]
+                if piece_type != chess.BISHOP:
+                    attacked |= (chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied]
+                                 | chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied])
+        return attacked
+
+    def see(self, move: int) -> int:
+        """
+        Get the material the side to move wins with a capture (static exchange evaluation).
+
+        Both sides keep recapturing on the target square with their least valuable piece for as long as it pays off.
+
+        :param move: A pseudo-legal move. Non-captures are scored as if a piece moves to a possibly attacked square.
+        :return: The material balance of the exchange for the side to move, in `SEE_VALUES`.
+        """
+        if move >> 15 == CASTLING:
+            return 0
+        start = move & 63
+        target = move >> 6 & 63
+        promoted = move >> 12 & 7
+        occupied = (self.occupied[0] | self.occupied[1]) ^ 1 << start
+        if move >> 15 == EN_PASSANT:
+            captured_value = SEE_VALUES[chess.PAWN]
+            occupied ^= 1 << ((target - 8) if self.turn else (target + 8))
+        else:
+            captured_value = SEE_VALUES[self.squares[target] & 7]
+        if promoted:
+            captured_value += SEE_VALUES[promoted] - SEE_VALUES[chess.PAWN]
+        side = 1 if self.turn else 0
+        return self.exchange(target, occupied, self.attackers(target, occupied) & occupied, captured_value,
+                             SEE_VALUES[promoted or self.squares[start] & 7], side)
+
+    def exchange(self, square: int, occupied: int, attackers: int, gain: int, value_on_square: int, side: int) -> int:
+        """
+        Play out the recaptures on `square` after a first capture.
+
+        :param square: The square of the exchange.
+        :param occupied: The occupied squares after the first capture, without the piece that captured.
+        :param attackers: The pieces of `occupied` that attack `square`.
+        :param gain: The value of the piece taken by the first capture.
+        :param value_on_square: The value of the piece that made the first capture and now stands on `square`.
+        :param side: The side to recapture (0 for white, 1 for black).
+        :return: The result of the exchange for the side that made the first capture.
+        """
+        pieces = self.pieces
+        occupied_by = self.occupied
+        gains = [0] * MAX_EXCHANGE
+        gains[0] = gain
+        depth = 0
+        while True:
+            own_attackers = attackers & occupied_by[side]
+            if not own_attackers:
+                break
+            offset = side * BLACK_PIECE
+            for piece_type in chess.PIECE_TYPES:
+                candidates = own_attackers & pieces[piece_type + offset]
+                if candidates:
+                    break
+            depth += 1
+            gains[depth] = value_on_square - gains[depth - 1]
+            value_on_square = SEE_VALUES[piece_type]
+            occupied ^= candidates & -candidates
+            attackers &= occupied
+            # A knight never stands between a slider and the square.
+            if piece_type != chess.KNIGHT:
+                attackers |= self.slider_attackers(square, occupied) & occupied
+            side = 1 - side
+
+        while depth:
+            gains[depth - 1] = -max(-gains[depth - 1], gains[depth])
+            depth -= 1
+        return gains[0]
+
+    def hanging_material(self) -> int:
+        """
+        Get the material the side to move is bound to lose because the opponent threatens to win two pieces.
+
+        Only one of the threatened pieces can be saved with the next move, so this is the smaller of the two
+        largest gains the opponent could make by capturing a knight, bishop, rook or queen.
+        """
+        side = 0 if self.turn else 1
+        opponent = 1 - side
+        offset = side * BLACK_PIECE
+        opponent_offset = opponent * BLACK_PIECE
+        pieces = self.pieces
+        squares = self.squares
+        all_occupied = self.occupied[0] | self.occupied[1]
+        opponent_pieces = self.occupied[opponent]
+        largest = second = 0
+        targets = (pieces[chess.KNIGHT + offset] | pieces[chess.BISHOP + offset]
+                   | pieces[chess.ROOK + offset] | pieces[chess.QUEEN + offset])
+        # Nothing is lost unless two pieces are attacked, which the attacks of all the opponent's pieces together
+        # tell more cheaply than the attackers of each piece.
+        targets &= self.attacks(opponent, all_occupied)
+        if not targets & (targets - 1):
+            return 0
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            square = bit.bit_length() - 1
+            attackers = self.attackers(square, all_occupied) & all_occupied
+            if not attackers & opponent_pieces:
+                continue
+            for piece_type in chess.PIECE_TYPES:
+                candidates = attackers & pieces[piece_type + opponent_offset]
+                if candidates:
+                    break
+            occupied = all_occupied ^ (candidates & -candidates)
+            attackers = (attackers | self.slider_attackers(square, occupied)) & occupied
+            gain = self.exchange(square, occupied, attackers, SEE_VALUES[squares[square] & 7], SEE_VALUES[piece_type], side)
+            if gain > second:
+                largest, second = max(largest, gain), min(largest, gain)
+        return second
+
+    def is_capture(self, move: int) -> bool:
+        """Check if a move captures a piece."""
+        return bool(self.squares[move >> 6 & 63]) and move >> 15 != CASTLING or move >> 15 == EN_PASSANT
+
+    def gives_check(self, move: int) -> bool:
+        """Check if a pseudo-legal move gives check. Illegal moves return False."""
+        if not self.make(move):
+            return False
+        check = self.in_check()
+        self.unmake()
+        return check
+
+    def has_non_pawn_material(self) -> bool:
+        """Check if the side to move has pieces other than pawns and the king."""
+        side = 0 if self.turn else 1
+        offset = side * BLACK_PIECE
+        pieces = self.pieces
+        return bool(pieces[chess.KNIGHT + offset] | pieces[chess.BISHOP + offset]
+                    | pieces[chess.ROOK + offset] | pieces[chess.QUEEN + offset])
+
+    def piece_count(self) -> int:
+        """Count the pieces on the board, including kings and pawns."""
+        return chess.popcount(self.occupied[0] | self.occupied[1])
+
+    def is_insufficient_material(self) -> bool:
+        """Check if neither side can checkmate, with the same rules as `chess.Board.is_insufficient_material`."""
+        pieces = self.pieces
+        pawns = pieces[chess.PAWN] | pieces[chess.PAWN + BLACK_PIECE]
+        heavy = pieces[chess.ROOK] | pieces[chess.ROOK + BLACK_PIECE] | pieces[chess.QUEEN] | pieces[chess.QUEEN + BLACK_PIECE]
+        if pawns or heavy:
+            return False
+        knights = pieces[chess.KNIGHT] | pieces[chess.KNIGHT + BLACK_PIECE]
+        bishops = pieces[chess.BISHOP] | pieces[chess.BISHOP + BLACK_PIECE]
+        if knights:
+            # A lone knight against a lone king (or a king and queens, which were excluded above).
+            return chess.popcount(knights) == 1 and not bishops
+        return not bishops & LIGHT_SQUARES or not bishops & DARK_SQUARES
+
+
+def castling_squares(king: int, rook: int) -> tuple[int, int]:
+    """Get the squares the king and the rook move to when castling with the rook on `rook`."""
+    rank_start = king & ~7
+    if rook > king:
+        return rank_start + 6, rank_start + 5
+    return rank_start + 2, rank_start + 3
+
+
+def _between_inclusive(a: int, b: int) -> int:
+    """Get the bitboard of the squares from `a` to `b` on the same rank, including both."""
+    low, high = min(a, b), max(a, b)
+    return ((1 << (high + 1)) - 1) & ~((1 << low) - 1)
+
+
+def _xor_castling_keys(flags: int) -> int:
+    """Combine the polyglot castling keys of the rights set in `flags` (white kingside, white queenside, ...)."""
+    key = 0
+    for index in range(4):
+        if flags >> index & 1:
+            key ^= CASTLING_KEYS[index]
+    return key
@@ -0,0 +1,85 @@
+"""Counters and timers of a search by the homemade engines in `strategies.py`, to find the hot spots in real games."""
+from __future__ import annotations
+from collections.abc import Iterable
+
+
+class SearchStatistics:
+    """
+    What a search did and where its time went.
+
+    `Search` fills in a new instance for every search. The searches of the parallel helper processes are added
+    together with `combine`.
+    """
+
+    def __init__(self) -> None:
+        """Start with all the counters and timers at zero."""
+        self.nodes = 0
+        """All the nodes, including the quiescence nodes."""
+        self.quiescence_nodes = 0
+        self.table_probes = 0
+        self.table_hits = 0
+        """Probes that found the position in the transposition table."""
+        self.table_cutoffs = 0
+        """Probes whose stored score was good enough to return without searching."""
+        self.persistent_hits = 0
+        """Hits in the `PersistentTable` of earlier games, also counted in `table_hits`."""
+        self.beta_cutoffs = 0
+        self.first_move_cutoffs = 0
+        """Beta cutoffs by the first move searched, a measure of the move ordering."""
+        self.evaluations = 0
+        self.evaluation_time = 0.0
+        self.move_generations = 0
+        self.move_generation_time = 0.0
+        self.time = 0.0
+        """The time (in seconds) of the whole search, summed over the processes by `combine`."""
+        self.iteration_nodes: list[int] = []
+        """The nodes searched by each completed iteration of the iterative deepening."""
+
+    def branching_factor(self) -> float:
+        """Get the effective branching factor: how many times more nodes the last iteration needed than the one before."""
+        if len(self.iteration_nodes) < 2 or not self.iteration_nodes[-2]:
+            return 0.0
+        return self.iteration_nodes[-1] / self.iteration_nodes[-2]
+
+    def summary(self) -> str:
+        """Get the statistics as one line for the log and the `string` of the `PlayResult.info`."""
+        def share(part: float, whole: float) -> str:
+            return f"{part / whole:.0%}" if whole else "-"
+
+        return (f"nodes {self.nodes} qnodes {share(self.quiescence_nodes, self.nodes)} "
+                f"ebf {self.branching_factor():.1f} "
+                f"tt hits {share(self.table_hits, self.table_probes)} cutoffs {share(self.table_cutoffs, self.table_probes)} "
+                f"persistent hits {self.persistent_hits} "
+                f"first move cutoffs {share(self.first_move_cutoffs, self.beta_cutoffs)} "
+                f"eval {self.evaluations} in {self.evaluation_time:.2f}s ({share(self.evaluation_time, self.time)}) "
+                f"movegen {self.move_generations} in {self.move_generation_time:.2f}s "
+                f"({share(self.move_generation_time, self.time)})")
+
+
+def combine(shares: Iterable[SearchStatistics]) -> SearchStatistics:
+    """
+    Add up the statistics of searches that ran at the same time in different processes.
+
+    :param shares: The statistics of each process.
+    :return: The sums of the counters and timers.
+    """
+    total = SearchStatistics()
+    iteration_nodes: list[list[int]] = []
+    for statistics in shares:
+        total.nodes += statistics.nodes
+        total.quiescence_nodes += statistics.quiescence_nodes
+        total.table_probes += statistics.table_probes
+        total.table_hits += statistics.table_hits
+        total.table_cutoffs += statistics.table_cutoffs
+        total.persistent_hits += statistics.persistent_hits
+        total.beta_cutoffs += statistics.beta_cutoffs
+        total.first_move_cutoffs += statistics.first_move_cutoffs
+        total.evaluations += statistics.evaluations
+        total.evaluation_time += statistics.evaluation_time
+        total.move_generations += statistics.move_generations
+        total.move_generation_time += statistics.move_generation_time
+        total.time += statistics.time
+        iteration_nodes.append(statistics.iteration_nodes)
+    # Only the iterations that every process completed are comparable.
+    total.iteration_nodes = [sum(nodes) for nodes in zip(*iteration_nodes)]
+    return total
@@ -6,261 +6,129 @@ With these classes, bot makers will not have to implement the UCI or XBoard inte
 
 from __future__ import annotations
 import chess
+import chess.engine
+import logging
 from chess.engine import PlayResult
-from engine_wrapper import MinimalEngine
-from typing import Any
-import numpy as np
+from config import Configuration
+from engine_wrapper import COMMANDS_TYPE, MinimalEngine, MOVE, OPTIONS_TYPE
+from parallel import ParallelSearch
+from persistent_table import DEFAULT_PERSISTENT_HASH_FILE, PersistentTable
+from search import Search, Selectivity
+from transposition import TranspositionTable
+from typing import Optional, Union
 
-# material count function
-# pawn(1), knight(3), bishop(3.2), rook(5), queen(9)
-def countMaterial(board):
-    total = 0
-    for i in range(64):
-        if board.piece_at(i) == None or board.piece_at(i).symbol() in ['K', 'k']:
-            continue
-        
-        to_add = 0
+logger = logging.getLogger(__name__)
 
-        if board.piece_at(i).symbol() in ['P', 'p']:
-            to_add = 100
-        elif board.piece_at(i).symbol() in ['N', 'n']:
-            to_add = 300
-        elif board.piece_at(i).symbol() in ['B', 'b']:
-            to_add = 320
-        elif board.piece_at(i).symbol() in ['R', 'r']:
-            to_add = 500
-        elif board.piece_at(i).symbol() in ['Q', 'q']:
-            to_add = 900
+DEFAULT_HASH_MB = 64
 
-        if board.piece_at(i).color == chess.BLACK:
-            total -= to_add
-        else:
-            total += to_add
-    return total
-
-# https://en.wikipedia.org/wiki/Alpha%E2%80%93beta_pruning
-def alphabeta(board, depth, alpha, beta, maximizingPlayer):
-    if depth == 0 or board.is_game_over():
-        return evaluate(board)
-
-    if maximizingPlayer:
-        maxEval = -9999
-        for move in board.legal_moves:
-            board.push(move)
-            evaluation = alphabeta(board, depth - 1, alpha, beta, False)
-            board.pop()
-
-            maxEval = max(maxEval, evaluation)
-            alpha = max(alpha, evaluation)
-            if beta <= alpha:
-                break
-        return maxEval
-    else:
-        minEval = 9999
-        for move in board.legal_moves:
-            board.push(move)
-            evaluation = alphabeta(board, depth - 1, alpha, beta, True)
-            board.pop()
-
-            minEval = min(minEval, evaluation)
-            beta = min(beta, evaluation)
-            if beta <= alpha:
-                break
-        return minEval
-
-# calculates basic piece activity
-# prioritizes long diagonal bishops, centered knights and pawns
-def getPieceActivity(board):
-    # A1   B1 ...
-    #
-    #
-    #
-    #           ...
-    #
-    #
-    #                   ... G8   H8
-    
-    
-    pawnEval = [
-         0,  0,   0,   0,   0,   0,  0,  0,
-         5, 10,  10, -20, -20,  10, 10,  5, 
-         5, -5, -10,   0,   0, -10, -5,  5,
-         0,  0,   0,  20,  20,   0,  0,  0, 
-         5,  5,  10,  25,  25,  10,  5,  5,
-        10, 10,  20,  30,  30,  20, 10, 10,
-        50, 50,  50,  50,  50,  50, 50, 50,
-         0,  0,   0,   0,   0,   0,  0,  0
-    ]
-
-    knightEval = [
-        -50, -40, -30, -30, -30, -30, -40, -50,
-        -40, -20,  0,   5,   5,   0,  -20, -40,
-        -30,  5,  10,  15,  15,  10,   5,  -30,
-        -30,  0,  15,  20,  20,  15,   0,  -30,
-        -30,  5,  15,  20,  20,  15,   5,  -30,
-        -30,  0,  10,  15,  15,  10,   0,  -30,
-        -40, -20,  0,   0,   0,   0, -20,  -40,
-        -50, -40,-30, -30, -30, -30, -40,  -50
-    ]
-    
-    bishEval = [
-        -20, -10, -10, -10, -10, -10, -10, -20, 
-        -10,   5,   0,   0,   0,   0,   5, -10, 
-        -10,  10,  10,  10,  10,  10,  10, -10,
-        -10,   0,  10,  10,  10,  10,   0, -10, 
-        -10,   5,   5,  10,  10,   5,   5, -10, 
-        -10,   0,   5,  10,  10,   5,   0, -10, 
-        -10,   0,   0,   0,   0,   0,   0, -10, 
-        -20, -10, -10, -10, -10, -10, -10, -20
-    ]
-    
-    rookEval = [
-         0,  0,  0,  5,  5,  0,  0,  0,
-        -5,  0,  0,  0,  0,  0,  0, -5,
-        -5,  0,  0,  0,  0,  0,  0, -5,
-        -5,  0,  0,  0,  0,  0,  0, -5,
-        -5,  0,  0,  0,  0,  0,  0, -5,
-        -5,  0,  0,  0,  0,  0,  0, -5,
-         5, 10, 10, 10, 10, 10, 10,  5,
-         0,  0,  0,  0,  0,  0,  0,  0
-    ]
-    
-    queenEval = [
-        -20, -10, -10, -5, -5, -10, -10, -20,
-        -10,   0,   5,  0,  0,   0,   0, -10,
-        -10,   5,   5,  5,  5,   5,   0, -10,
-          0,   0,   5,  5,  5,   5,   0,  -5, 
-         -5,   0,   5,  5,  5,   5,   0,  -5,
-        -10,   0,   5,  5,  5,   5,   0, -10, 
-        -10,   0,   0,  0,  0,   0,   0, -10,
-        -20, -10, -10, -5, -5, -10, -10, -20
-    ]
-
-    kingEval = [
-        20, 30, 10,  0,  0, 10, 30, 20,
-        20, 20,  0,  0,  0,  0, 20, 20,
-        -10,-20,-20,-20,-20,-20,-20,-10,
-        -20,-30,-30,-40,-40,-30,-30,-20,
-        -30,-40,-40,-50,-50,-40,-40,-30,
-        -30,-40,-40,-50,-50,-40,-40,-30,
-        -30,-40,-40,-50,-50,-40,-40,-30,
-        -30,-40,-40,-50,-50,-40,-40,-30,
-    ]
-
-    rookRev = rookEval[::-1]
-    knightRev = knightEval[::-1]
-    bishRev = bishEval[::-1]
-    queenRev = queenEval[::-1]
-    pawnRev = pawnEval[::-1]
-    
-    total = 0
-    for i in range(64):
-        if board.piece_at(i) == None or board.piece_at(i).piece_type == chess.KING:
-            continue
-        
-        to_add = 0
-        piece_color = board.piece_at(i).color
-        if piece_color == chess.WHITE: 
-            opp_color = chess.BLACK
 
-            defended = len(board.attackers(piece_color, i)) <= len(board.attackers(opp_color, i))
-            
-            if board.piece_at(i).piece_type == chess.PAWN:
-                if not defended:
-                    to_add -= 100
-                else:
-                    to_add += pawnEval[i]
-            elif board.piece_at(i).piece_type == chess.KNIGHT:
-                if not defended:
-                    to_add -= 300
-                else:
-                    to_add += knightEval[i]
-            elif board.piece_at(i).piece_type == chess.BISHOP:
-                if not defended:
-                    to_add -= 320
-                else:
-                    to_add += bishEval[i]
-            elif board.piece_at(i).piece_type == chess.ROOK:
-                if not defended:
-                    to_add -= 500
-                else:
-                    to_add += rookEval[i]
-            elif board.piece_at(i).piece_type == chess.QUEEN:
-                if not defended:
-                    to_add -= 900
-                else:
-                    to_add += queenEval[i]
+def log_result(label: str, result: PlayResult) -> None:
+    """
+    Log the move, evaluation and depth of a search, with its statistics.
 
-        elif piece_color == chess.BLACK:
-            opp_color = chess.WHITE
+    The statistics are the nodes, quiescence nodes, transposition table use and the time spent evaluating and
+    generating moves.
+    """
+    statistics = f" ({result.info['string']})" if "string" in result.info else ""
+    logger.info(f"{label}: {result.move} with evaluation {result.info.get('score')} at depth {result.info.get('depth')}"
+                f"{statistics}")
 
-            defended = len(board.attackers(piece_color, i)) <= len(board.attackers(opp_color, i))
-
-            if board.piece_at(i).piece_type == chess.PAWN:
-                if not defended:
-                    to_add -= 100
-                else:
-                    to_add += pawnRev[i]
-            elif board.piece_at(i).piece_type == chess.KNIGHT:
-                if not defended:
-                    to_add -= 300
-                else:
-                    to_add += knightRev[i]
-            elif board.piece_at(i).piece_type == chess.BISHOP:
-                if not defended:
-                    to_add -= 320
-                else:
-                    to_add += bishRev[i]
-            elif board.piece_at(i).piece_type == chess.ROOK:
-                if not defended:
-                    to_add -= 500
-                else:
-                    to_add += rookRev[i]
-            elif board.piece_at(i).piece_type == chess.QUEEN:
-                if not defended:
-                    to_add -= 900
-                else:
-                    to_add += queenRev[i]
-
-        if board.piece_at(i).color == chess.BLACK:
-            total -= to_add
-        else:
-            total += to_add
-    return total
-
-def evaluate(board):
-    # check for mate
-    evaluation = 0
-    if board.is_checkmate():
-        if board.turn == chess.WHITE:
-            return -9999
-        else:
-            return 9999
-       
-    evaluation += countMaterial(board)
-    evaluation += getPieceActivity(board)
-    return evaluation
 
 class YanNepochoEngine(MinimalEngine):
-    def search(self, board: chess.Board, *args: Any) -> PlayResult:
-        depth = 3
-
-        bestValue = -9999 if board.turn == chess.WHITE else 9999            # set best value to -9999 if white, 9999 if black
-        bestMove = None
-        for move in board.legal_moves:
-            board.push(move)
-            evaluation = alphabeta(board, depth - 1, -9999, 9999, False)
-            board.pop()
-
-            if board.turn == chess.WHITE:
-                if evaluation > bestValue:
-                    bestMove = move
-                    bestValue = evaluation
-            else:
-                if evaluation < bestValue:
-                    bestMove = move
-                    bestValue = evaluation
-        
-        print("Best move: ", bestMove, " with evaluation: ", bestValue)
-
-        return PlayResult(bestMove, None)
+    """
+    A homemade engine with an iterative deepening negamax search (see `search.py`).
+
+    It ponders on the opponent's time, and can split the root moves over several processes (see `parallel.py`).
+    """
+
+    def __init__(self, commands: COMMANDS_TYPE, options: OPTIONS_TYPE, stderr: Optional[int],
+                 draw_or_resign: Configuration, **popen_args: str) -> None:
+        """
+        Create the transposition table and start the search helpers, if any.
+
+        :param commands: Not used by homemade engines.
+        :param options: The `homemade_options` of the config. The engine reads:
+            `Hash`: the size (in megabytes) of the transposition table, shared out between the processes. 64 by default.
+            `Threads`: the number of searching processes, including the engine's own. 1 by default.
+            `NullMove`, `LateMoveReductions` and `CheckExtensions`: whether to use each selective search feature (see
+            `search.Selectivity`). All are on by default, and each can be switched off to measure it.
+            `PersistentHash`: the size (in megabytes) of a file that keeps deep search results between games. 0 (off)
+            by default.
+            `PersistentHashFile`: the file of `PersistentHash`. "homemade_hash.bin" by default.
+        :param stderr: Not used by homemade engines.
+        :param draw_or_resign: Options on whether the bot should resign or offer draws.
+        :param popen_args: Not used by homemade engines.
+        """
+        super().__init__(commands, options, stderr, draw_or_resign, **popen_args)
+        hash_mb = options.get("Hash", DEFAULT_HASH_MB)
+        threads = options.get("Threads", 1)
+        selectivity = Selectivity(null_move=options.get("NullMove", True),
+                                  late_move_reductions=options.get("LateMoveReductions", True),
+                                  check_extensions=options.get("CheckExtensions", True))
+        persistent_mb = options.get("PersistentHash", 0)
+        self.persistent = None
+        if persistent_mb:
+            self.persistent = PersistentTable(options.get("PersistentHashFile", DEFAULT_PERSISTENT_HASH_FILE), persistent_mb)
+        self.searcher: Union[Search, ParallelSearch]
+        if threads > 1:
+            self.searcher = ParallelSearch(threads, hash_mb, selectivity, self.persistent)
+        else:
+            self.searcher = Search(TranspositionTable(hash_mb), selectivity, self.persistent)
+        # the helper processes only search on our own clock, so pondering uses the local search
+        self.ponder_searcher = self.searcher.searcher if isinstance(self.searcher, ParallelSearch) else self.searcher
+
+    def search(self, board: chess.Board, time_limit: chess.engine.Limit, ponder: bool, draw_offered: bool,
+               root_moves: MOVE) -> PlayResult:
+        """
+        Search for the best move until the limit is reached.
+
+        :param board: The current position.
+        :param time_limit: Conditions for how long the engine can search.
+        :param ponder: Not used. Pondering is started by `MinimalEngine.start_pondering` after the move is played.
+        :param draw_offered: Not used.
+        :param root_moves: If it is a list, only the moves in `root_moves` are searched.
+        :return: The best move, with the depth, score, principal variation and search statistics in its `info`.
+        """
+        time_limit = self.add_go_commands(time_limit)
+        result = self.searcher.run(board, time_limit, root_moves if isinstance(root_moves, list) else None)
+        log_result("Best move", result)
+        return result
+
+    def ponder(self, board: chess.Board) -> None:
+        """
+        Start searching `board` in a background thread of this process and return right away.
+
+        Only the engine's own searcher ponders, without the helper processes of `Threads`, and it keeps its
+        transposition table for the next search. Until `ponderhit` or `cancel_ponder` has returned, no other search
+        may be started.
+
+        :param board: The position after the expected reply of the opponent.
+        """
+        self.ponder_searcher.start_ponder(board)
+
+    def ponderhit(self, time_limit: chess.engine.Limit) -> PlayResult:
+        """
+        Give the background search a time limit because the opponent played the expected reply, and wait for it.
+
+        :param time_limit: Conditions for how long the engine can still search, counted from now.
+        :return: The best move of the background search. The thread has ended when this returns.
+        """
+        result = self.ponder_searcher.ponderhit(self.add_go_commands(time_limit))
+        log_result("Ponderhit", result)
+        return result
+
+    def cancel_ponder(self) -> None:
+        """Abort the background search and wait until its thread has ended. Its result is thrown away."""
+        self.ponder_searcher.stop_ponder()
+
+    def quit(self) -> None:
+        """Stop pondering, stop the helper processes and save the persistent table at the end of the game."""
+        self.stop_pondering()
+        if isinstance(self.searcher, ParallelSearch):
+            self.searcher.close()
+        if self.persistent is not None:
+            saved = self.persistent.save(self.searcher.table)
+            self.persistent.close()
+            logger.info(f"Saved {saved} search results to {self.persistent.path}")
+            self.persistent = None
+        super().quit()
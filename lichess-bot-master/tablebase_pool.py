@@ -0,0 +1,132 @@
+"""
+The local endgame tablebases of `engine: lichess_bot_tbs`, kept open from one move to the next.
+
+Opening the tablebases scans their directories for table files. Each table then opens and memory-maps its file the
+first time that it is probed. The pool does this once per game process, so the next probes of a table only read the
+mapped file. The Gaviota results are also cached, because the positions after the moves of one position are mostly
+the positions after the moves of the next. `EngineWrapper.quit` closes the pool at the end of each game.
+"""
+from __future__ import annotations
+import chess
+import chess.gaviota
+import chess.polyglot
+import chess.syzygy
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# The number of Gaviota results to keep.
+DTM_CACHE_SIZE = 100000
+
+
+class CachedGaviota:
+    """A Gaviota tablebase with a least-recently-used cache of its DTM results."""
+
+    def __init__(self, tablebase: Union[chess.gaviota.NativeTablebase, chess.gaviota.PythonTablebase],
+                 size: int = DTM_CACHE_SIZE) -> None:
+        """
+        Wrap an open tablebase.
+
+        :param tablebase: The tablebase.
+        :param size: The number of results to keep.
+        """
+        self.tablebase = tablebase
+        self.size = size
+        self.results: OrderedDict[int, int] = OrderedDict()
+        """The DTM by the Zobrist hash of the position, from the least to the most recently used."""
+        self.hits = 0
+        self.misses = 0
+
+    def probe_dtm(self, board: chess.Board) -> int:
+        """
+        Get the depth to mate of a position, probing the tablebase only if the position is not in the cache.
+
+        :param board: The position.
+        :return: The DTM, like `chess.gaviota.NativeTablebase.probe_dtm`.
+        :raises KeyError: If the position is not in the tablebase.
+        """
+        key = chess.polyglot.zobrist_hash(board)
+        dtm = self.results.get(key)
+        if dtm is not None:
+            self.results.move_to_end(key)
+            self.hits += 1
+            return dtm
+        self.misses += 1
+        dtm = self.tablebase.probe_dtm(board)
+        self.results[key] = dtm
+        if len(self.results) > self.size:
+            self.results.popitem(last=False)
+        return dtm
+
+    def close(self) -> None:
+        """Close the tablebase."""
+        self.tablebase.close()
+
+
+class TablebasePool:
+    """The open tablebases of a process."""
+
+    def __init__(self) -> None:
+        """Start without any open tablebases."""
+        self.syzygy_paths: list[str] = []
+        self.syzygy_tablebase: Optional[chess.syzygy.Tablebase] = None
+        self.gaviota_paths: list[str] = []
+        self.gaviota_tablebase: Optional[CachedGaviota] = None
+
+    def syzygy(self, paths: list[str]) -> chess.syzygy.Tablebase:
+        """
+        Get the syzygy tablebases, opening them the first time that they are needed.
+
+        :param paths: The directories of the table files. Different directories replace the open tablebases.
+        :return: The tablebases of all the directories.
+        """
+        if self.syzygy_tablebase is None or paths != self.syzygy_paths:
+            self.close_syzygy()
+            start = time.perf_counter()
+            tablebase = chess.syzygy.open_tablebase(paths[0])
+            for path in paths[1:]:
+                tablebase.add_directory(path)
+            logger.debug(f"Found {len(tablebase.wdl)} WDL and {len(tablebase.dtz)} DTZ syzygy tables in "
+                         f"{time.perf_counter() - start:.3f}s.")
+            self.syzygy_paths = list(paths)
+            self.syzygy_tablebase = tablebase
+        return self.syzygy_tablebase
+
+    def close_syzygy(self) -> None:
+        """Close the syzygy tablebases."""
+        if self.syzygy_tablebase is not None:
+            self.syzygy_tablebase.close()
+            self.syzygy_tablebase = None
+            self.syzygy_paths = []
+
+    def gaviota(self, paths: list[str]) -> CachedGaviota:
+        """
+        Get the Gaviota tablebases, opening them the first time that they are needed.
+
+        :param paths: The directories of the table files. Different directories replace the open tablebases and
+            empty the cache.
+        :return: The tablebases of all the directories.
+        """
+        if self.gaviota_tablebase is None or paths != self.gaviota_paths:
+            self.close_gaviota()
+            tablebase = chess.gaviota.open_tablebase(paths[0])
+            for path in paths[1:]:
+                tablebase.add_directory(path)
+            self.gaviota_paths = list(paths)
+            self.gaviota_tablebase = CachedGaviota(tablebase)
+        return self.gaviota_tablebase
+
+    def close_gaviota(self) -> None:
+        """Close the Gaviota tablebases."""
+        if self.gaviota_tablebase is not None:
+            self.gaviota_tablebase.close()
+            self.gaviota_tablebase = None
+            self.gaviota_paths = []
+
+    def close(self) -> None:
+        """Close all the tablebases."""
+        self.close_syzygy()
+        self.close_gaviota()
@@ -0,0 +1,579 @@
+"""Test the search and evaluation used by the homemade engines."""
+import batch_evaluation
+import benchmark
+import build_opening_cache
+import build_opening_tree
+import chess
+import chess.engine
+import chess.gaviota
+import chess.pgn
+import chess.polyglot
+import itertools
+import evaluation
+import io
+import json
+import opening_books
+import opening_cache
+import opening_tree
+import pathlib
+import search
+import search_board
+import search_statistics
+import time
+import tune_evaluation
+from move_ordering import MoveOrderer
+from parallel import ParallelSearch
+from pawn_table import PawnTable
+from persistent_table import PersistentTable
+from tablebase_pool import CachedGaviota, TablebasePool
+from transposition import Bound, TranspositionTable
+
+
+def test_evaluation_is_symmetric() -> None:
+    """Test that swapping the colors of a position negates its evaluation."""
+    fens = [chess.STARTING_FEN,
+            "r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4",
+            "8/5k2/3p4/1p1Pp2p/pP2Pp1P/P4P1K/8/8 b - - 99 50"]
+    for fen in fens:
+        board = chess.Board(fen)
+        swapped = board.transform(chess.flip_horizontal).mirror()
+        assert evaluation.evaluate(board) == -evaluation.evaluate(swapped)
+    assert evaluation.evaluate(chess.Board()) == 0
+
+
+def test_tapered_evaluation() -> None:
+    """Test that the score moves from the middlegame tables to the endgame tables as pieces come off the board."""
+    pair = evaluation.score_pair(-35, 120)
+    assert evaluation.taper(pair, evaluation.MAX_PHASE) == -35
+    assert evaluation.taper(pair, 0) == 120
+    assert evaluation.taper(pair, evaluation.MAX_PHASE + 4) == -35
+    assert evaluation.taper(pair, 12) == -evaluation.taper(-pair, 12)
+    assert evaluation.game_phase(chess.Board()) == evaluation.MAX_PHASE
+
+    # With most pieces on the board, the king is safer in the corner. In a pawn ending, it belongs in the center.
+    castled = chess.Board("r1bqkb1r/pppppppp/2n2n2/8/8/2N2N2/PPPPPPPP/R1BQ1RK1 w kq - 0 1")
+    centralized = chess.Board("r1bqkb1r/pppppppp/2n2n2/8/4K3/2N2N2/PPPPPPPP/R1BQ1R2 w kq - 0 1")
+    assert evaluation.material_and_placement(castled) > evaluation.material_and_placement(centralized)
+    assert (evaluation.material_and_placement(chess.Board("4k3/4p3/8/8/8/8/4P3/6K1 w - - 0 1"))
+            < evaluation.material_and_placement(chess.Board("4k3/4p3/8/8/4K3/8/4P3/8 w - - 0 1")))
+
+    board = chess.Board("4k3/1P6/8/8/8/8/8/R3K3 w Q - 0 1")
+    packed = search_board.SearchBoard(board)
+    for uci in ["b7b8q", "e8d7", "e1c1"]:
+        move = packed.from_move(chess.Move.from_uci(uci))
+        assert move is not None and packed.make(move)
+        board.push_uci(uci)
+        assert packed.evaluate() == evaluation.material_and_placement(board)
+        assert packed.phase == evaluation.game_phase(board)
+
+
+def test_pawn_structure() -> None:
+    """Test the doubled, isolated and passed pawn terms and that the pawn table caches them by the pawn key."""
+    white_pawns = chess.BB_A2 | chess.BB_A3 | chess.BB_D5
+    black_pawns = chess.BB_B7 | chess.BB_G6
+    structure = evaluation.pawn_structure(white_pawns, black_pawns)
+    assert structure.passed == (chess.BB_G6, chess.BB_D5)
+    white = evaluation.DOUBLED_PAWN + 3 * evaluation.ISOLATED_PAWN + evaluation.PASSED_PAWN[4]
+    black = 2 * evaluation.ISOLATED_PAWN + evaluation.PASSED_PAWN[2]
+    assert structure.score == white - black
+    mirrored = evaluation.pawn_structure(chess.flip_vertical(black_pawns), chess.flip_vertical(white_pawns))
+    assert mirrored.score == -structure.score
+
+    table = PawnTable(0.01)
+    board = search_board.SearchBoard(chess.Board("4k3/1p6/6p1/3P4/8/P7/P7/4K3 w - - 0 1"))
+    assert table.probe(board.pawn_key, white_pawns, black_pawns) == structure
+    for uci in ["e1e2", "e8e7", "e2e1", "e7e8"]:
+        move = board.from_move(chess.Move.from_uci(uci))
+        assert move is not None and board.make(move)
+        assert table.probe(board.pawn_key, white_pawns, black_pawns) == structure
+    assert (table.hits, table.misses) == (4, 1) and table.hit_rate() == 0.8
+
+    move = board.from_move(chess.Move.from_uci("d5d6"))
+    assert move is not None and board.make(move)
+    white_pawns = chess.BB_A2 | chess.BB_A3 | chess.BB_D6
+    assert table.probe(board.pawn_key, white_pawns, black_pawns) == evaluation.pawn_structure(white_pawns, black_pawns)
+    assert table.misses == 2
+
+
+def test_batch_evaluation() -> None:
+    """Test that the batch evaluation gives the same scores as evaluating each position."""
+    boards = [chess.Board(fen) for fen in benchmark.SEARCH_POSITIONS]
+    boards.append(chess.Board("8/8/8/8/8/8/8/K6N w - - 0 1"))
+    scores = batch_evaluation.evaluate_batch(boards)
+    assert scores.shape == (len(boards),)
+    assert list(scores) == [evaluation.material_and_placement(board) for board in boards]
+    assert batch_evaluation.pack(boards).shape == (len(boards), 12, 64)
+
+    board = chess.Board("r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4")
+    moves = list(board.legal_moves)
+    scores = batch_evaluation.score_moves(board, moves)
+    for move, score in zip(moves, scores):
+        board.push(move)
+        assert score == evaluation.material_and_placement(board)
+        board.pop()
+    ordered = search.order_root_moves(board.mirror(), [move for move in board.mirror().legal_moves])
+    ordered_scores = list(batch_evaluation.score_moves(board.mirror(), ordered))
+    assert ordered_scores == sorted(ordered_scores, reverse=True)
+
+
+def test_quiescence_resolves_captures() -> None:
+    """Test that the leaf score includes winning an undefended piece and not a defended one."""
+    searcher = search.Search(TranspositionTable(1))
+    board = chess.Board("4k3/8/8/3q4/4P3/8/8/4K3 w - - 0 1")
+    score = searcher.quiescence(search_board.SearchBoard(board), -search.INFINITY, search.INFINITY, 0)
+    board.push_uci("e4d5")
+    assert score == evaluation.evaluate(board)
+
+    board = chess.Board("4k3/2p5/3p4/8/8/8/8/3QK3 b - - 0 1")
+    score = searcher.quiescence(search_board.SearchBoard(board), -search.INFINITY, search.INFINITY, 0)
+    assert score == -evaluation.evaluate(board)
+
+
+def test_mate_score() -> None:
+    """Test that checkmate gets the mate score."""
+    board = chess.Board("rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3")
+    assert evaluation.evaluate(board) == -evaluation.MATE_SCORE
+
+
+def test_transposition_table_replacement() -> None:
+    """Test that the deepest result of a search is kept and shallower results use the second slot."""
+    table = TranspositionTable(1)
+    key = 0x1234
+    colliding_key = key + (table.mask + 1)
+    table.store(key, 5, Bound.EXACT, 10, 0)
+    table.store(colliding_key, 2, Bound.LOWER, 20, 0)
+    entry = table.probe(key)
+    assert entry is not None and entry.depth == 5 and entry.score == 10
+    entry = table.probe(colliding_key)
+    assert entry is not None and entry.bound == Bound.LOWER
+    assert table.probe(key + 1) is None
+
+    table.new_search()
+    table.store(colliding_key, 1, Bound.UPPER, 30, 0)
+    assert table.probe(key) is None
+    entry = table.probe(colliding_key)
+    assert entry is not None and entry.depth == 1
+
+
+def test_time_budget() -> None:
+    """Test that the search time depends on the clock of the side to move and never exceeds the move time."""
+    board = chess.Board()
+    soft, hard = search.time_budget(board, chess.engine.Limit(white_clock=60, black_clock=1, white_inc=2, black_inc=2))
+    assert soft is not None and hard is not None
+    assert 2 < soft < hard <= 60 * search.MAX_CLOCK_FRACTION
+    board.push_uci("e2e4")
+    _, hard = search.time_budget(board, chess.engine.Limit(white_clock=60, black_clock=1, white_inc=2, black_inc=2))
+    assert hard is not None and hard <= 1 * search.MAX_CLOCK_FRACTION
+    assert search.time_budget(board, chess.engine.Limit(time=10)) == (5, 10)
+    assert search.time_budget(board, chess.engine.Limit(depth=5)) == (None, None)
+
+
+def test_search_finds_mates() -> None:
+    """Test that the search finds mates for both colors, reports them, and stops at the depth limit."""
+    searcher = search.Search(TranspositionTable(1))
+    result = searcher.run(chess.Board("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1"), chess.engine.Limit(depth=3))
+    assert result.move == chess.Move.from_uci("d1d8")
+    assert result.info["score"] == chess.engine.PovScore(chess.engine.Mate(1), chess.WHITE)
+    assert result.info["pv"] == [chess.Move.from_uci("d1d8")]
+    result = searcher.run(chess.Board("3r2k1/5ppp/8/8/8/8/5PPP/6K1 b - - 0 1"), chess.engine.Limit(depth=3))
+    assert result.move == chess.Move.from_uci("d8d1")
+    result = searcher.run(chess.Board("kbK5/pp6/1P6/8/8/8/8/R7 w - - 0 1"), chess.engine.Limit(depth=5))
+    assert result.info["score"] == chess.engine.PovScore(chess.engine.Mate(2), chess.WHITE)
+    assert len(result.info["pv"]) == 3
+
+    result = searcher.run(chess.Board(), chess.engine.Limit(depth=2))
+    assert result.info["depth"] == 2 and result.info["nodes"] > 0 and len(result.info["pv"]) == 2
+    result = searcher.run(chess.Board(), chess.engine.Limit(depth=2), [chess.Move.from_uci("a2a3")])
+    assert result.move == chess.Move.from_uci("a2a3")
+
+
+def test_selectivity() -> None:
+    """Test that the search finds a mate with every combination of the selective search features."""
+    for features in itertools.product([False, True], repeat=3):
+        searcher = search.Search(TranspositionTable(1), search.Selectivity(*features))
+        result = searcher.run(chess.Board("kbK5/pp6/1P6/8/8/8/8/R7 w - - 0 1"), chess.engine.Limit(depth=5))
+        assert result.info["score"] == chess.engine.PovScore(chess.engine.Mate(2), chess.WHITE)
+        result = searcher.run(chess.Board("r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4"),
+                              chess.engine.Limit(depth=3))
+        assert result.move == chess.Move.from_uci("h5f7")
+
+
+def test_search_statistics() -> None:
+    """Test that the search counts its nodes, table use and cutoffs, and reports them in the info string."""
+    searcher = search.Search(TranspositionTable(8))
+    result = searcher.run(chess.Board("r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"),
+                          chess.engine.Limit(depth=4))
+    statistics = searcher.statistics
+    assert statistics.nodes == searcher.nodes == result.info["nodes"]
+    assert 0 < statistics.quiescence_nodes < statistics.nodes
+    assert 0 < statistics.table_cutoffs <= statistics.table_hits <= statistics.table_probes
+    assert 0 < statistics.first_move_cutoffs <= statistics.beta_cutoffs
+    assert statistics.evaluations > 0 and statistics.move_generations > 0
+    assert 0 < statistics.evaluation_time + statistics.move_generation_time < statistics.time
+    assert len(statistics.iteration_nodes) == 4 and sum(statistics.iteration_nodes) <= statistics.nodes
+    assert result.info["string"] == statistics.summary()
+
+    # The only legal move is played without a search, but still with an info.
+    result = searcher.run(chess.Board("k7/8/8/8/8/8/1r6/K7 w - - 0 1"), chess.engine.Limit(depth=4))
+    assert result.move == chess.Move.from_uci("a1b2")
+    assert result.info["depth"] == 0 and result.info["nodes"] == 0
+    assert result.info["string"] == searcher.statistics.summary()
+
+    total = search_statistics.combine([statistics, statistics])
+    assert total.nodes == 2 * statistics.nodes
+    assert total.iteration_nodes == [2 * nodes for nodes in statistics.iteration_nodes]
+
+
+def test_persistent_table(tmp_path: pathlib.Path) -> None:
+    """Test that deep results saved to the search cache file speed up a search in a later game."""
+    path = str(tmp_path / "hash.bin")
+    board = chess.Board("r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4")
+    table = PersistentTable(path, 1)
+    first = search.Search(TranspositionTable(8), persistent=table)
+    first.run(board, chess.engine.Limit(depth=5))
+    assert first.statistics.persistent_hits == 0
+    assert table.save(first.table) > 0
+    table.close()
+
+    table = PersistentTable(path, 1)
+    second = search.Search(TranspositionTable(8), persistent=table)
+    result = second.run(board, chess.engine.Limit(depth=5))
+    table.close()
+    assert second.statistics.persistent_hits > 0 and second.nodes < first.nodes
+    assert result.move is not None and board.is_legal(result.move)
+
+    # A record that doesn't match its key is ignored.
+    table = PersistentTable(path, 1)
+    key = chess.polyglot.zobrist_hash(board)
+    table.store(key, 7, Bound.LOWER, -9990, 12345)
+    assert table.probe(key) == (key, 7, Bound.LOWER, -9990, 12345, 0)
+    table.words[((key & table.mask) << 1) + 1] ^= 1
+    assert table.probe(key) is None
+    table.close()
+
+
+def test_opening_cache(tmp_path: pathlib.Path) -> None:
+    """Test that the most frequent opening positions of the game records are searched, saved and found again."""
+    pgn = "1. e4 e5 2. Nf3 Nc6 *\n\n1. e4 e5 2. Nf3 Nf6 *\n\n1. d4 d5 *\n\n"
+    games = [chess.pgn.read_game(io.StringIO(game)) for game in pgn.split("\n\n") if game]
+    counts, boards = build_opening_cache.count_positions(iter(game for game in games if game), 3)
+    # The start position, 1. e4 and 1. e4 e5 are in more than one game.
+    assert counts[chess.polyglot.zobrist_hash(chess.Board())] == 3
+    assert sorted(counts.values()) == [1, 2, 2, 3]
+    keys = [key for key, count in counts.items() if count >= 2]
+
+    path = str(tmp_path / "cache.bin")
+    positions = [(key, boards[key]) for key in keys]
+    assert opening_cache.write_cache(path, build_opening_cache.search_positions(positions, chess.engine.Limit(depth=2),
+                                                                                1)) == 3
+    cache = opening_cache.OpeningCache(path)
+    assert len(cache) == 3
+    board = chess.Board()
+    result = cache.play_result(board)
+    assert result is not None and result.move is not None and board.is_legal(result.move)
+    assert result.info["depth"] == 2
+    assert cache.play_result(board, [move for move in board.legal_moves if move != result.move]) is None
+    assert cache.lookup(chess.Board("4k3/8/8/8/8/8/8/4K3 w - - 0 1")) is None
+    assert opening_cache.decode_move(opening_cache.encode_move(chess.Move.from_uci("a7a8q"))) \
+        == chess.Move.from_uci("a7a8q")
+
+
+def test_book_index(tmp_path: pathlib.Path) -> None:
+    """Test that the merged index of several polyglot books finds the same moves as python-chess's reader."""
+    board = chess.Board("r3k2r/pppq1ppp/2n2n2/3pp3/3PP3/2N2N2/PPPQ1PPP/R3K2R w KQkq - 0 1")
+    key = chess.polyglot.zobrist_hash(board)
+
+    def write_book(name: str, entries: list[tuple[int, str, int]]) -> str:
+        path = tmp_path / name
+        records = []
+        for entry_key, uci, weight in sorted(entries, key=lambda entry: entry[0]):
+            move = chess.Move.from_uci(uci)
+            records.append(chess.polyglot.ENTRY_STRUCT.pack(entry_key, move.to_square | move.from_square << 6, weight, 0))
+        path.write_bytes(b"".join(records))
+        return str(path)
+
+    # Castling is stored as the king taking its rook. e2e4 is not legal and d4e5 has a weight below the minimum.
+    first = write_book("first.bin", [(key - 1, "g1f3", 7), (key, "e1h1", 10), (key, "d4e5", 1), (key, "e2e4", 5),
+                                     (key + 1, "e2e4", 3)])
+    second = write_book("second.bin", [(key, "d4e5", 20), (key, "e1g1", 4), (key + 2, "a2a3", 1)])
+    index = opening_books.BookIndex([first, second])
+    assert len(index) == 8
+
+    with chess.polyglot.open_reader(first) as reader:
+        expected = [(entry.move, entry.weight) for entry in reader.find_all(board, minimum_weight=2)]
+    assert [(found.move, found.weight) for found in index.find_all(board, 2)] == expected
+    assert [found.book for found in index.find_all(board, 2)] == [first]
+    assert [(found.move, found.weight) for found in index.find_all(board, 15)] == [(chess.Move.from_uci("d4e5"), 20)]
+    merged = index.find_all(board, 2, merge=True)
+    assert [(found.move.uci(), found.weight) for found in merged] == [("e1g1", 14), ("d4e5", 21)]
+    assert merged[0].book == f"{first}, {second}"
+    assert opening_books.choose_move(merged, "best_move").move == chess.Move.from_uci("d4e5")
+    assert opening_books.choose_move(merged, "uniform_random") in merged
+    assert index.find_all(chess.Board()) == []
+    assert opening_books.BookIndex([]).find_all(board) == []
+
+    def raw_move(uci: str) -> int:
+        move = chess.Move.from_uci(uci)
+        return move.to_square | move.from_square << 6 | (move.promotion - 1 if move.promotion else 0) << 12
+
+    # Castling is decoded for both sides. Other moves to a rook square and Chess960 castling are kept as they are.
+    for fen, chess960, uci, decoded in [(board.fen(), False, "e1a1", "e1c1"),
+                                        ("r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1", False, "e8h8", "e8g8"),
+                                        ("r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1", False, "e8a8", "e8c8"),
+                                        ("4k3/8/8/8/8/8/8/4R1K1 w - - 0 1", False, "e1h1", "e1h1"),
+                                        ("4k3/7P/8/8/8/8/8/4K3 w - - 0 1", False, "h7h8q", "h7h8q"),
+                                        ("1r2k2r/8/8/8/8/8/8/R3K1R1 w Qk - 0 1", True, "e1a1", "e1a1")]:
+        assert opening_books.book_move(chess.Board(fen, chess960=chess960), raw_move(uci)) == chess.Move.from_uci(decoded)
+
+    # The same config keeps the books loaded. A new one drops the books that changed.
+    manager = opening_books.BookManager()
+    manager.update({"standard": [first, second], "atomic": None})
+    standard = manager.index("standard")
+    assert manager.index("atomic").paths == []
+    manager.update({"standard": [first, second], "atomic": None})
+    assert manager.index("standard") is standard
+    manager.update({"standard": second, "atomic": None})
+    assert manager.index("standard").paths == [second]
+
+
+def test_opening_tree(tmp_path: pathlib.Path) -> None:
+    """Test that the opening tree adds up the results and evaluations of the bot's games and picks moves by score."""
+    # The evaluations are written after the move or, with a principal variation, at its end (see print_pgn_game_record).
+    pgn = ("1. e4 { [%eval 0.40,12] } 1... e5 2. Nf3 1-0\n\n"
+           "1. e4 ( 1. e4 e5 2. Nf3 { [%eval 0.20,10] } ) 1... c5 0-1\n\n"
+           "1. d4 { [%eval #3,20] } 1... d5 1/2-1/2\n\n"
+           "1. d4 d5 *\n\n")
+    statistics: dict[tuple[int, chess.Move], opening_tree.MoveStatistics] = {}
+    games = [chess.pgn.read_game(io.StringIO(game)) for game in pgn.split("\n\n") if game]
+    assert build_opening_tree.add_games(statistics, iter(game for game in games if game), 2) == 3
+    assert len(statistics) == 5
+
+    path = str(tmp_path / "tree.bin")
+    assert opening_tree.write_tree(path, statistics) == 5
+    tree = opening_tree.OpeningTree(path)
+    assert len(tree) == 5
+    moves = {found.move.uci(): found for found in tree.find_all(chess.Board())}
+    assert moves["e2e4"] == opening_tree.TreeMove(chess.Move.from_uci("e2e4"), 2, 0.5, 30)
+    assert moves["d2d4"] == opening_tree.TreeMove(chess.Move.from_uci("d2d4"), 1, 0.5, build_opening_tree.MAX_EVAL - 3)
+    board = chess.Board()
+    board.push_uci("e2e4")
+    replies = [(found.move.uci(), found.score, found.eval) for found in tree.find_all(board)]
+    assert replies == [("e7e5", 0.0, None), ("c7c5", 1.0, None)]
+    assert opening_tree.choose_move(tree.find_all(board), "best_score").move == chess.Move.from_uci("c7c5")
+    assert opening_tree.choose_move(tree.find_all(board), "weighted_random").move == chess.Move.from_uci("c7c5")
+    assert tree.find_all(chess.Board(), min_games=2) == [moves["e2e4"]]
+    assert tree.find_all(chess.Board(chess960=True)) == []
+
+    manager = opening_books.BookManager()
+    assert manager.opening_tree(path) is manager.opening_tree(path)
+
+
+def test_tablebase_pool(tmp_path: pathlib.Path) -> None:
+    """Test that the syzygy tablebases stay open until their directories change or the pool is closed."""
+    first, second = tmp_path / "first", tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+    pool = TablebasePool()
+    tablebase = pool.syzygy([str(first), str(second)])
+    assert pool.syzygy([str(first), str(second)]) is tablebase
+    assert pool.syzygy([str(first)]) is not tablebase
+    gaviota = pool.gaviota([str(first)])
+    assert pool.gaviota([str(first)]) is gaviota
+    pool.close()
+    assert pool.syzygy_tablebase is None and pool.gaviota_tablebase is None
+
+
+def test_gaviota_cache() -> None:
+    """Test that repeated Gaviota probes are answered by the cache and that the oldest results are dropped."""
+    class CountingTablebase(chess.gaviota.PythonTablebase):
+        def __init__(self) -> None:
+            super().__init__()
+            self.probes = 0
+
+        def probe_dtm(self, board: chess.Board) -> int:
+            self.probes += 1
+            return len(board.piece_map())
+
+    tablebase = CountingTablebase()
+    cache = CachedGaviota(tablebase, size=2)
+    boards = [chess.Board("8/8/8/4k3/8/8/3Q4/4K3 w - - 0 1"), chess.Board("8/8/8/4k3/8/8/3Q4/4K3 b - - 0 1"),
+              chess.Board("8/8/8/4k3/8/8/8/4K2R w - - 0 1")]
+    assert [cache.probe_dtm(board) for board in boards[:2] + boards[:2]] == [3, 3, 3, 3]
+    assert (tablebase.probes, cache.hits, cache.misses) == (2, 2, 2)
+    # The first board was used last, so the second one is dropped to make room for the third.
+    cache.probe_dtm(boards[0])
+    cache.probe_dtm(boards[2])
+    cache.probe_dtm(boards[0])
+    assert tablebase.probes == 3
+    cache.probe_dtm(boards[1])
+    assert tablebase.probes == 4 and len(cache.results) == 2
+
+
+def test_evaluation_tuning(tmp_path: pathlib.Path) -> None:
+    """Test that the tuner reads quiet positions, matches the engine's evaluation and writes loadable tables."""
+    path = tmp_path / "games.pgn"
+    path.write_text("1. e4 e5 2. Bc4 Nc6 3. Qh5 Nf6 4. Qxf7# 1-0\n\n"
+                    "1. d4 d5 2. c4 e6 3. Nc3 Nf6 4. Bg5 Be7 5. e3 O-O 6. Nf3 h6 1/2-1/2\n\n"
+                    "1. e4 c5 *\n\n")
+    masks, phases, offsets, results = tune_evaluation.file_positions(str(path), skip_plies=0)
+    # 4. Qxf7# is a capture, black can win a pawn with dxc4 before 3... e6, 4... Nf6 and 5... Be7, and the
+    # unfinished game is skipped.
+    assert results == [1.0] * 6 + [0.5] * 9
+    positions = tune_evaluation.to_positions(masks, phases, offsets, results)
+
+    weights = tune_evaluation.initial_weights()
+    board = chess.Board()
+    board.push_uci("e2e4")
+    assert abs(tune_evaluation.evaluate(weights, positions)[1] - evaluation.evaluate(board)) <= 1
+
+    k = tune_evaluation.fit_scaling(weights, positions)
+    tuned = tune_evaluation.tune(positions, weights, k, 5, 1.0, 4)
+    assert tune_evaluation.error(tuned, positions, k) < tune_evaluation.error(weights, positions, k)
+
+    parameters_path = tmp_path / "parameters.json"
+    parameters_path.write_text(json.dumps(tune_evaluation.parameters(weights)))
+    assert evaluation.load_tables(str(parameters_path)) == evaluation.default_tables()
+
+
+def test_move_ordering() -> None:
+    """Test that the stored move comes first, then captures by MVV-LVA, then killers, then quiet moves by history."""
+    board = search_board.SearchBoard(chess.Board("4k3/q7/3r4/1NP5/8/8/8/4K2R w K - 0 1"))
+
+    def packed(uci: str) -> int:
+        move = board.from_move(chess.Move.from_uci(uci))
+        assert move is not None
+        return move
+
+    orderer = MoveOrderer()
+    tt_move = packed("e1g1")
+    orderer.cutoff(board, packed("h1h7"), 3, 1)
+    orderer.cutoff(board, packed("e1e2"), 2, 0)
+    moves = list(orderer.ordered_moves(board, board.generate_moves(), tt_move, 1))
+    assert sorted(moves) == sorted(board.generate_moves())
+    assert moves[:6] == [tt_move, packed("b5a7"), packed("c5d6"), packed("b5d6"), packed("h1h7"), packed("e1e2")]
+    illegal_move = search_board.encode(chess.E1, chess.A1, flag=search_board.CASTLING)
+    assert list(orderer.ordered_moves(board, board.generate_moves(), illegal_move, 1))[0] == packed("b5a7")
+
+
+def test_ponder() -> None:
+    """Test that a ponder search runs until it is stopped or turned into a timed search by a ponderhit."""
+    searcher = search.Search(TranspositionTable(8))
+    board = chess.Board("r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3")
+    searcher.start_ponder(board)
+    searcher.stop_ponder()
+    assert searcher.ponder_thread is None
+
+    # A ponderhit right after the start still limits the search.
+    searcher.start_ponder(board)
+    result = searcher.ponderhit(chess.engine.Limit(depth=2))
+    assert result.move is not None and board.is_legal(result.move)
+    assert result.info["depth"] >= 2
+    assert board.fen() == "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3"
+
+
+def test_parallel_search() -> None:
+    """Test that splitting the root moves over helper processes finds the same moves as a single search."""
+    searcher = ParallelSearch(3, 8)
+    try:
+        board = chess.Board("kbK5/pp6/1P6/8/8/8/8/R7 w - - 0 1")
+        result = searcher.run(board, chess.engine.Limit(depth=4))
+        assert result.move == chess.Move.from_uci("a1a6")
+        assert result.info["score"] == chess.engine.PovScore(chess.engine.Mate(2), chess.WHITE)
+
+        board = chess.Board("r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4")
+        single = search.Search(TranspositionTable(8)).run(board, chess.engine.Limit(depth=3))
+        result = searcher.run(board, chess.engine.Limit(depth=3))
+        assert result.info["depth"] == 3
+        assert result.info["score"] == single.info["score"]
+        assert result.info["nodes"] > 0
+        assert result.info["string"].startswith(f"nodes {result.info['nodes']} ")
+
+        helper = searcher.helpers[0]
+        helper.start(board, chess.engine.Limit(time=60), list(board.legal_moves))
+        start = time.perf_counter()
+        helper.wait(0.5)
+        assert time.perf_counter() - start >= 0.5
+        start = time.perf_counter()
+        helper.stop()
+        iterations, _ = helper.result()
+        assert time.perf_counter() - start < 5
+        assert iterations and iterations[-1]["depth"] == len(iterations)
+    finally:
+        searcher.close()
+
+
+def test_perft() -> None:
+    """Test the perft counts of the search board in the benchmark positions and a Chess960 position."""
+    positions = [(chess.Board(position.fen), position.nodes) for position in benchmark.PERFT_POSITIONS]
+    # Position 1 of https://www.chessprogramming.org/Chess960_Perft_Results.
+    positions.append((chess.Board("bqnb1rkr/pp3ppp/3ppn2/2p5/5P2/P2P4/NPP1P1PP/BQ1BNRKR w HFhf - 2 9", chess960=True),
+                      [21, 528, 12189]))
+    for board, nodes in positions:
+        packed = search_board.SearchBoard(board)
+        key, score, squares = packed.key, packed.score, list(packed.squares)
+        for depth in [1, 2]:
+            assert benchmark.perft(packed, depth) == nodes[depth - 1]
+        # Every move is taken back.
+        assert (packed.ply, packed.key, packed.score, packed.squares) == (0, key, score, squares)
+
+
+def test_search_board() -> None:
+    """Test the move generation, keys and scores of the search board against python-chess in standard and Chess960 games."""
+    for position in benchmark.PERFT_POSITIONS:
+        packed = search_board.SearchBoard(chess.Board(position.fen))
+        assert len(packed.legal_moves()) == position.nodes[0]
+        replies = 0
+        for move in packed.legal_moves():
+            packed.make(move)
+            replies += len(packed.legal_moves())
+            packed.unmake()
+        assert replies == position.nodes[1]
+
+    games = [(chess.Board(), ["e2e4", "g8f6", "e4e5", "d7d5", "e5d6", "e7e6", "g1f3", "f8d6", "f1c4", "e8g8", "e1g1",
+                              "b7b5", "c4b5", "c7c5", "b5a4", "c5c4", "b2b4", "c4b3", "a2a3", "b3b2", "d2d3", "b2a1q"]),
+             (chess.Board("1r2k2r/8/8/8/8/8/8/R3K1R1 w Qk - 0 1", chess960=True), ["e1a1", "e8f8", "d1d8", "f8e7"]),
+             (chess.Board("4k3/8/8/8/8/8/8/5RK1 w F - 0 1", chess960=True), ["g1f1", "e8e7"])]
+    for board, moves in games:
+        packed_board = search_board.SearchBoard(board)
+        for uci in moves:
+            packed_move = packed_board.from_move(chess.Move.from_uci(uci))
+            assert packed_move is not None and packed_board.make(packed_move)
+            board.push_uci(uci)
+            assert packed_board.key == chess.polyglot.zobrist_hash(board)
+            assert packed_board.pawn_key == search_board.SearchBoard(board).pawn_key
+            assert packed_board.evaluate() == evaluation.material_and_placement(board)
+            assert packed_board.phase == evaluation.game_phase(board)
+            assert packed_board.in_check() == board.is_check()
+            assert sorted(map(str, map(packed_board.to_move, packed_board.legal_moves()))) \
+                == sorted(map(str, board.legal_moves))
+        assert packed_board.to_board().board_fen() == board.board_fen()
+        while packed_board.ply:
+            packed_board.unmake()
+            board.pop()
+            assert packed_board.key == chess.polyglot.zobrist_hash(board)
+
+    assert search_board.SearchBoard(chess.Board("8/8/8/4k3/8/2B5/8/4K3 w - - 0 1")).is_insufficient_material()
+    assert not search_board.SearchBoard(chess.Board("8/8/8/4k3/8/2BB4/8/4K3 w - - 0 1")).is_insufficient_material()
+
+
+def test_static_exchange_evaluation() -> None:
+    """Test the exchange evaluation of captures, x-rays included, and the material lost to a fork."""
+    exchanges = [("1k1r4/1pp4p/p7/4p3/8/P5P1/1PP4P/2K1R3 w - - 0 1", "e1e5", 100),
+                 # The rook and queen behind the first attackers join the exchange.
+                 ("1k1r3q/1ppn3p/p4b2/4p3/8/P2N2P1/1PP1R1BP/2K1Q3 w - - 0 1", "d3e5", -200),
+                 ("7r/5qpk/p1Qp1b1p/3r3n/BB3p2/5p2/P1P2P2/4RK1R w - - 0 1", "e1e8", 0),
+                 ("6RR/4bP2/8/8/5r2/3K4/5p2/4k3 w - - 0 1", "f7f8q", 220),
+                 ("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1", "e5d6", 100)]
+    for fen, uci, value in exchanges:
+        board = search_board.SearchBoard(chess.Board(fen))
+        move = board.from_move(chess.Move.from_uci(uci))
+        assert move is not None and board.see(move) == value
+
+    # The knight forks the queen and the rook, and the rook is defended by the king.
+    assert search_board.SearchBoard(chess.Board("k7/8/8/8/8/3n4/1Q3R2/6K1 w - - 0 1")).hanging_material() == 200
+    assert search_board.SearchBoard(chess.Board("k7/8/8/8/8/3n4/1Q3R2/6K1 b - - 0 1")).hanging_material() == 0
+
+    # Taking the defended pawn with the queen is searched after the quiet moves.
+    board = search_board.SearchBoard(chess.Board("4k3/2p5/3p4/8/8/8/8/3QK3 w - - 0 1"))
+    moves = MoveOrderer().sort(board, board.generate_moves(), 0)
+    assert board.to_move(moves[-1]) == chess.Move.from_uci("d1d6")
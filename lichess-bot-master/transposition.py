@@ -0,0 +1,93 @@
+"""A transposition table for the homemade engines in `strategies.py`."""
+from __future__ import annotations
+from enum import IntEnum
+from typing import NamedTuple, Optional
+
+# A rough estimate of the memory used by one entry, including the Python objects it refers to.
+ENTRY_BYTES = 200
+
+
+class Bound(IntEnum):
+    """How a stored score relates to the real score of the position."""
+
+    EXACT = 0
+    """The score is the real score."""
+    LOWER = 1
+    """The search failed high, so the real score is at least the stored score."""
+    UPPER = 2
+    """The search failed low, so the real score is at most the stored score."""
+
+
+class TableEntry(NamedTuple):
+    """The result of searching a position."""
+
+    key: int
+    depth: int
+    bound: Bound
+    score: int
+    move: int
+    """The best move packed as in `search_board`, or 0."""
+    generation: int
+
+
+class TranspositionTable:
+    """
+    A fixed-size table of search results keyed by the polyglot Zobrist hash of the position.
+
+    Each bucket has two slots. The first slot keeps the deepest result from the current search and the second
+    slot is overwritten by every result that does not replace the first one.
+    """
+
+    def __init__(self, size_mb: float) -> None:
+        """:param size_mb: The memory (in megabytes) the table may use."""
+        buckets = max(1, int(size_mb * 1024 * 1024) // (2 * ENTRY_BYTES))
+        self.mask = (1 << (buckets.bit_length() - 1)) - 1
+        self.entries: list[Optional[TableEntry]] = [None] * (2 * (self.mask + 1))
+        self.generation = 0
+
+    def new_search(self) -> None:
+        """Mark the results that are already stored as coming from an older search."""
+        self.generation += 1
+
+    def clear(self) -> None:
+        """Remove all the results."""
+        self.entries = [None] * len(self.entries)
+        self.generation = 0
+
+    def probe(self, key: int) -> Optional[TableEntry]:
+        """
+        Find the stored result of a position.
+
+        :param key: The Zobrist hash of the position.
+        :return: The stored result or None if the position was not found.
+        """
+        index = (key & self.mask) << 1
+        entry = self.entries[index]
+        if entry is not None and entry.key == key:
+            return entry
+        entry = self.entries[index + 1]
+        if entry is not None and entry.key == key:
+            return entry
+        return None
+
+    def store(self, key: int, depth: int, bound: Bound, score: int, move: int) -> None:
+        """
+        Store the result of searching a position.
+
+        :param key: The Zobrist hash of the position.
+        :param depth: The depth the position was searched to.
+        :param bound: Whether `score` is exact, a lower bound or an upper bound.
+        :param score: The score of the position.
+        :param move: The best move found in the position, or 0.
+        """
+        index = (key & self.mask) << 1
+        deepest = self.entries[index]
+        if deepest is not None and deepest.depth > depth and deepest.generation == self.generation:
+            index += 1
+        self.entries[index] = TableEntry(key, depth, bound, score, move, self.generation)
+
+    def hashfull(self) -> int:
+        """Get how full the table is in permille, sampled from the first 1000 slots like UCI engines do."""
+        sample = self.entries[:1000]
+        used = sum(1 for entry in sample if entry is not None and entry.generation == self.generation)
+        return used * 1000 // len(sample)
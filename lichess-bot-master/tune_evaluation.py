@@ -0,0 +1,246 @@
+"""
+Tune the piece-square tables of the evaluation on the bot's own games with Texel's tuning method.
+
+Quiet positions are taken from the PGN files in `pgn_directory` together with the results of their games. The
+middlegame and endgame tables (material included) are then fitted by gradient descent, so that a logistic function
+of the evaluation predicts the results as well as possible. A pool of processes reads the games, and the fit works on
+NumPy batches.
+
+Usage: `python tune_evaluation.py --pgn-directory game_records`. The tables are written to
+`evaluation_parameters.json`, which `evaluation.py` loads when the engine is imported.
+"""
+from __future__ import annotations
+import argparse
+import chess
+import chess.pgn
+import json
+import logging
+import multiprocessing
+import numpy as np
+import numpy.typing as npt
+import time
+from batch_evaluation import bitboards, unpack
+from build_opening_cache import pgn_files, read_file_games
+from evaluation import current_tables, game_phase, MAX_PHASE, PARAMETERS_FILE, pawn_terms, taper
+from functools import partial
+from search_board import SearchBoard
+from typing import Any, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# The score of the game for white.
+RESULTS = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+# The first plies of a game are mostly book moves and are skipped.
+SKIP_PLIES = 8
+# One weight per piece type and square, for the middlegame and for the endgame.
+FEATURES = 6 * 64
+# Positions are evaluated this many at a time, so that only one chunk is converted to floats at once.
+CHUNK_SIZE = 65536
+
+
+class Positions(NamedTuple):
+    """Quiet positions in the form used by the fit."""
+
+    features: npt.NDArray[np.int8]
+    """Shape (N, 384): +1 for each white piece on `piece_type * 64 + square` and -1 for each black piece on
+    `piece_type * 64 + 63 - square` (the square seen from black's side, as in `evaluation.PIECE_SQUARE_SCORES`)."""
+    phases: npt.NDArray[np.float64]
+    """The game phase of each position, at most `MAX_PHASE`."""
+    offsets: npt.NDArray[np.float64]
+    """The evaluation terms that are not tuned (the pawn structure) from white's point of view."""
+    results: npt.NDArray[np.float64]
+    """The result of the game of each position for white: 1, 0.5 or 0."""
+
+
+def is_quiet(board: chess.Board, move: chess.Move) -> bool:
+    """
+    Check if the static evaluation of a position can be trusted.
+
+    :param board: The position.
+    :param move: The move played in the game from this position.
+    :return: Whether the side to move isn't in check, doesn't capture or promote with the next move, and has no
+        capture that wins material.
+    """
+    if board.is_check() or board.is_capture(move) or move.promotion:
+        return False
+    search_board = SearchBoard(board)
+    return all(search_board.see(capture) <= 0 for capture in search_board.generate_moves(captures_only=True))
+
+
+def file_positions(path: str, skip_plies: int = SKIP_PLIES) -> tuple[list[list[int]], list[int], list[int], list[float]]:
+    """
+    Read the quiet positions of the finished games in a PGN file. This runs in the processes of the pool.
+
+    :param path: The PGN file.
+    :param skip_plies: How many plies at the start of each game to skip.
+    :return: The bitboards (see `batch_evaluation.bitboards`), game phase, untuned score and game result of each
+        quiet position.
+    """
+    masks: list[list[int]] = []
+    phases: list[int] = []
+    offsets: list[int] = []
+    results: list[float] = []
+    for game in read_file_games(path):
+        result = RESULTS.get(game.headers.get("Result", "*"))
+        if result is None:
+            continue
+        board = game.board()
+        for ply, move in enumerate(game.mainline_moves()):
+            if ply >= skip_plies and is_quiet(board, move):
+                phase = min(game_phase(board), MAX_PHASE)
+                masks.append(bitboards(board))
+                phases.append(phase)
+                offsets.append(taper(pawn_terms(board), phase))
+                results.append(result)
+            board.push(move)
+    return masks, phases, offsets, results
+
+
+def to_positions(masks: list[list[int]], phases: list[int], offsets: list[int], results: list[float]) -> Positions:
+    """Turn the lists from `file_positions` into the arrays of the fit."""
+    planes = unpack(masks).astype(np.int8)
+    features = planes[:, :6, :] - planes[:, 6:, ::-1]
+    return Positions(features.reshape(len(masks), FEATURES), np.array(phases, dtype=np.float64),
+                     np.array(offsets, dtype=np.float64), np.array(results, dtype=np.float64))
+
+
+def read_positions(pgn_directory: str, processes: int, skip_plies: int = SKIP_PLIES) -> Positions:
+    """Read the quiet positions of all the PGN files of a directory with a pool of processes."""
+    masks: list[list[int]] = []
+    phases: list[int] = []
+    offsets: list[int] = []
+    results: list[float] = []
+    with multiprocessing.Pool(processes) as pool:
+        for file_masks, file_phases, file_offsets, file_results in pool.imap_unordered(
+                partial(file_positions, skip_plies=skip_plies), pgn_files(pgn_directory), chunksize=16):
+            masks += file_masks
+            phases += file_phases
+            offsets += file_offsets
+            results += file_results
+    return to_positions(masks, phases, offsets, results)
+
+
+def initial_weights() -> npt.NDArray[np.float64]:
+    """Get the tables in use as weights of shape (2, 384): the middlegame weights and the endgame weights."""
+    tables = current_tables()
+    return np.array([[score for piece_type in chess.PIECE_TYPES for score in tables[piece_type][stage]]
+                     for stage in range(2)], dtype=np.float64)
+
+
+def evaluate(weights: npt.NDArray[np.float64], positions: Positions, batch: slice = slice(None)) -> npt.NDArray[np.float64]:
+    """Evaluate positions with the given weights, like `evaluation.evaluate` but without rounding."""
+    features = positions.features[batch].astype(np.float64)
+    phases = positions.phases[batch]
+    middlegame = features @ weights[0]
+    endgame = features @ weights[1]
+    scores: npt.NDArray[np.float64] = (middlegame * phases + endgame * (MAX_PHASE - phases)) / MAX_PHASE
+    return scores + positions.offsets[batch]
+
+
+def evaluate_all(weights: npt.NDArray[np.float64], positions: Positions) -> npt.NDArray[np.float64]:
+    """Evaluate all the positions chunk by chunk."""
+    return np.concatenate([evaluate(weights, positions, slice(index, index + CHUNK_SIZE))
+                           for index in range(0, len(positions.results), CHUNK_SIZE)])
+
+
+def win_probability(scores: npt.NDArray[np.float64], k: float) -> npt.NDArray[np.float64]:
+    """Turn scores into expected game results for white with the logistic function of Texel's tuning method."""
+    probability: npt.NDArray[np.float64] = 1 / (1 + 10 ** (-k * scores / 400))
+    return probability
+
+
+def error(weights: npt.NDArray[np.float64], positions: Positions, k: float) -> float:
+    """Get the mean squared difference between the expected and the real game results."""
+    return float(np.mean((positions.results - win_probability(evaluate_all(weights, positions), k)) ** 2))
+
+
+def fit_scaling(weights: npt.NDArray[np.float64], positions: Positions) -> float:
+    """Find the scaling constant of `win_probability` that fits the untuned evaluation best."""
+    scores = evaluate_all(weights, positions)
+    candidates = np.arange(0.05, 3.0, 0.05)
+    errors = [np.mean((positions.results - win_probability(scores, k)) ** 2) for k in candidates]
+    return float(candidates[int(np.argmin(errors))])
+
+
+def tune(positions: Positions, weights: npt.NDArray[np.float64], k: float, epochs: int, learning_rate: float,
+         batch_size: int) -> npt.NDArray[np.float64]:
+    """
+    Fit the weights by gradient descent with the Adam optimizer on mini-batches.
+
+    :param positions: The training positions.
+    :param weights: The starting weights from `initial_weights`.
+    :param k: The scaling constant of `win_probability`.
+    :param epochs: How many times to go through all the positions.
+    :param learning_rate: The step size in centipawns.
+    :param batch_size: The number of positions of each gradient step.
+    :return: The tuned weights.
+    """
+    weights = weights.copy()
+    first_moment = np.zeros_like(weights)
+    second_moment = np.zeros_like(weights)
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    step = 0
+    scale = k * np.log(10) / 400
+    for epoch in range(1, epochs + 1):
+        start = time.perf_counter()
+        for index in range(0, len(positions.results), batch_size):
+            batch = slice(index, index + batch_size)
+            features = positions.features[batch].astype(np.float64)
+            phases = positions.phases[batch] / MAX_PHASE
+            probability = win_probability(evaluate(weights, positions, batch), k)
+            # The derivative of the squared error by the score of each position.
+            slope = -2 * (positions.results[batch] - probability) * probability * (1 - probability) * scale
+            gradient = np.stack([features.T @ (slope * phases), features.T @ (slope * (1 - phases))]) / len(slope)
+
+            step += 1
+            first_moment = beta1 * first_moment + (1 - beta1) * gradient
+            second_moment = beta2 * second_moment + (1 - beta2) * gradient ** 2
+            corrected_first = first_moment / (1 - beta1 ** step)
+            corrected_second = second_moment / (1 - beta2 ** step)
+            weights -= learning_rate * corrected_first / (np.sqrt(corrected_second) + epsilon)
+        logger.info(f"Epoch {epoch}: error {error(weights, positions, k):.6f} ({time.perf_counter() - start:.1f}s)")
+    return weights
+
+
+def parameters(weights: npt.NDArray[np.float64]) -> dict[str, Any]:
+    """Turn the weights into the parameter file contents that `evaluation.load_tables` reads."""
+    rounded = np.rint(weights).astype(int).reshape(2, 6, 64)
+    tables = {chess.piece_name(piece_type): {"middlegame": rounded[0, piece_type - 1].tolist(),
+                                             "endgame": rounded[1, piece_type - 1].tolist()}
+              for piece_type in chess.PIECE_TYPES}
+    return {"piece_square_tables": tables}
+
+
+def main() -> None:
+    """Read the positions, tune the tables and write the parameter file."""
+    parser = argparse.ArgumentParser(description="Tune the evaluation of the homemade engine on the bot's games")
+    parser.add_argument("--pgn-directory", default="game_records", help="The directory of the bot's PGN game records.")
+    parser.add_argument("-o", "--output", default=PARAMETERS_FILE, help="The parameter file to write.")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count(),
+                        help="The number of processes that read the games.")
+    parser.add_argument("--skip-plies", type=int, default=SKIP_PLIES, help="The plies to skip at the start of each game.")
+    parser.add_argument("--epochs", type=int, default=20, help="How many times to go through all the positions.")
+    parser.add_argument("--learning-rate", type=float, default=1.0, help="The step size in centipawns.")
+    parser.add_argument("--batch-size", type=int, default=16384, help="The number of positions of each step.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    start = time.perf_counter()
+    positions = read_positions(args.pgn_directory, args.processes, args.skip_plies)
+    logger.info(f"Read {len(positions.results)} quiet positions in {time.perf_counter() - start:.1f}s.")
+    if not len(positions.results):
+        return
+
+    weights = initial_weights()
+    k = fit_scaling(weights, positions)
+    logger.info(f"Scaling constant {k:.2f}, error before tuning {error(weights, positions, k):.6f}")
+    weights = tune(positions, weights, k, args.epochs, args.learning_rate, args.batch_size)
+
+    with open(args.output, "w") as file:
+        json.dump({**parameters(weights), "positions": len(positions.results), "scaling": k,
+                   "error": error(weights, positions, k)}, file)
+    logger.info(f"Parameters written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()